@@ -0,0 +1,42 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Owner-scoped admin list queries as the tenant count grows")
+    parser.add_argument("--tenants", default="10,100,1000")
+    parser.add_argument("--recipes-per-tenant", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for tenants in [int(t) for t in args.tenants.split(",")]:
+        app = make_app()
+        with app.app_context():
+            from src.admin import owned_restaurant_ids, owned_recipe_ids
+            from src.extensions import db
+            from src.models.model import User, Restaurant, Recipes, RecipeIngredient
+
+            seed_catalog(recipes=tenants * args.recipes_per_tenant, ingredients=500, restaurants=tenants,
+                         menus=tenants, per_menu=20)
+            # one owner per restaurant
+            db.session.bulk_insert_mappings(User, [dict(id=i, username="owner-{}".format(i),
+                                                        email="owner-{}@example.com".format(i), password_hash="")
+                                                   for i in range(2, tenants + 1)])
+            db.session.execute(Restaurant.__table__.update().values(user_id=Restaurant.__table__.c.restaurant_id))
+            db.session.commit()
+
+            def list_page(user_id):
+                recipes = Recipes.query.filter(Recipes.restaurant_id.in_(owned_restaurant_ids(user_id)))
+                links = RecipeIngredient.query.filter(RecipeIngredient.recipe_id.in_(owned_recipe_ids(user_id)))
+                for query in (recipes, links):
+                    query.order_by(None).count()
+                    query.limit(20).all()
+
+            elapsed, _ = timed(lambda: [list_page(1 + i % tenants) for i in range(args.repeat)])
+        print("tenants={:<6} recipes={:<8} list page {:.2f} ms".format(
+            tenants, tenants * args.recipes_per_tenant, elapsed / args.repeat * 1000))
+
+
+if __name__ == "__main__":
+    main()
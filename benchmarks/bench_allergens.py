@@ -0,0 +1,39 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+EXCLUDE = ("peanut", "tree_nut", "gluten")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allergen exclusion filter latency")
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import Recipes
+        from src.services.allergens import bitset_index, filter_recipes, normalize
+
+        seed_catalog(recipes=args.recipes, ingredients=50, per_recipe=1)
+
+        def naive_scan():
+            excluded = set(EXCLUDE)
+            return [recipe_id for recipe_id, tags in db.session.query(Recipes.recipe_id, Recipes.allergy_tag)
+                    if not excluded.intersection(normalize(tags))]
+
+        build, _ = timed(bitset_index.ensure, db.session)
+        scan, expected = timed(naive_scan)
+        bitset, safe = timed(lambda: [bitset_index.ids(bitset_index.matching(EXCLUDE)) for _ in range(args.repeat)])
+        assert sorted(safe[0]) == sorted(expected)
+        query, count = timed(lambda: filter_recipes(Recipes.query, exclude=EXCLUDE).count())
+        assert count == len(expected)
+
+    print("recipes={} safe={} build={:.1f}ms naive_scan={:.1f}ms bitset_filter={:.2f}ms filtered_count={:.1f}ms"
+          .format(args.recipes, len(expected), build * 1000, scan * 1000, bitset / args.repeat * 1000, query * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import random
+import time
+
+from .common import make_app, seed_catalog
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin edit latency: no audit, per-commit audit, write-behind audit")
+    parser.add_argument("--edits", type=int, default=2000)
+    parser.add_argument("--recipes", type=int, default=2000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import AuditLog, Recipes
+        from src.services.audit import change_log
+
+        seed_catalog(recipes=args.recipes, ingredients=100, per_recipe=1)
+        rnd = random.Random(3)
+
+        def edits():
+            # what a Flask-Admin edit form does: load the row, change a few fields, commit
+            samples = []
+            for _ in range(args.edits):
+                recipe_id = rnd.randint(1, args.recipes)
+                started = time.perf_counter()
+                recipe = Recipes.query.get(recipe_id)
+                recipe.price = round(rnd.uniform(50, 500), 2)
+                recipe.cuisine = rnd.choice(("Indian", "Thai", "Italian"))
+                db.session.commit()
+                samples.append(time.perf_counter() - started)
+            return samples
+
+        results = []
+        # capacity 0 sends every commit's entries straight to the table: the naive per-row audit insert
+        for label, enabled, capacity in (("off", False, 0), ("per-commit", True, 0), ("write-behind", True, 10000)):
+            change_log.enabled, change_log.capacity = enabled, capacity
+            samples = edits()
+            drained = time.perf_counter()
+            change_log.drain()
+            results.append((label, samples, time.perf_counter() - drained))
+        stats = change_log.stats()
+        logged = AuditLog.query.count()
+
+    for label, samples, drain in results:
+        print("{:<13} p50 {:6.2f} ms  p95 {:6.2f} ms  mean {:6.2f} ms  drain {:6.1f} ms".format(
+            label, percentile(samples, 0.5) * 1000, percentile(samples, 0.95) * 1000,
+            sum(samples) / len(samples) * 1000, drain * 1000))
+    print("audit rows={} written={} inline={} failed={}".format(logged, stats["written"], stats["inline"],
+                                                              stats["failed"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse
+
+from .common import make_app, timed
+
+
+def per_request(app, fn, requests):
+    def run():
+        for _ in range(requests):
+            with app.test_request_context("/"):
+                fn()
+    return timed(run)[0] / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request authentication overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import User, UserSession, hash_token
+        from src.services.auth import auth_cache
+
+        user = User("bench", "secret", "bench@example.com")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        token = user.issue_token()
+        db.session.commit()
+        token_hash = hash_token(token)
+
+    def uncached_user():
+        db.session.query(User).get(user_id).username
+
+    def cached_user():
+        auth_cache.load_user(user_id).username
+
+    def uncached_token():
+        session = UserSession.query.filter_by(token_hash=token_hash).first()
+        db.session.query(User).get(session.user_id).username
+
+    def cached_token():
+        auth_cache.load_user_from_token(token).username
+
+    results = [
+        ("user_loader db", per_request(app, uncached_user, args.requests)),
+        ("user_loader cached", per_request(app, cached_user, args.requests)),
+        ("bearer token db", per_request(app, uncached_token, args.requests)),
+        ("bearer token cached", per_request(app, cached_token, args.requests)),
+    ]
+    for name, micros in results:
+        print("{:<22} {:8.1f} us/request".format(name, micros))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row admin saves vs one batched bulk edit")
+    parser.add_argument("--links", type=int, default=30, help="ingredients linked to one recipe")
+    parser.add_argument("--menu-size", type=int, default=50, help="recipes linked to one menu")
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import RecipeIngredient, MenuCardRecipes
+        from src.services.bulk_edit import set_menu_recipes, set_recipe_ingredients
+
+        seed_catalog(recipes=2000, ingredients=500, per_recipe=1, menus=2, per_menu=1)
+
+        def per_row_links(recipe_id):
+            # what one form submit per row amounts to: a flush, hooks and a commit each
+            for ingredient_id in range(100, 100 + args.links):
+                db.session.add(RecipeIngredient(recipe_id, ingredient_id, 25.0))
+                db.session.commit()
+
+        def per_row_menu(menu_id):
+            for recipe_id in range(1000, 1000 + args.menu_size):
+                db.session.add(MenuCardRecipes(menu_id, recipe_id))
+                db.session.commit()
+
+        links_rows, _ = timed(per_row_links, 1)
+        links_bulk, _ = timed(set_recipe_ingredients, 2, dict((i, 25.0) for i in range(100, 100 + args.links)))
+        menu_rows, _ = timed(per_row_menu, 1)
+        menu_bulk, _ = timed(set_menu_recipes, 2, list(range(1000, 1000 + args.menu_size)))
+
+    print("{} recipe ingredients: per-row {:.1f} ms, bulk {:.1f} ms".format(
+        args.links, links_rows * 1000, links_bulk * 1000))
+    print("{} menu recipes: per-row {:.1f} ms, bulk {:.1f} ms".format(
+        args.menu_size, menu_rows * 1000, menu_bulk * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import gc
+import subprocess
+import sys
+
+from .common import make_app, seed_catalog, timed
+from .load import ROOT
+
+
+def memory():
+    # anonymous pages are private to this process; file pages of the mapped catalog are shared between workers
+    fields = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("RssAnon", "RssFile"):
+                fields[name] = int(value.split()[0]) / 1024.0
+    return fields
+
+
+def measure(mode):
+    app = make_app(fresh=False)
+    with app.app_context():
+        from src.models.model import Ingredients, NUTRIENT_FIELDS
+        from src.services.nutrition_catalog import nutrition_catalog
+
+        gc.collect()
+        before = memory()
+        if mode == "orm":
+            elapsed, rows = timed(Ingredients.query.all)
+            lookup, _ = timed(lambda: [getattr(rows[i], f) for i in range(0, len(rows), 97) for f in NUTRIENT_FIELDS])
+        else:
+            elapsed, table = timed(lambda: nutrition_catalog.ingredients)
+            # touch every page so the mapping is resident, as it would be in a busy worker
+            float(table.values.sum())
+            lookup, _ = timed(table.rows, table.ids[::97])
+        gc.collect()
+        after = memory()
+    print("{:<8} load {:7.2f}s  lookup {:7.2f}ms  private +{:7.1f} MB  shared +{:7.1f} MB".format(
+        mode, elapsed, lookup * 1000, after["RssAnon"] - before["RssAnon"], after["RssFile"] - before["RssFile"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory of the ORM vs the mapped nutrition catalog")
+    parser.add_argument("--ingredients", type=int, default=1000000)
+    parser.add_argument("--measure", choices=("orm", "catalog"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        return measure(args.measure)
+
+    app = make_app()
+    with app.app_context():
+        seed_catalog(recipes=1, ingredients=args.ingredients, per_recipe=1)
+        from src.services.nutrition_catalog import nutrition_catalog
+        # bulk inserts skip the flush hooks, so drop any catalog left from an earlier run
+        nutrition_catalog.invalidate()
+        build, _ = timed(lambda: nutrition_catalog.ingredients)
+    print("ingredients={} catalog build {:.2f}s".format(args.ingredients, build))
+    # a cold interpreter per mode, so neither measurement inherits the other's allocations
+    for mode in ("orm", "catalog"):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_catalog", "--measure", mode], cwd=ROOT, check=True)
+
+
+if __name__ == "__main__":
+    main()
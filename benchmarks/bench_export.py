@@ -0,0 +1,69 @@
+import argparse
+import time
+import tracemalloc
+
+from .common import make_app
+
+
+def seed_ingredients(count, chunk=20000):
+    from src.extensions import db
+    from src.models.model import Ingredients, NUTRIENT_FIELDS
+
+    table = Ingredients.__table__
+    for start in range(0, count, chunk):
+        rows = [dict([("name", "Ingredient {}".format(i)), ("quantity", 100.0)] +
+                     [(f, float(i % 97)) for f in NUTRIENT_FIELDS])
+                for i in range(start, min(start + chunk, count))]
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+def login(app, client):
+    from src.extensions import db
+    from src.models.model import User
+
+    with app.app_context():
+        db.session.add(User("exporter", "secret", "exporter@example.com"))
+        db.session.commit()
+    client.post("/admin/login/", data={"username": "exporter", "password": "secret"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming admin CSV export")
+    parser.add_argument("--ingredients", type=int, default=1000000)
+    parser.add_argument("--baseline", action="store_true", help="Use Flask-Admin's materializing exporter")
+    args = parser.parse_args()
+
+    app = make_app()
+    if args.baseline:
+        from flask_admin.contrib.sqla import ModelView
+        from src.admin import IngredientsView
+        IngredientsView._export_data = ModelView._export_data
+
+    with app.app_context():
+        seed_ingredients(args.ingredients)
+    client = app.test_client()
+    login(app, client)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get("/admin/ingredients/export/csv/", buffered=False)
+    assert response.status_code == 200, response.status
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first_byte = time.perf_counter() - started
+    lines = 1
+    for chunk in chunks:
+        size += len(chunk)
+        lines += 1
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+
+    print("rows={} bytes={} first_byte={:.1f}ms total={:.2f}s peak_python_memory={:.1f} MiB".format(
+        lines - 1, size, first_byte * 1000, elapsed, peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
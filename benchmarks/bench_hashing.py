@@ -0,0 +1,35 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from .common import timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password verification throughput under concurrent logins")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--iterations", type=int, default=150000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from src.services.hashing import PasswordHasher, hash_method
+
+    pwhash = generate_password_hash("secret", hash_method(args.iterations))
+    for workers in (0, args.workers):
+        hasher = PasswordHasher(iterations=args.iterations, workers=workers)
+        hasher.check(pwhash, "secret")  # warm the pool up
+
+        with ThreadPoolExecutor(args.concurrency) as clients:
+            elapsed, _ = timed(lambda: list(clients.map(lambda _: hasher.check(pwhash, "secret"),
+                                                        range(args.logins))))
+        batched, _ = timed(hasher.check_many, [(pwhash, "secret")] * args.logins)
+        hasher.shutdown()
+        print("workers={:<3} concurrent={:7.1f} logins/s  batched={:7.1f} logins/s".format(
+            workers, args.logins / elapsed, args.logins / batched))
+
+
+if __name__ == "__main__":
+    main()
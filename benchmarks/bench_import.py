@@ -0,0 +1,67 @@
+import argparse
+import csv
+import os
+import random
+import resource
+import tempfile
+
+from .common import make_app, timed, ALLERGENS
+
+
+def write_files(directory, ingredients, recipes, per_recipe, seed=7):
+    from src.models.model import NUTRIENT_FIELDS
+
+    rnd = random.Random(seed)
+    paths = dict((kind, os.path.join(directory, kind + ".csv")) for kind in ("ingredients", "recipes", "links"))
+    with open(paths["ingredients"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(("name", "quantity") + NUTRIENT_FIELDS)
+        for i in range(ingredients):
+            writer.writerow(["Ingredient {}".format(i), 100] + [round(rnd.uniform(0, 50), 2) for _ in NUTRIENT_FIELDS])
+    with open(paths["recipes"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(("name", "restaurant", "type", "cuisine", "serving_size", "serving_unit", "allergy_tag"))
+        for i in range(recipes):
+            writer.writerow(["Recipe {}".format(i), "Bench Restaurant", "Main", "Indian", 1, "plate",
+                             "|".join(rnd.sample(ALLERGENS, rnd.randint(0, 2)))])
+    with open(paths["links"], "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(("recipe", "ingredient", "quantity"))
+        for i in range(recipes):
+            for j in rnd.sample(range(ingredients), per_recipe):
+                writer.writerow(["Recipe {}".format(i), "Ingredient {}".format(j), round(rnd.uniform(5, 200), 1)])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming catalog import throughput")
+    parser.add_argument("--ingredients", type=int, default=1000000)
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--per-recipe", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        from src.extensions import db
+        from src.models.model import User, Restaurant
+        from src.services.catalog_import import CatalogImporter
+
+        db.session.bulk_insert_mappings(User, [dict(id=1, username="bench", email="bench@example.com")])
+        db.session.bulk_insert_mappings(Restaurant, [dict(restaurant_id=1, user_id=1, name="Bench Restaurant",
+                                                          address="Street", branch="Main", city="City",
+                                                          zip_code="600001")])
+        db.session.commit()
+
+        paths = write_files(directory, args.ingredients, args.recipes, args.per_recipe)
+        importer = CatalogImporter(chunk_size=args.chunk_size)
+        for kind in ("ingredients", "recipes", "links"):
+            elapsed, count = timed(importer.run, paths[kind], kind)
+            print("{:<12} {:>9} rows {:7.2f}s {:>9.0f} rows/s".format(kind, count, elapsed, count / elapsed))
+        elapsed, _ = timed(importer.finish, True)
+        print("finish       {:7.2f}s  rejected={}".format(elapsed, importer.errors.count))
+    print("peak rss {:.1f} MiB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM cascade vs set-based restaurant delete job")
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--menus", type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import Restaurant
+        from src.services import jobs
+
+        # two restaurants of the same size; each strategy deletes one of them
+        seed_catalog(recipes=args.recipes * 2, ingredients=500, restaurants=2, menus=args.menus * 2, per_menu=30)
+
+        def cascade():
+            db.session.delete(Restaurant.query.get(1))
+            db.session.commit()
+
+        def queued():
+            jobs.enqueue("delete_restaurant", {"restaurant_id": 2})
+            db.session.commit()
+            return jobs.run_next()
+
+        orm, _ = timed(cascade)
+        enqueue_and_run, job = timed(queued)
+        assert job.status == "done", job.error
+
+    print("recipes/restaurant~{} orm_cascade={:.2f}s job={:.2f}s rows={}".format(
+        args.recipes, orm, enqueue_and_run, job.result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed, count_queries
+
+# menus page: menus + restaurants + menu_card_recipes + recipes; selectinload only adds a query
+# per SELECTIN_CHUNK keys, so the count never grows with the number of menus on the page
+MENU_PAGE_QUERIES = 4
+SELECTIN_CHUNK = 500
+
+
+def walk(client, url, key="next"):
+    pages, cursor = 0, 0
+    while cursor is not None:
+        response = client.get(url, query_string={"after": cursor, "limit": 50})
+        assert response.status_code == 200, response.data
+        cursor = response.get_json()[key]
+        pages += 1
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyset paginated menu API")
+    parser.add_argument("--menus", type=int, default=500)
+    parser.add_argument("--per-menu", type=int, default=30)
+    parser.add_argument("--recipes", type=int, default=5000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        seed_catalog(recipes=args.recipes, ingredients=200, restaurants=20, menus=args.menus, per_menu=args.per_menu)
+    client = app.test_client()
+
+    for limit in (1, 10, 100):
+        with count_queries() as statements:
+            response = client.get("/api/menu/", query_string={"limit": limit})
+        assert response.status_code == 200
+        extra_chunks = (limit + 1) * args.per_menu // SELECTIN_CHUNK
+        assert len(statements) <= MENU_PAGE_QUERIES + extra_chunks, (limit, len(statements))
+
+    with count_queries() as statements:
+        client.get("/api/menu/1/recipes", query_string={"limit": 100})
+    assert len(statements) == 1, statements
+
+    elapsed, pages = timed(walk, client, "/api/menu/")
+    print("walked {} menu pages in {:.2f}s ({:.1f} ms/page)".format(pages, elapsed, elapsed / pages * 1000))
+
+
+if __name__ == "__main__":
+    main()
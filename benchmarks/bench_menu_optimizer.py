@@ -0,0 +1,68 @@
+import argparse
+import itertools
+
+import numpy as np
+
+from .common import make_app, seed_catalog, timed
+
+QUERIES = (
+    dict(maximum={"calories": 800, "sodium": 600}, exclude=["peanut"], objective="protein"),
+    dict(maximum={"calories": 900, "price": 700}, minimum={"protein": 150}, objective="-price"),
+    dict(maximum={"total_fat": 300, "total_sugars": 250}, exclude=["dairy", "gluten"], objective="dietary_fiber"),
+    dict(maximum={"calories": 600}, objective="-sodium", min_items=2),
+)
+
+
+def brute_force(menu_id, maximum=None, minimum=None, exclude=(), objective="protein", min_items=1, max_items=3):
+    # every combination, for checking the pruned search on small menus
+    from src.services.menu_optimizer import FIELDS, menu_matrix, parse_objective
+
+    field, sense = parse_objective(objective)
+    _, values = menu_matrix(menu_id, exclude)
+    upper = np.array([(maximum or {}).get(f, np.inf) for f in FIELDS])
+    lower = np.array([(minimum or {}).get(f, -np.inf) for f in FIELDS])
+    best = None
+    for size in range(min_items, max_items + 1):
+        for combo in itertools.combinations(range(len(values)), size):
+            totals = values[list(combo)].sum(axis=0)
+            if (totals <= upper).all() and (totals >= lower).all():
+                score = sense * totals[FIELDS.index(field)]
+                best = score if best is None else max(best, score)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nutrition-constrained combo search over one large menu")
+    parser.add_argument("--recipes", type=int, default=500, help="Recipes on the menu")
+    parser.add_argument("--max-items", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--verify", action="store_true", help="Compare the best score with a brute-force search")
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.services.menu_optimizer import find_combos
+        from src.services.nutrition import recompute_recipe_nutrients
+
+        seed_catalog(recipes=args.recipes, ingredients=200, per_recipe=4, menus=1, per_menu=args.recipes)
+        recompute_recipe_nutrients()
+        # warm the allergen index so it is not charged to the first query
+        for query in QUERIES:
+            find_combos(1, max_items=args.max_items, **query)
+
+        for query in QUERIES:
+            elapsed, (combos, exhaustive, _) = timed(
+                lambda: [find_combos(1, max_items=args.max_items, **query) for _ in range(args.repeat)][-1])
+            best = combos[0]["score"] if combos else None
+            line = "{:<14} {:7.2f} ms/query  combos={} exhaustive={} best={}".format(
+                query["objective"], elapsed / args.repeat * 1000, len(combos), exhaustive, best)
+            if args.verify:
+                expected = brute_force(1, max_items=args.max_items, **query)
+                sense = -1 if query["objective"].startswith("-") else 1
+                expected = None if expected is None else round(float(expected) * sense, 4)
+                line += "  brute-force={}".format(expected)
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import random
+
+from .common import make_app, seed_catalog, timed
+
+SERVINGS = (("plate", 1.0), ("g", 250.0), ("g", 400.0), ("oz", 8.0), ("ml", 300.0), ("bowl", 2.0))
+INGREDIENT_UNITS = (("g", 100.0), ("kg", 0.1), ("ml", 100.0), ("oz", 3.5), ("cup", 0.5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lowest sodium per serving: per-request conversion vs indexed column")
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import Ingredients, Recipes, RecipeIngredient
+        from src.services.normalization import normalize_ingredients, normalize_recipes
+        from src.services.nutrition import recompute_recipe_nutrients
+        from src.services.units import grams_per_unit, is_count, to_grams
+
+        seed_catalog(recipes=args.recipes, ingredients=500, per_recipe=6)
+        rnd = random.Random(5)
+        ingredients = []
+        for i in range(1, 501):
+            unit, quantity = rnd.choice(INGREDIENT_UNITS)
+            ingredients.append(dict(ingredient_id=i, unit=unit, quantity=quantity))
+        db.session.bulk_update_mappings(Ingredients, ingredients)
+        db.session.bulk_update_mappings(Recipes, [
+            dict(recipe_id=i, serving_unit=unit, serving_size=size)
+            for i, (unit, size) in ((i, rnd.choice(SERVINGS)) for i in range(1, args.recipes + 1))])
+        db.session.commit()
+        connection = db.session.connection()
+        normalize_ingredients(connection)
+        recompute_recipe_nutrients()
+        backfill, _ = timed(normalize_recipes, connection)
+        db.session.commit()
+
+        def convert_per_request():
+            # what every request would do without the stored columns: weigh each recipe and scale in Python
+            grams = dict((i, grams_per_unit(unit, weight)) for i, unit, weight in
+                         db.session.query(Ingredients.ingredient_id, Ingredients.unit, Ingredients.unit_weight))
+            weights = {}
+            for recipe_id, ingredient_id, quantity in db.session.query(
+                    RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id, RecipeIngredient.quantity):
+                weights[recipe_id] = weights.get(recipe_id, 0.0) + (quantity or 0.0) * grams[ingredient_id]
+            ranked = []
+            for recipe_id, sodium, size, unit in db.session.query(Recipes.recipe_id, Recipes.sodium,
+                                                                  Recipes.serving_size, Recipes.serving_unit):
+                if is_count(unit):
+                    value = sodium / (size or 1.0)
+                elif weights.get(recipe_id):
+                    value = sodium * to_grams(size, unit) / weights[recipe_id]
+                else:
+                    continue
+                ranked.append((value, recipe_id))
+            return sorted(ranked)[:20]
+
+        def indexed():
+            return db.session.query(Recipes.recipe_id, Recipes.sodium_per_serving) \
+                .filter(Recipes.sodium_per_serving.isnot(None)) \
+                .order_by(Recipes.sodium_per_serving, Recipes.recipe_id).limit(20).all()
+
+        indexed()
+        python, _ = timed(lambda: [convert_per_request() for _ in range(args.repeat)])
+        column, _ = timed(lambda: [indexed() for _ in range(args.repeat)])
+
+    print("recipes={} backfill={:.2f}s per-request conversion={:.1f}ms indexed column={:.2f}ms".format(
+        args.recipes, backfill, python / args.repeat * 1000, column / args.repeat * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+
+def naive_recompute():
+    from src.extensions import db
+    from src.models.model import Recipes, NUTRIENT_FIELDS
+
+    for recipe in Recipes.query.all():
+        totals = dict.fromkeys(NUTRIENT_FIELDS, 0.0)
+        quantity = 0.0
+        for link in recipe.recipe_ingredient:
+            ingredient = link.ingredient
+            factor = link.quantity / (ingredient.quantity or 1.0)
+            for field in NUTRIENT_FIELDS:
+                totals[field] += getattr(ingredient, field) * factor
+            quantity += link.quantity
+        for field, value in totals.items():
+            setattr(recipe, field, value)
+        recipe.quantity = quantity
+    db.session.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized vs ORM-walk recipe nutrient rollup")
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--ingredients", type=int, default=2000)
+    parser.add_argument("--per-recipe", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.services.nutrition import recompute_recipe_nutrients
+
+        seed_catalog(recipes=args.recipes, ingredients=args.ingredients, per_recipe=args.per_recipe)
+
+        naive, _ = timed(naive_recompute)
+        db.session.rollback()
+        db.session.expunge_all()
+        vectorized, _ = timed(recompute_recipe_nutrients, batch_size=args.batch_size)
+        db.session.rollback()
+
+    print("recipes={} naive={:.2f}s vectorized={:.2f}s speedup={:.1f}x".format(
+        args.recipes, naive, vectorized, naive / vectorized))
+
+
+if __name__ == "__main__":
+    main()
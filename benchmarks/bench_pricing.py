@@ -0,0 +1,61 @@
+import argparse
+
+from .common import make_app, seed_catalog, timed
+
+
+def naive_reprice(restaurant_id):
+    from src.extensions import db
+    from src.models.model import MenuCard, Recipes
+
+    for recipe in Recipes.query.filter_by(restaurant_id=restaurant_id):
+        recipe.cost = sum(link.quantity * link.ingredient.unit_cost for link in recipe.recipe_ingredient)
+    for menu in MenuCard.query.filter_by(restaurant_id=restaurant_id):
+        menu.cost = sum(link.recipe.cost for link in menu.menu_card_recipes)
+        menu.price = sum(link.recipe.price for link in menu.menu_card_recipes)
+    db.session.flush()
+
+
+def edit_unit_cost(ingredient_id):
+    from src.extensions import db
+    from src.models.model import Ingredients
+
+    ingredient = Ingredients.query.get(ingredient_id)
+    ingredient.unit_cost = ingredient.unit_cost + 0.5
+    db.session.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set-based vs ORM-walk recipe and menu repricing")
+    parser.add_argument("--restaurants", type=int, default=5)
+    parser.add_argument("--recipes", type=int, default=20000)
+    parser.add_argument("--ingredients", type=int, default=2000)
+    parser.add_argument("--menus", type=int, default=200)
+    parser.add_argument("--per-menu", type=int, default=30)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.services.pricing import recompute_costs, reprice_restaurant
+
+        seed_catalog(recipes=args.recipes, ingredients=args.ingredients, restaurants=args.restaurants,
+                     menus=args.menus, per_menu=args.per_menu)
+        full, _ = timed(recompute_costs)
+        db.session.commit()
+
+        naive, _ = timed(naive_reprice, 1)
+        db.session.rollback()
+        db.session.expunge_all()
+        set_based, _ = timed(reprice_restaurant, 1)
+        db.session.rollback()
+        incremental, _ = timed(edit_unit_cost, 1)
+        db.session.rollback()
+
+    print("recipes={} full={:.3f}s".format(args.recipes, full))
+    print("one restaurant: naive={:.3f}s set-based={:.3f}s speedup={:.1f}x".format(
+        naive, set_based, naive / set_based))
+    print("one ingredient cost edit: {:.1f} ms".format(incremental * 1000))
+
+
+if __name__ == "__main__":
+    main()
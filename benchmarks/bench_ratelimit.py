@@ -0,0 +1,48 @@
+import argparse
+import time
+from collections import Counter
+
+from .common import count_queries, make_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Credential stuffing against /admin/login/ with and without limits")
+    parser.add_argument("--attempts", type=int, default=300)
+    parser.add_argument("--addresses", type=int, default=20, help="Distinct client addresses the attack uses")
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db, limiter
+        from src.models.model import User
+        from src.services.ratelimit import create_store
+
+        db.session.add(User(username="victim", password="correct horse", email="victim@example.com"))
+        db.session.commit()
+
+    client = app.test_client()
+
+    def attack():
+        statuses = Counter()
+        with count_queries() as statements:
+            started = time.perf_counter()
+            for i in range(args.attempts):
+                response = client.post("/admin/login/", data={"username": "victim", "password": "guess{}".format(i)},
+                                       environ_base={"REMOTE_ADDR": "10.0.0.{}".format(i % args.addresses + 1)})
+                statuses[response.status_code] += 1
+            elapsed = time.perf_counter() - started
+        return elapsed, statuses, len(statements)
+
+    results = []
+    for label, enabled, url in (("off", False, "memory://"), ("memory", True, "memory://"),
+                                ("local-redis", True, "local-redis://")):
+        limiter.enabled, limiter.store = enabled, create_store(url)
+        results.append((label,) + attack())
+
+    for label, elapsed, statuses, queries in results:
+        print("{:<12} {:7.1f} ms total  {:6.2f} ms/attempt  queries={:<5} statuses={}".format(
+            label, elapsed * 1000, elapsed / args.attempts * 1000, queries, dict(sorted(statuses.items()))))
+
+
+if __name__ == "__main__":
+    main()
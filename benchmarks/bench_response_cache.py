@@ -0,0 +1,79 @@
+import argparse
+import random
+import tempfile
+import time
+
+from .common import count_queries, make_app, seed_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Menu API reads: uncached, per-worker LRU, LRU + shared file tier")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--menus", type=int, default=50)
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--write-every", type=int, default=100, help="Commit a recipe price edit every N requests")
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        seed_catalog(recipes=args.recipes, ingredients=200, restaurants=5, menus=args.menus, per_menu=20)
+    client = app.test_client()
+
+    def urls(rnd):
+        menu_id = rnd.randint(1, args.menus)
+        return rnd.choice((
+            "/api/menu/{}/combos?max_price=600&max_items=3".format(menu_id),
+            "/api/menu/{}/recipes?limit=20".format(menu_id),
+            "/api/menu/recipes/ranked?by=sodium&limit=20",
+        ))
+
+    def replay(cache_enabled, cold):
+        from src.extensions import db
+        from src.models.model import Recipes
+        from src.services.response_cache import response_cache
+
+        response_cache.enabled = cache_enabled
+        response_cache.local.clear()
+        response_cache.reset()
+        rnd = random.Random(11)
+        with count_queries() as statements:
+            started = time.perf_counter()
+            for i in range(args.requests):
+                if args.write_every and i % args.write_every == args.write_every - 1:
+                    recipe = Recipes.query.get(rnd.randint(1, args.recipes))
+                    recipe.price = round(rnd.uniform(50, 500), 2)
+                    db.session.commit()
+                if cold:
+                    # a request landing on a worker that has not served this URL yet
+                    response_cache.local.clear()
+                response = client.get(urls(rnd))
+                assert response.status_code == 200, response.data
+            elapsed = time.perf_counter() - started
+        return elapsed, len(statements), response_cache.report()
+
+    results = []
+    with app.app_context():
+        from src.services.cache import FileStore
+        from src.services.response_cache import response_cache
+
+        shared = FileStore(tempfile.mkdtemp(prefix="bench_cache_"))
+        for label, enabled, store, cold in (("off", False, None, False), ("local", True, None, False),
+                                            ("local+file", True, shared, False), ("file/cold", True, shared, True)):
+            response_cache.shared = store
+            if store is not None:
+                response_cache.versions = store
+            results.append((label,) + replay(enabled, cold))
+
+    for label, elapsed, queries, report in results:
+        hits = sum(stats["local"] + stats["shared"] for _, stats in report)
+        misses = sum(stats["miss"] for _, stats in report)
+        print("{:<11} {:8.1f} ms total  {:6.3f} ms/request  queries={:<6} hit rate={:5.1f}%".format(
+            label, elapsed * 1000, elapsed / args.requests * 1000, queries, hits * 100.0 / ((hits + misses) or 1)))
+        for endpoint, stats in report:
+            print("    {:<32} local hit {:6.3f} ms  shared hit {:6.3f} ms  miss {:7.3f} ms  local={} shared={} miss={}"
+                  .format(endpoint, stats["local_ms"], stats["shared_ms"], stats["miss_ms"], stats["local"],
+                          stats["shared"], stats["miss"]))
+
+
+if __name__ == "__main__":
+    main()
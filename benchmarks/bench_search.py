@@ -0,0 +1,53 @@
+import argparse
+import random
+
+from .common import make_app, seed_catalog, timed
+
+WORDS = ("paneer", "butter", "masala", "chicken", "dosa", "tikka", "biryani", "garlic", "naan", "dal", "makhani",
+         "palak", "aloo", "gobi", "chana", "lamb", "prawn", "coconut", "curry", "tandoori", "mushroom", "egg",
+         "kofta", "korma", "vindaloo", "pulao", "idli", "sambar", "rasam", "uttapam")
+QUERIES = ("butter chicken", "masla dosa", "panee", "tandori prawn", "coconut curry", "dal makhani")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ranked recipe search vs ILIKE scan")
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from src.extensions import db
+        from src.models.model import Recipes
+        from src.services.search import indexes, search
+
+        seed_catalog(recipes=args.recipes, ingredients=50, per_recipe=1)
+        rnd = random.Random(11)
+        db.session.bulk_update_mappings(Recipes, [
+            dict(recipe_id=i, name="{} {}".format(" ".join(rnd.sample(WORDS, 3)).title(), i))
+            for i in range(1, args.recipes + 1)])
+        db.session.commit()
+
+        def ilike_scan():
+            for term in QUERIES:
+                pattern = "%{}%".format(term)
+                Recipes.query.filter(Recipes.name.ilike(pattern) | Recipes.cuisine.ilike(pattern) |
+                                     Recipes.type.ilike(pattern)).limit(20).all()
+
+        def ranked():
+            for term in QUERIES:
+                search(Recipes, term, limit=20)
+
+        build, _ = timed(indexes[Recipes].ensure, db.session)
+        scan, _ = timed(ilike_scan)
+        # warm up so the first query does not pay for statement compilation
+        ranked()
+        searched, _ = timed(lambda: [ranked() for _ in range(args.repeat)])
+
+    per_query = len(QUERIES)
+    print("recipes={} build={:.1f}ms ilike={:.2f}ms/query search={:.2f}ms/query".format(
+        args.recipes, build * 1000, scan / per_query * 1000, searched / args.repeat / per_query * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from .load import ROOT
+
+BOOT = "import time; started = time.perf_counter(); from src import create_app; create_app(); " \
+       "print(time.perf_counter() - started)"
+
+
+def boot(role, database):
+    # one cold interpreter per sample; returns (seconds to import and build the app, self time per root package)
+    env = dict(os.environ, APP_ROLE=role, DATABASE_URL=database)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", BOOT], cwd=ROOT, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    packages = Counter()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    return float(process.stdout.strip().splitlines()[-1]), packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of create_app per APP_ROLE")
+    parser.add_argument("--roles", default="all,api,admin,cli")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    # an in-memory SQLite URL keeps the driver import and any connection out of the measurement
+    database = "sqlite://"
+    for role in args.roles.split(","):
+        samples, packages = [], Counter()
+        for _ in range(args.runs):
+            seconds, imported = boot(role, database)
+            samples.append(seconds)
+            packages.update(imported)
+        print("{:<6} median {:7.1f} ms  min {:7.1f} ms".format(
+            role, statistics.median(samples) * 1000, min(samples) * 1000))
+        for name, total_us in packages.most_common(args.top):
+            print("         {:<22} {:7.1f} ms".format(name, total_us / 1000.0 / args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from .common import make_app, seed_catalog
+from .load import HttpSession, Gunicorn, run_load, save_results, format_results
+from .suite import SCALES, scenarios
+
+MODES = {
+    "sync": ["--worker-class", "sync", "--threads", "1"],
+    "gthread": ["--worker-class", "gthread"],
+    "gevent": ["--worker-class", "gevent"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Menu read concurrency per gunicorn worker class")
+    parser.add_argument("--modes", default="sync,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="simulated per-statement network wait")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    scale = SCALES["small"]
+    app = make_app()
+    with app.app_context():
+        seed_catalog(**scale)
+    _, mix = scenarios(scale, 0)
+    menu_reads = [scenario for scenario in mix if scenario[0].startswith("menu_")]
+
+    env = {"DATABASE_URL": os.environ["DATABASE_URL"], "BENCH_DB_LATENCY_MS": str(args.db_latency_ms)}
+    results = {}
+    for mode in args.modes.split(","):
+        options = ["--config", "gunicorn.conf.py", "--workers", str(args.workers)] + MODES[mode]
+        with Gunicorn(options, env=env, app="benchmarks.latency_wsgi:app") as server:
+            rows = run_load(lambda: HttpSession(server.url), [], menu_reads, args.users, args.duration)
+        for name, row in rows.items():
+            results["{}.{}".format(mode, name)] = row
+        total = sum(row["throughput_rps"] for row in rows.values())
+        print("{:<8} {:8.1f} req/s".format(mode, total))
+
+    print(format_results(results))
+    if args.output:
+        save_results(args.output, vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+
+ALLERGENS = ("peanut", "tree_nut", "gluten", "dairy", "egg", "soy", "fish", "shellfish", "sesame")
+DEFAULT_DATABASE = "sqlite:///" + os.path.join(tempfile.gettempdir(), "restaurant_bench.db")
+
+
+def make_app(fresh=True):
+    # Config reads DATABASE_URL at import time, so this has to run before `src` is imported.
+    os.environ.setdefault("DATABASE_URL", DEFAULT_DATABASE)
+    from src import create_app
+    from src.extensions import db
+
+    app = create_app()
+    if fresh:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+    return app
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+@contextmanager
+def count_queries():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+
+def seed_catalog(recipes=1000, ingredients=500, per_recipe=8, restaurants=1, menus=0, per_menu=20, seed=7):
+    from src.extensions import db
+    from src.models.model import User, Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, \
+        MenuCardRecipes, NUTRIENT_FIELDS
+
+    rnd = random.Random(seed)
+    db.session.bulk_insert_mappings(User, [dict(id=1, username="bench", email="bench@example.com",
+                                                password_hash="", admin=False)])
+    db.session.bulk_insert_mappings(Restaurant, [
+        dict(restaurant_id=i, user_id=1, name="Restaurant {}".format(i), address="Street {}".format(i),
+             branch="Main", city="City", zip_code="600001")
+        for i in range(1, restaurants + 1)])
+
+    rows = []
+    for i in range(1, ingredients + 1):
+        row = dict((f, rnd.uniform(0, 50)) for f in NUTRIENT_FIELDS)
+        row.update(ingredient_id=i, name="Ingredient {}".format(i), quantity=100.0, unit_cost=rnd.uniform(0.01, 2))
+        rows.append(row)
+    db.session.bulk_insert_mappings(Ingredients, rows)
+
+    rows, links = [], []
+    for i in range(1, recipes + 1):
+        rows.append(dict(recipe_id=i, restaurant_id=rnd.randint(1, restaurants), name="Recipe {}".format(i),
+                         type="Main", serving_size=1.0, serving_unit="plate", cuisine="Indian", price=rnd.uniform(50, 500),
+                         allergy_tag=rnd.sample(ALLERGENS, rnd.randint(0, 3))))
+        for ingredient_id in rnd.sample(range(1, ingredients + 1), per_recipe):
+            links.append(dict(recipe_id=i, ingredient_id=ingredient_id, quantity=rnd.uniform(5, 200)))
+    db.session.bulk_insert_mappings(Recipes, rows)
+    db.session.bulk_insert_mappings(RecipeIngredient, links)
+
+    by_restaurant = {}
+    for row in rows:
+        by_restaurant.setdefault(row["restaurant_id"], []).append(row["recipe_id"])
+    cards, entries = [], []
+    for i in range(1, menus + 1):
+        restaurant_id = rnd.choice(sorted(by_restaurant))
+        cards.append(dict(menu_id=i, name="Menu {}".format(i), restaurant_id=restaurant_id))
+        candidates = by_restaurant[restaurant_id]
+        for recipe_id in rnd.sample(candidates, min(per_menu, len(candidates))):
+            entries.append(dict(menu_id=i, recipe_id=recipe_id))
+    db.session.bulk_insert_mappings(MenuCard, cards)
+    db.session.bulk_insert_mappings(MenuCardRecipes, entries)
+    db.session.commit()
@@ -0,0 +1,16 @@
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from wsgi import app
+
+# Adds a fixed wait to every statement so a local SQLite database behaves like a networked
+# Postgres. time.sleep is patched under gevent, the same way psycogreen makes psycopg2 waits cooperative.
+LATENCY = float(os.environ.get("BENCH_DB_LATENCY_MS", 5)) / 1000
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def simulate_network(conn, cursor, statement, parameters, context, executemany):
+    time.sleep(LATENCY)
@@ -0,0 +1,229 @@
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    rank = max(0, int(math.ceil(pct / 100.0 * len(ordered))) - 1)
+    return ordered[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "mean_ms": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "throughput_rps": len(ordered) / elapsed if elapsed else 0.0,
+    }
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.errors[name] = self.errors.get(name, 0) + (not ok)
+
+    def results(self, elapsed):
+        return dict((name, summarize(values, self.errors[name], elapsed)) for name, values in self.latencies.items())
+
+
+class ClientSession:
+    # in-process target: one Flask test client (and cookie jar) per virtual user
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path, query=None):
+        return self.client.get(path, query_string=query).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class HttpSession:
+    # real server target; redirects are not followed so a login costs exactly one request
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), self.NoRedirect)
+
+    def open(self, path, query=None, data=None):
+        url = self.base_url + path
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(url, data=body, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+    def get(self, path, query=None):
+        return self.open(path, query)
+
+    def post(self, path, data):
+        return self.open(path, data=data)
+
+
+def run_load(make_session, setup, scenarios, users=8, duration=10.0, seed=7):
+    # Each virtual user runs `setup` once, then picks weighted scenarios until the deadline.
+    # Scenarios are (name, weight, fn(session, rnd)) and fn returns the HTTP status.
+    recorder = Recorder()
+    names = [name for name, _, _ in scenarios]
+    weights = [weight for _, weight, _ in scenarios]
+    actions = dict((name, fn) for name, _, fn in scenarios)
+
+    def call(name, fn, session, rnd):
+        started = time.perf_counter()
+        try:
+            ok = fn(session, rnd) < 400
+        except Exception:
+            ok = False
+        recorder.add(name, time.perf_counter() - started, ok)
+
+    def user(index):
+        rnd = random.Random(seed + index)
+        session = make_session()
+        for name, fn in setup:
+            call(name, fn, session, rnd)
+        while time.perf_counter() < deadline:
+            name = rnd.choices(names, weights)[0]
+            call(name, actions[name], session, rnd)
+
+    started = time.perf_counter()
+    deadline = started + duration
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return recorder.results(time.perf_counter() - started)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Gunicorn:
+    # runs gunicorn from the repo root against the already seeded database
+
+    def __init__(self, args=(), env=None, app="wsgi:app"):
+        self.port = free_port()
+        self.url = "http://127.0.0.1:{}".format(self.port)
+        self.command = [os.path.join(os.path.dirname(sys.executable), "gunicorn"), app,
+                        "--bind", "127.0.0.1:{}".format(self.port)] + list(args)
+        self.env = dict(os.environ, **(env or {}))
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=ROOT, env=self.env)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited with status {}".format(self.process.returncode))
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("gunicorn did not start listening on port {}".format(self.port))
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, meta, results):
+    document = {
+        "meta": dict(meta, revision=git_revision(), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     python=platform.python_version(), cpus=os.cpu_count()),
+        "results": results,
+    }
+    with open(path, "w") as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+    return document
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def error_rate(row):
+    return row.get("errors", 0) / float(row.get("count") or 1)
+
+
+def compare(previous, current, tolerance=0.15):
+    # returns (name, metric, before, after, change) for every metric that got worse by more than `tolerance`, and
+    # for any rise in the error rate: a failing endpoint tends to answer faster, so latency alone would hide it
+    regressions = []
+    for name, after in current["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        if error_rate(after) > error_rate(before):
+            regressions.append((name, "error_rate", error_rate(before), error_rate(after),
+                                error_rate(after) - error_rate(before)))
+        for metric, higher_is_better in (("p50_ms", False), ("p95_ms", False), ("p99_ms", False),
+                                         ("throughput_rps", True)):
+            if not before[metric]:
+                continue
+            change = (after[metric] - before[metric]) / before[metric]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append((name, metric, before[metric], after[metric], change))
+    return regressions
+
+
+def format_results(results):
+    lines = ["{:<22} {:>7} {:>6} {:>9} {:>9} {:>9} {:>9}".format(
+        "scenario", "count", "errors", "p50 ms", "p95 ms", "p99 ms", "req/s")]
+    for name in sorted(results):
+        row = results[name]
+        lines.append("{:<22} {:>7} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f}".format(
+            name, row["count"], row["errors"], row["p50_ms"], row["p95_ms"], row["p99_ms"], row["throughput_rps"]))
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import tempfile
+
+from .common import make_app, seed_catalog, timed
+from .load import ClientSession, HttpSession, Gunicorn, run_load, summarize, save_results, load_results, compare, \
+    format_results
+
+SCALES = {
+    "small": dict(restaurants=5, ingredients=500, recipes=2000, menus=50, per_menu=20),
+    "medium": dict(restaurants=50, ingredients=5000, recipes=20000, menus=500, per_menu=30),
+    "large": dict(restaurants=500, ingredients=100000, recipes=200000, menus=5000, per_menu=40),
+}
+PASSWORD = "bench-secret"
+ADMIN_LISTS = ("restaurant", "ingredients", "recipes", "menucard")
+
+
+def seed(scale, users):
+    from src.extensions import db
+    from src.models.model import User
+
+    seed_catalog(**scale)
+    db.session.add_all([User("bench-{}".format(i), PASSWORD, "bench-{}@example.com".format(i)) for i in range(users)])
+    db.session.commit()
+
+
+def scenarios(scale, users):
+    pages = max(1, scale["recipes"] // 20)
+
+    def login(session, rnd):
+        return session.post("/admin/login/", {"username": "bench-{}".format(rnd.randrange(users)),
+                                              "password": PASSWORD})
+
+    def admin_list(session, rnd):
+        view = rnd.choice(ADMIN_LISTS)
+        return session.get("/admin/{}/".format(view), {"page": rnd.randrange(min(pages, 50))})
+
+    def menu_list(session, rnd):
+        return session.get("/api/menu/", {"after": rnd.randrange(scale["menus"] or 1), "limit": 20})
+
+    def menu_recipes(session, rnd):
+        return session.get("/api/menu/{}/recipes".format(rnd.randint(1, max(1, scale["menus"]))), {"limit": 50})
+
+    def menu_snapshot(session, rnd):
+        return session.get("/api/menu/restaurant/{}/snapshot".format(rnd.randint(1, scale["restaurants"])))
+
+    setup = [("login", login)]
+    mix = [
+        ("login", 1, login),
+        ("admin_list", 3, admin_list),
+        ("menu_list", 4, menu_list),
+        ("menu_recipes", 4, menu_recipes),
+        ("menu_snapshot", 4, menu_snapshot),
+    ]
+    return setup, mix
+
+
+def import_runs(rows, runs):
+    # catalog imports are a CLI job, so they are timed in-process rather than over HTTP
+    from .bench_import import write_files
+    from src.services.catalog_import import CatalogImporter
+
+    latencies = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(directory, rows, 0, 0)
+        for _ in range(runs):
+            importer = CatalogImporter()
+            elapsed, _ = timed(importer.run, paths["ingredients"], "ingredients")
+            latencies.append(elapsed)
+    result = summarize(latencies, 0, sum(latencies))
+    result["rows_per_s"] = rows * runs / sum(latencies)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark for login, admin lists, menu reads and imports")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    for name in ("restaurants", "ingredients", "recipes", "menus", "per-menu"):
+        parser.add_argument("--" + name, type=int, help="override the scale preset")
+    parser.add_argument("--target", choices=("client", "gunicorn", "both"), default="client")
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per target")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--import-rows", type=int, default=10000)
+    parser.add_argument("--import-runs", type=int, default=5)
+    parser.add_argument("--reuse", action="store_true", help="skip seeding and use the existing database")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", metavar="PREVIOUS", help="fail if results regressed against this file")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        override = getattr(args, key)
+        if override is not None:
+            scale[key] = override
+
+    # every virtual user logs in from one address, which the login limit would soon answer with 429s; read before
+    # `src` is imported and inherited by the gunicorn workers
+    os.environ.setdefault("RATELIMIT_ENABLED", "false")
+    app = make_app(fresh=not args.reuse)
+    if not args.reuse:
+        with app.app_context():
+            seed(scale, args.users)
+    setup, mix = scenarios(scale, args.users)
+
+    results = {}
+    if args.target in ("client", "both"):
+        for name, row in run_load(lambda: ClientSession(app), setup, mix, args.users, args.duration).items():
+            results["client." + name] = row
+    if args.target in ("gunicorn", "both"):
+        options = ["--config", "gunicorn.conf.py", "--workers", str(args.workers), "--threads", str(args.threads)]
+        with Gunicorn(options, env={"DATABASE_URL": os.environ["DATABASE_URL"]}) as server:
+            for name, row in run_load(lambda: HttpSession(server.url), setup, mix, args.users, args.duration).items():
+                results["gunicorn." + name] = row
+    if args.import_runs:
+        with app.app_context():
+            results["import.ingredients"] = import_runs(args.import_rows, args.import_runs)
+
+    print(format_results(results))
+    meta = dict(vars(args), scale=scale, database=os.environ["DATABASE_URL"].split("@")[-1])
+    current = save_results(args.output, meta, results)
+    print("saved {}".format(args.output))
+
+    if args.compare:
+        regressions = compare(load_results(args.compare), current, args.tolerance)
+        for name, metric, before, after, change in regressions:
+            print("REGRESSION {} {}: {:.2f} -> {:.2f} ({:+.0%})".format(name, metric, before, after, change))
+        if regressions:
+            sys.exit(1)
+        print("no regressions beyond {:.0%}".format(args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+
+# WEB_CONCURRENCY and PORT follow the Heroku conventions used by the Procfile
+bind = "0.0.0.0:{}".format(os.environ.get("PORT", 8000))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# import the app once in the master so workers fork with it (and numpy, admin, models) already loaded
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# recycle workers to bound slow memory growth; jitter keeps them from restarting together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
+
+
+def post_fork(server, worker):
+    if server.cfg.worker_class_str == "gevent":
+        # let psycopg2 yield to the gevent hub while it waits on the server
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen/psycopg2 unavailable; database calls will block the gevent worker")
+        else:
+            patch_psycopg()
+
+    if server.cfg.preload_app:
+        from src.extensions import db
+        db.dispose_engines(server.app.wsgi())
@@ -0,0 +1,28 @@
+"""recipe_ingredient.quantity
+
+Revision ID: 427d0cfadd6d
+Revises: 8d2d10e2e16e
+Create Date: 2026-10-17 16:01:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '427d0cfadd6d'
+down_revision = '8d2d10e2e16e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # links without a quantity contribute nothing until one is entered; recipes without links keep their
+    # hand-entered nutrients (`flask recompute_nutrients` only rewrites linked recipes)
+    with op.batch_alter_table('recipe_ingredient') as batch:
+        batch.add_column(sa.Column('quantity', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('recipe_ingredient') as batch:
+        batch.drop_column('quantity')
@@ -0,0 +1,29 @@
+"""catalog_version
+
+Revision ID: 5c0f3b9d2e71
+Revises: a2dcf982cfb8
+Create Date: 2026-10-17 16:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c0f3b9d2e71'
+down_revision = 'a2dcf982cfb8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the generation stamped on the nutrition catalog files; a single row, bumped by every nutrient write
+    op.create_table('catalog_version',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('generation', sa.Integer(), server_default='0', nullable=False),
+                    sa.PrimaryKeyConstraint('id'))
+    op.execute("INSERT INTO catalog_version (id, generation) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table('catalog_version')
@@ -0,0 +1,38 @@
+"""audit log
+
+Revision ID: 86ad28c0a776
+Revises: a41038a3b12a
+Create Date: 2026-10-17 18:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '86ad28c0a776'
+down_revision = 'a41038a3b12a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # no foreign keys: the history outlives the rows and users it describes
+    op.create_table('audit_log',
+                    sa.Column('audit_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('table_name', sa.String(length=64), nullable=False),
+                    sa.Column('row_id', sa.String(length=64), nullable=False),
+                    sa.Column('action', sa.String(length=8), nullable=False),
+                    sa.Column('changes', sa.JSON(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('audit_id'))
+    # a row's history, and a user's changes newest first
+    op.create_index('ix_audit_log_table_row', 'audit_log', ['table_name', 'row_id'], unique=False)
+    op.create_index('ix_audit_log_user_audit', 'audit_log', ['user_id', 'audit_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_log_user_audit', table_name='audit_log')
+    op.drop_index('ix_audit_log_table_row', table_name='audit_log')
+    op.drop_table('audit_log')
@@ -0,0 +1,114 @@
+"""baseline schema
+
+Revision ID: 8d2d10e2e16e
+Revises:
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2d10e2e16e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+NUTRIENTS = ("calories", "total_fat", "saturated_fat", "trans_fat", "cholesterol", "sodium", "total_carbohydrate",
+             "dietary_fiber", "total_sugars", "protein", "vitamin_d", "calcium", "iron", "potassium")
+
+
+def nutrient_columns():
+    return [sa.Column(name, sa.Float(), nullable=True) for name in NUTRIENTS]
+
+
+def upgrade():
+    # the tables as `flask create_tables` made them before any later revision
+    postgres = op.get_bind().dialect.name == "postgresql"
+    op.create_table('user',
+                    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('username', sa.String(length=64), nullable=True),
+                    sa.Column('email', sa.String(length=120), nullable=True),
+                    sa.Column('password_hash', sa.String(length=128), nullable=True),
+                    sa.Column('token', sa.String(length=512), nullable=True),
+                    sa.Column('admin', sa.Boolean(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_user_email', 'user', ['email'], unique=True)
+    op.create_index('ix_user_username', 'user', ['username'], unique=True)
+    op.create_table('ingredients',
+                    sa.Column('ingredient_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.Column('quantity', sa.Float(), nullable=True),
+                    *nutrient_columns(),
+                    sa.PrimaryKeyConstraint('ingredient_id'))
+    op.create_index('ix_ingredients_name', 'ingredients', ['name'], unique=True)
+    op.create_table('restaurant',
+                    sa.Column('restaurant_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.Column('profile_image', sa.String(length=1024), nullable=True),
+                    sa.Column('address', sa.String(length=512), nullable=False),
+                    sa.Column('branch', sa.String(length=64), nullable=False),
+                    sa.Column('city', sa.String(length=64), nullable=False),
+                    sa.Column('zip_code', sa.String(length=16), nullable=False),
+                    sa.Column('landmark', sa.String(length=128), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+                    sa.PrimaryKeyConstraint('restaurant_id'))
+    op.create_index('ix_restaurant_name', 'restaurant', ['name'], unique=True)
+    op.create_table('recipes',
+                    sa.Column('recipe_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('restaurant_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.Column('image_string', sa.String(length=1024), nullable=True),
+                    sa.Column('type', sa.String(length=120), nullable=False),
+                    sa.Column('serving_size', sa.Float(), nullable=True),
+                    sa.Column('serving_unit', sa.String(length=120), nullable=False),
+                    sa.Column('cuisine', sa.String(length=120), nullable=False),
+                    sa.Column('allergy_tag', postgresql.ARRAY(sa.String()) if postgres else sa.JSON(),
+                              server_default=sa.text("'{}'" if postgres else "'[]'"), nullable=True),
+                    sa.Column('quantity', sa.Float(), nullable=True),
+                    *nutrient_columns(),
+                    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurant.restaurant_id']),
+                    sa.PrimaryKeyConstraint('recipe_id'))
+    op.create_index('ix_recipes_name', 'recipes', ['name'], unique=True)
+    op.create_index('ix_recipes_type', 'recipes', ['type'], unique=False)
+    op.create_table('menu_card',
+                    sa.Column('menu_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('name', sa.String(length=120), nullable=False),
+                    sa.Column('restaurant_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurant.restaurant_id']),
+                    sa.PrimaryKeyConstraint('menu_id'))
+    op.create_index('ix_menu_card_name', 'menu_card', ['name'], unique=True)
+    op.create_table('recipe_ingredient',
+                    sa.Column('recipe_ingredient_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('recipe_id', sa.Integer(), nullable=False),
+                    sa.Column('ingredient_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['ingredient_id'], ['ingredients.ingredient_id']),
+                    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id']),
+                    sa.PrimaryKeyConstraint('recipe_ingredient_id'))
+    op.create_table('menu_card_recipes',
+                    sa.Column('menu_recipe_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('menu_id', sa.Integer(), nullable=False),
+                    sa.Column('recipe_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['menu_id'], ['menu_card.menu_id']),
+                    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id']),
+                    sa.PrimaryKeyConstraint('menu_recipe_id'))
+
+
+def downgrade():
+    op.drop_table('menu_card_recipes')
+    op.drop_table('recipe_ingredient')
+    op.drop_index('ix_menu_card_name', table_name='menu_card')
+    op.drop_table('menu_card')
+    op.drop_index('ix_recipes_type', table_name='recipes')
+    op.drop_index('ix_recipes_name', table_name='recipes')
+    op.drop_table('recipes')
+    op.drop_index('ix_restaurant_name', table_name='restaurant')
+    op.drop_table('restaurant')
+    op.drop_index('ix_ingredients_name', table_name='ingredients')
+    op.drop_table('ingredients')
+    op.drop_index('ix_user_username', table_name='user')
+    op.drop_index('ix_user_email', table_name='user')
+    op.drop_table('user')
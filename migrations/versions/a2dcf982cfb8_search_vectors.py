@@ -0,0 +1,49 @@
+"""search_vector columns and GIN indexes (PostgreSQL 12+)
+
+Revision ID: a2dcf982cfb8
+Revises: bad4bb60571d
+Create Date: 2026-10-17 16:09:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2dcf982cfb8'
+down_revision = 'bad4bb60571d'
+branch_labels = None
+depends_on = None
+
+# (column, ts_rank weight label) per table, as models.model.SEARCH_FIELDS had them in this revision
+SEARCH_FIELDS = {
+    'recipes': (('name', 'A'), ('cuisine', 'B'), ('type', 'B')),
+    'ingredients': (('name', 'A'),),
+}
+
+
+def has_search_vector(dialect):
+    return dialect.name == "postgresql" and (dialect.server_version_info or (0,)) >= (12,)
+
+
+def upgrade():
+    # stored generated columns need PostgreSQL 12; anything older (and SQLite) keeps searching through the
+    # in-process index, which services.search picks by the same check
+    if not has_search_vector(op.get_bind().dialect):
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, fields in SEARCH_FIELDS.items():
+        vector = " || ".join("setweight(to_tsvector('simple', coalesce({}, '')), '{}')".format(column, label)
+                             for column, label in fields)
+        op.execute("ALTER TABLE {0} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({1}) STORED"
+                   .format(table, vector))
+        op.execute("CREATE INDEX IF NOT EXISTS ix_{0}_search_vector ON {0} USING gin (search_vector)".format(table))
+        op.execute("CREATE INDEX IF NOT EXISTS ix_{0}_name_trgm ON {0} USING gin (name gin_trgm_ops)".format(table))
+
+
+def downgrade():
+    if not has_search_vector(op.get_bind().dialect):
+        return
+    for table in SEARCH_FIELDS:
+        op.execute("DROP INDEX IF EXISTS ix_{}_name_trgm".format(table))
+        op.execute("DROP INDEX IF EXISTS ix_{}_search_vector".format(table))
+        op.execute("ALTER TABLE {} DROP COLUMN IF EXISTS search_vector".format(table))
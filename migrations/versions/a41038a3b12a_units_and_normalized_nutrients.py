@@ -0,0 +1,63 @@
+"""ingredient units, recipe weights, nutrients per 100 g and per serving
+
+Revision ID: a41038a3b12a
+Revises: cc83bc3bb353
+Create Date: 2026-10-17 16:13:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41038a3b12a'
+down_revision = 'cc83bc3bb353'
+branch_labels = None
+depends_on = None
+
+NUTRIENTS = ("calories", "total_fat", "saturated_fat", "trans_fat", "cholesterol", "sodium", "total_carbohydrate",
+             "dietary_fiber", "total_sugars", "protein", "vitamin_d", "calcium", "iron", "potassium")
+INDEXED_NUTRIENTS = ("calories", "total_fat", "sodium", "total_carbohydrate", "total_sugars", "protein")
+BASES = (('ingredients', ('per_100g',)), ('recipes', ('per_100g', 'per_serving')))
+
+
+def normalized_columns(table):
+    return ["{}_{}".format(field, basis) for basis in dict(BASES)[table] for field in NUTRIENTS]
+
+
+def upgrade():
+    # the new columns start out NULL; run `flask normalize_units` afterwards to fill them in
+    with op.batch_alter_table('ingredients') as batch:
+        batch.add_column(sa.Column('unit', sa.String(length=32), server_default='g', nullable=False))
+        batch.add_column(sa.Column('unit_weight', sa.Float(), nullable=True))
+        batch.add_column(sa.Column('grams_per_unit', sa.Float(), nullable=True))
+        for column in normalized_columns('ingredients'):
+            batch.add_column(sa.Column(column, sa.Float(), nullable=True))
+    with op.batch_alter_table('recipes') as batch:
+        batch.add_column(sa.Column('weight_grams', sa.Float(), nullable=True))
+        batch.add_column(sa.Column('serving_grams', sa.Float(), nullable=True))
+        for column in normalized_columns('recipes'):
+            batch.add_column(sa.Column(column, sa.Float(), nullable=True))
+    for table, bases in BASES:
+        for basis in bases:
+            for field in INDEXED_NUTRIENTS:
+                column = "{}_{}".format(field, basis)
+                op.create_index("ix_{}_{}".format(table, column), table, [column], unique=False)
+
+
+def downgrade():
+    for table, bases in BASES:
+        for basis in bases:
+            for field in INDEXED_NUTRIENTS:
+                op.drop_index("ix_{}_{}_{}".format(table, field, basis), table_name=table)
+    with op.batch_alter_table('recipes') as batch:
+        for column in normalized_columns('recipes'):
+            batch.drop_column(column)
+        batch.drop_column('serving_grams')
+        batch.drop_column('weight_grams')
+    with op.batch_alter_table('ingredients') as batch:
+        for column in normalized_columns('ingredients'):
+            batch.drop_column(column)
+        batch.drop_column('grams_per_unit')
+        batch.drop_column('unit_weight')
+        batch.drop_column('unit')
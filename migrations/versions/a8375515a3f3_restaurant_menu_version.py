@@ -0,0 +1,27 @@
+"""restaurant.menu_version
+
+Revision ID: a8375515a3f3
+Revises: d9bd0a46268e
+Create Date: 2026-10-17 16:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8375515a3f3'
+down_revision = 'd9bd0a46268e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows start at 0, which no cached snapshot or ETag can carry yet
+    with op.batch_alter_table('restaurant') as batch:
+        batch.add_column(sa.Column('menu_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('restaurant') as batch:
+        batch.drop_column('menu_version')
@@ -0,0 +1,31 @@
+"""owner scope indexes
+
+Revision ID: b07846bbd377
+Revises: 5c0f3b9d2e71
+Create Date: 2026-10-17 16:11:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b07846bbd377'
+down_revision = '5c0f3b9d2e71'
+branch_labels = None
+depends_on = None
+
+INDEXES = (('ix_restaurant_user_restaurant', 'restaurant', ['user_id', 'restaurant_id']),
+           ('ix_recipes_restaurant_recipe', 'recipes', ['restaurant_id', 'recipe_id']),
+           ('ix_menu_card_restaurant_menu', 'menu_card', ['restaurant_id', 'menu_id']),
+           ('ix_menu_card_recipes_recipe_id', 'menu_card_recipes', ['recipe_id']))
+
+
+def upgrade():
+    # the admin list views filter every table down to the current user's restaurants
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,33 @@
+"""ingredient unit cost, recipe and menu cost and price
+
+Revision ID: bad4bb60571d
+Revises: f8dca610b659
+Create Date: 2026-10-17 16:08:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bad4bb60571d'
+down_revision = 'f8dca610b659'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (('ingredients', ('unit_cost',)), ('recipes', ('price', 'cost')), ('menu_card', ('cost', 'price')))
+
+
+def upgrade():
+    # the derived costs start at 0; `flask recompute_costs` fills them in once unit costs are entered
+    for table, columns in COLUMNS:
+        with op.batch_alter_table(table) as batch:
+            for column in columns:
+                batch.add_column(sa.Column(column, sa.Float(), server_default='0', nullable=True))
+
+
+def downgrade():
+    for table, columns in reversed(COLUMNS):
+        with op.batch_alter_table(table) as batch:
+            for column in columns:
+                batch.drop_column(column)
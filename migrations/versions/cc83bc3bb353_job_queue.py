@@ -0,0 +1,43 @@
+"""job queue
+
+Revision ID: cc83bc3bb353
+Revises: b07846bbd377
+Create Date: 2026-10-17 16:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc83bc3bb353'
+down_revision = 'b07846bbd377'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+                    sa.Column('job_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('kind', sa.String(length=64), nullable=False),
+                    sa.Column('payload', sa.JSON(), nullable=False),
+                    sa.Column('status', sa.String(length=16), server_default='queued', nullable=False),
+                    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+                    sa.Column('result', sa.JSON(), nullable=True),
+                    sa.Column('error', sa.Text(), nullable=True),
+                    sa.Column('user_id', sa.Integer(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=False),
+                    sa.Column('started_at', sa.DateTime(), nullable=True),
+                    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='SET NULL'),
+                    sa.PrimaryKeyConstraint('job_id'))
+    # workers poll on (status, job_id)
+    op.create_index('ix_job_status_job', 'job', ['status', 'job_id'], unique=False)
+    op.create_index('ix_job_user_id', 'job', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_job_user_id', table_name='job')
+    op.drop_index('ix_job_status_job', table_name='job')
+    op.drop_table('job')
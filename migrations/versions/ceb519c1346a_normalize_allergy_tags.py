@@ -0,0 +1,41 @@
+"""lowercase recipes.allergy_tag, GIN index
+
+Revision ID: ceb519c1346a
+Revises: a8375515a3f3
+Create Date: 2026-10-17 16:06:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ceb519c1346a'
+down_revision = 'a8375515a3f3'
+branch_labels = None
+depends_on = None
+
+
+def normalize_tags(tags):
+    return sorted(set(t.strip().lower() for t in tags or () if t and t.strip()))
+
+
+def upgrade():
+    # the array operators behind allergen filtering compare exactly, so tags are stored trimmed and lowercased
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute("UPDATE recipes SET allergy_tag = ARRAY(SELECT DISTINCT lower(btrim(t)) FROM unnest(allergy_tag) t "
+                   "WHERE btrim(t) <> '' ORDER BY 1) WHERE allergy_tag IS NOT NULL")
+        op.create_index('ix_recipes_allergy_tag', 'recipes', ['allergy_tag'], unique=False, postgresql_using='gin')
+        return
+    recipes = sa.table('recipes', sa.column('recipe_id', sa.Integer()), sa.column('allergy_tag', sa.JSON()))
+    for recipe_id, tags in bind.execute(sa.select([recipes.c.recipe_id, recipes.c.allergy_tag])).fetchall():
+        normalized = normalize_tags(tags)
+        if tags is not None and normalized != tags:
+            bind.execute(recipes.update().where(recipes.c.recipe_id == recipe_id).values(allergy_tag=normalized))
+    op.create_index('ix_recipes_allergy_tag', 'recipes', ['allergy_tag'], unique=False)
+
+
+def downgrade():
+    # the original spelling of the tags is not kept
+    op.drop_index('ix_recipes_allergy_tag', table_name='recipes')
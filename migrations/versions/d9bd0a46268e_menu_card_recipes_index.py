@@ -0,0 +1,24 @@
+"""menu_card_recipes (menu_id, recipe_id) index
+
+Revision ID: d9bd0a46268e
+Revises: e726d36c04ab
+Create Date: 2026-10-17 16:04:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9bd0a46268e'
+down_revision = 'e726d36c04ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # serves both the menu's recipe page (seek on recipe_id within a menu) and the selectin load of the menu list
+    op.create_index('ix_menu_card_recipes_menu_recipe', 'menu_card_recipes', ['menu_id', 'recipe_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_menu_card_recipes_menu_recipe', table_name='menu_card_recipes')
@@ -0,0 +1,40 @@
+"""user_session replaces user.token
+
+Revision ID: e726d36c04ab
+Revises: ed02dbfff361
+Create Date: 2026-10-17 16:03:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e726d36c04ab'
+down_revision = 'ed02dbfff361'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_session',
+                    sa.Column('session_id', sa.Integer(), autoincrement=True, nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('token_hash', sa.String(length=64), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('expires_at', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+                    sa.PrimaryKeyConstraint('session_id'))
+    op.create_index('ix_user_session_user_id', 'user_session', ['user_id'], unique=False)
+    op.create_index('ix_user_session_token_hash', 'user_session', ['token_hash'], unique=True)
+    # the comma-joined tokens are not carried over: clients sign in again
+    with op.batch_alter_table('user') as batch:
+        batch.drop_column('token')
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch:
+        batch.add_column(sa.Column('token', sa.String(length=512), nullable=True))
+    op.drop_index('ix_user_session_token_hash', table_name='user_session')
+    op.drop_index('ix_user_session_user_id', table_name='user_session')
+    op.drop_table('user_session')
@@ -0,0 +1,27 @@
+"""recipe_ingredient recipe and ingredient indexes
+
+Revision ID: ed02dbfff361
+Revises: 427d0cfadd6d
+Create Date: 2026-10-17 16:02:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ed02dbfff361'
+down_revision = '427d0cfadd6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # incremental nutrient updates look links up by ingredient, recomputes by recipe
+    op.create_index('ix_recipe_ingredient_recipe_id', 'recipe_ingredient', ['recipe_id'], unique=False)
+    op.create_index('ix_recipe_ingredient_ingredient_id', 'recipe_ingredient', ['ingredient_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_recipe_ingredient_ingredient_id', table_name='recipe_ingredient')
+    op.drop_index('ix_recipe_ingredient_recipe_id', table_name='recipe_ingredient')
@@ -0,0 +1,32 @@
+"""unique (recipe_id, ingredient_id) on recipe_ingredient
+
+Revision ID: f8dca610b659
+Revises: ceb519c1346a
+Create Date: 2026-10-17 16:07:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8dca610b659'
+down_revision = 'ceb519c1346a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the import upserts links on this pair; existing duplicates are folded into the lowest id, quantities summed
+    op.execute("UPDATE recipe_ingredient SET quantity = (SELECT sum(coalesce(d.quantity, 0)) FROM recipe_ingredient d "
+               "WHERE d.recipe_id = recipe_ingredient.recipe_id AND d.ingredient_id = recipe_ingredient.ingredient_id) "
+               "WHERE recipe_ingredient_id IN (SELECT min(recipe_ingredient_id) FROM recipe_ingredient "
+               "GROUP BY recipe_id, ingredient_id HAVING count(*) > 1)")
+    op.execute("DELETE FROM recipe_ingredient WHERE recipe_ingredient_id NOT IN "
+               "(SELECT min(recipe_ingredient_id) FROM recipe_ingredient GROUP BY recipe_id, ingredient_id)")
+    with op.batch_alter_table('recipe_ingredient') as batch:
+        batch.create_unique_constraint('uq_recipe_ingredient', ['recipe_id', 'ingredient_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('recipe_ingredient') as batch:
+        batch.drop_constraint('uq_recipe_ingredient', type_='unique')
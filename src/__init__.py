@@ -1,44 +1,107 @@
 from flask import Flask
-from flask_admin import Admin
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from .admin import MyAdminIndexView, UserView, admin, RestaurantView, IngredientsView, RecipesView, \
-    RecipeIngredientView, MenuCardRecipesView, MenuCardView
-from .models.model import User, Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes
 from .config import Config
-from .extensions import cors, db, ma, login_manager, migrate, api
-from .models import *
+from .extensions import cors, db, ma, login_manager, hasher, profiler, limiter
 # from app_v1.routes import main
 # from app_v1.routes.main import LoginResource
 # from app_v1.routes.main import main
-from .commands import create_tables, drop_tables
-from flask_migrate import MigrateCommand
+from .services.audit import change_log
+from .services.auth import auth_cache
+from .services.nutrition_catalog import nutrition_catalog
+from .services.response_cache import response_cache
 
+ROLES = ("all", "api", "admin", "cli")
+
+
+def register_listeners():
+    # session listeners keep nutrients, costs, allergen and search indexes, menu versions, cached responses, auth
+    # caches and the audit log in step with every write, so they load for every role even though only some roles
+    # import the modules that use them; tests/test_startup.py fails when a listener module is missing here
+    from .services import nutrition, normalization, pricing, allergens, search, menu_snapshot, nutrition_catalog, \
+        response_cache, auth, audit  # noqa: F401
+
+
+def register_api(app):
+    from .controllers import api, menu  # noqa: F401
+    api.init_app(app)
+
+
+def register_admin(app):
+    from .admin import admin, UserView, RestaurantView, IngredientsView, RecipesView, RecipeIngredientView, \
+        MenuCardView, MenuCardRecipesView, JobView, AuditLogView
+    from .models.model import User, Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes, \
+        Job, AuditLog
+
+    admin.init_app(app)
+    admin.add_views(UserView(User, db.session), RestaurantView(Restaurant, db.session),
+                    IngredientsView(Ingredients, db.session), RecipesView(Recipes, db.session),
+                    RecipeIngredientView(RecipeIngredient, db.session), MenuCardView(MenuCard, db.session),
+                    MenuCardRecipesView(MenuCardRecipes, db.session), JobView(Job, db.session),
+                    AuditLogView(AuditLog, db.session))
+
+
+def register_cli(app):
+    # Flask-Migrate provides `flask db` through its flask.commands entry point once it is bound to the app
+    from flask_migrate import Migrate
+    from .commands import create_tables, drop_tables, create_indexes, recompute_nutrients, recompute_costs, \
+        normalize_units, import_catalog, worker, replay_audit
+
+    Migrate(app, db)
+    app.cli.add_command(create_tables)
+    app.cli.add_command(drop_tables)
+    app.cli.add_command(create_indexes)
+    app.cli.add_command(recompute_nutrients)
+    app.cli.add_command(recompute_costs)
+    app.cli.add_command(normalize_units)
+    app.cli.add_command(import_catalog)
+    app.cli.add_command(worker)
+    app.cli.add_command(replay_audit)
+
+
+def create_app(role=None):
+    role = role or Config.APP_ROLE
+    if role not in ROLES:
+        raise ValueError("APP_ROLE must be one of {}, got {!r}".format(", ".join(ROLES), role))
 
-def create_app():
     app = Flask(__name__)
-    app.config.from_object(config.Config)
+    app.config.from_object(Config)
+    app.config["APP_ROLE"] = role
+    hops = app.config.get("PROXY_FIX_HOPS", 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
     cors.init_app(app)
     db.init_app(app)
     ma.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app)
-    api.init_app(app)
+    auth_cache.init_app(app)
+    nutrition_catalog.init_app(app)
+    change_log.init_app(app)
+    response_cache.init_app(app)
+    hasher.init_app(app)
+    profiler.init_app(app)
+    limiter.init_app(app)
+    register_listeners()
 
     # Create user loader function
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.query(User).get(user_id)
+        return auth_cache.load_user(user_id)
 
-    admin.init_app(app)
-    admin.add_views(UserView(User, db.session), RestaurantView(Restaurant, db.session),
-                    IngredientsView(Ingredients, db.session), RecipesView(Recipes, db.session),
-                    RecipeIngredientView(RecipeIngredient, db.session), MenuCardView(MenuCard, db.session),
-                    MenuCardRecipesView(MenuCardRecipes, db.session))
+    @login_manager.request_loader
+    def load_user_from_request(request):
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            return auth_cache.load_user_from_token(token)
+        return None
+
+    if role in ("all", "api"):
+        register_api(app)
+    if role in ("all", "admin"):
+        register_admin(app)
+    if role in ("all", "cli"):
+        register_cli(app)
     #
     # app.register_blueprint(main)
 
-    app.cli.add_command(create_tables)
-    app.cli.add_command(drop_tables)
-    app.cli.add_command("db", MigrateCommand)
-
     return app
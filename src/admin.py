@@ -3,10 +3,21 @@ from flask_admin.contrib.sqla.fields import QuerySelectField
 import flask_admin as admin
 import flask_login as login
 from flask_admin.contrib.sqla import ModelView
-from flask import redirect, request, url_for
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from flask import abort, flash, redirect, request, url_for
 from flask_admin import helpers, expose, Admin
-
-from src.models.model import *
+from flask_admin.actions import action
+from flask_admin.helpers import get_redirect_target
+from flask_admin.model.template import EndpointLinkRowAction
+
+from src.models.model import db, User, Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, \
+    MenuCardRecipes, Job, AuditLog, NUTRIENT_FIELDS, NORMALIZED_BASES, normalized
+from src.extensions import hasher, profiler, limiter
+from src.services.ratelimit import form_value
+from src.services.response_cache import response_cache
+from src.services.search import search_filter
+from src.services import jobs, bulk_edit
 import re
 
 
@@ -18,6 +29,28 @@ def get_options(class_name):
     return class_name.query.filter_by(user_id=login.current_user.id).all()
 
 
+# Ownership subqueries. Each hop is an IN over an indexed foreign key, so a tenant's list page only reads
+# that tenant's rows, and none of them adds a join that could clash with Flask-Admin's own sort joins.
+def owned_restaurant_ids(user_id):
+    return select([Restaurant.restaurant_id]).where(Restaurant.user_id == user_id)
+
+
+def owned_recipe_ids(user_id):
+    return select([Recipes.recipe_id]).where(Recipes.restaurant_id.in_(owned_restaurant_ids(user_id)))
+
+
+def owned_menu_ids(user_id):
+    return select([MenuCard.menu_id]).where(MenuCard.restaurant_id.in_(owned_restaurant_ids(user_id)))
+
+
+def get_owned_recipes():
+    return Recipes.query.filter(Recipes.restaurant_id.in_(owned_restaurant_ids(login.current_user.id))).all()
+
+
+def get_owned_menus():
+    return MenuCard.query.filter(MenuCard.restaurant_id.in_(owned_restaurant_ids(login.current_user.id))).all()
+
+
 # Define login and registration forms (for flask-login)
 class LoginForm(form.Form):
     username = fields.StringField(validators=[validators.required()])
@@ -30,7 +63,7 @@ class LoginForm(form.Form):
             raise validators.ValidationError('Invalid user')
 
         # we're comparing the plaintext pw with the the hash from the db
-        if not check_password_hash(user.password_hash, password.data):
+        if not hasher.check(user.password_hash, password.data):
             # to compare plain text passwords use
             # if user.password != self.password.data:
             raise validators.ValidationError('Invalid password')
@@ -67,11 +100,124 @@ class MyUserView(ModelView):
         return login.current_user.is_authenticated
 
 
+class StreamingExportMixin(object):
+    # CSV export that streams rows from a server-side cursor instead of materializing the whole list.
+    can_export = True
+    export_types = ['csv']
+    export_batch_size = 1000
+
+    def _export_data(self):
+        view_args = self._get_list_extra_args()
+        sort_column = self._get_column_by_idx(view_args.sort)
+        if sort_column is not None:
+            sort_column = sort_column[0]
+
+        query, joins = self.get_query(), {}
+        if self._search_supported and view_args.search:
+            query, _, joins, _ = self._apply_search(query, None, joins, {}, view_args.search)
+        if view_args.filters and self._filters:
+            query, _, joins, _ = self._apply_filters(query, None, joins, {}, view_args.filters)
+        for j in self._auto_joins:
+            query = query.options(joinedload(j))
+        query, joins = self._apply_sorting(query, joins, sort_column, view_args.sort_desc)
+        if self.export_max_rows:
+            query = query.limit(self.export_max_rows)
+
+        # yield_per also turns on stream_results, i.e. a named cursor on psycopg2
+        return None, query.yield_per(self.export_batch_size)
+
+
+class FullTextSearchMixin(object):
+    # Replaces Flask-Admin's ILIKE '%term%' scan over column_searchable_list with the indexed search.
+    column_searchable_list = ("name",)
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        query = search_filter(query, self.model, search)
+        if count_query is not None:
+            count_query = search_filter(count_query, self.model, search)
+        return query, count_query, joins, count_joins
+
+
+class BulkEditMixin(object):
+    # A multi-row editor for a page of rows; all changes go out as one executemany in one transaction
+    # and derived data (nutrients, costs, menu versions) is refreshed once at the end.
+    bulk_edit_columns = ()
+    bulk_edit_page_size = 50
+    list_template = "admin/model/bulk_list.html"
+
+    def bulk_value(self, name, raw):
+        column = self.model.__table__.c[name]
+        raw = raw.strip()
+        if raw == "":
+            if not column.nullable:
+                raise ValueError("{} is required".format(name))
+            return None
+        return column.type.python_type(raw)
+
+    @expose("/bulk/", methods=("GET", "POST"))
+    def bulk_edit_view(self):
+        key = self.model.__mapper__.primary_key[0]
+        page = request.args.get("page", 0, type=int)
+        if request.method == "POST":
+            ids = set(int(name.split("-", 1)[0]) for name in request.form if name.split("-", 1)[0].isdigit())
+            # the scoped query drops ids that belong to another owner
+            rows = self.get_query().filter(key.in_(ids)).all() if ids else []
+            updates, errors = [], []
+            for row in rows:
+                row_id, changed = getattr(row, key.key), {}
+                for name in self.bulk_edit_columns:
+                    raw = request.form.get("{}-{}".format(row_id, name))
+                    if raw is None:
+                        continue
+                    try:
+                        value = self.bulk_value(name, raw)
+                    except ValueError as exc:
+                        errors.append("{} {}: {}".format(row_id, name, exc))
+                        continue
+                    if value != getattr(row, name):
+                        changed[name] = value
+                if changed:
+                    changed[key.key] = row_id
+                    updates.append(changed)
+            if not errors:
+                try:
+                    flash("Updated {} rows.".format(bulk_edit.apply_updates(self.model, updates)))
+                except bulk_edit.Conflict as exc:
+                    errors = exc.errors
+            if errors:
+                flash("Nothing saved: " + "; ".join(errors[:10]), "error")
+            return redirect(url_for(".bulk_edit_view", page=page))
+
+        rows = self.get_query().order_by(key).offset(page * self.bulk_edit_page_size) \
+            .limit(self.bulk_edit_page_size + 1).all()
+        return self.render("admin/bulk_edit.html", rows=rows[:self.bulk_edit_page_size], key=key.key,
+                           columns=self.bulk_edit_columns, page=page, more=len(rows) > self.bulk_edit_page_size,
+                           return_url=get_redirect_target() or self.get_url(".index_view"))
+
+
 class MyOwnerView(ModelView):
 
     def is_accessible(self):
         return login.current_user.is_authenticated and login.current_user.is_admin()
 
+    def owner_filter(self, user_id):
+        # criterion limiting the model to rows owned by user_id; None for shared data such as ingredients
+        return None
+
+    def scoped(self, query):
+        criterion = self.owner_filter(login.current_user.id)
+        return query if criterion is None else query.filter(criterion)
+
+    def get_query(self):
+        return self.scoped(super(MyOwnerView, self).get_query())
+
+    def get_count_query(self):
+        return self.scoped(super(MyOwnerView, self).get_count_query())
+
+    def get_one(self, id):
+        # edit, details and delete go through here, so another tenant's id behaves like a missing row
+        return self.get_query().filter(self.model.__mapper__.primary_key[0] == id).first()
+
 
 # Create customized index view class that handles login & registration
 class MyAdminIndexView(admin.AdminIndexView):
@@ -82,13 +228,20 @@ class MyAdminIndexView(admin.AdminIndexView):
             return redirect(url_for('.login_view'))
         return super(MyAdminIndexView, self).index()
 
+    # checked before the form touches the database or the password hasher
     @expose('/login/', methods=('GET', 'POST'))
+    @limiter.limit("RATELIMIT_LOGIN")
+    @limiter.limit("RATELIMIT_LOGIN_USER", form_value("username"))
     def login_view(self):
         # handle user login
         form = LoginForm(request.form)
         if helpers.validate_form_on_submit(form):
             user = form.get_user()
             if user:
+                # re-hash with the current cost parameter while we still have the plaintext
+                if hasher.needs_rehash(user.password_hash):
+                    user.password_hash = hasher.hash(form.password.data)
+                    db.session.commit()
                 login.login_user(user)
             # else:
             # return login.user_unauthorized
@@ -102,15 +255,15 @@ class MyAdminIndexView(admin.AdminIndexView):
         return super(MyAdminIndexView, self).render("admin/login.html")
 
     @expose('/register/', methods=('GET', 'POST'))
+    @limiter.limit("RATELIMIT_REGISTER")
     def register_view(self):
         form = RegistrationForm(request.form)
         if helpers.validate_form_on_submit(form):
-            user = User()
+            # we hash the users password to avoid saving it as plaintext in the db;
+            # passing it to the constructor avoids hashing the default password first
+            user = User(password=form.password.data)
 
             form.populate_obj(user)
-            # we hash the users password to avoid saving it as plaintext in the db,
-            # remove to use plain text:
-            user.password_hash = generate_password_hash(form.password.data)
 
             db.session.add(user)
             db.session.commit()
@@ -123,6 +276,19 @@ class MyAdminIndexView(admin.AdminIndexView):
         # return super(MyAdminIndexView, self).index()
         return super(MyAdminIndexView, self).render("admin/signup.html")
 
+    @expose('/perf/')
+    def perf_view(self):
+        if not login.current_user.is_authenticated:
+            return redirect(url_for('.login_view'))
+        # statements and timings across every tenant; `is_admin()` is true for restaurant owners, hence the flag
+        if not login.current_user.admin:
+            abort(403)
+        self._template_args['enabled'] = profiler.enabled
+        self._template_args['endpoints'] = profiler.report()
+        self._template_args['cache_enabled'] = response_cache.enabled
+        self._template_args['cache_endpoints'] = response_cache.report()
+        return super(MyAdminIndexView, self).render("admin/perf.html")
+
     @expose('/logout/')
     def logout_view(self):
         login.logout_user()
@@ -133,7 +299,7 @@ class UserView(MyOwnerView):
     can_create = True
     can_delete = True
     can_edit = True
-    form_excluded_columns = ("password_hash", "token")
+    form_excluded_columns = ("password_hash", "sessions")
 
     form_extra_fields = {
         'password': PasswordField('Password')
@@ -142,6 +308,9 @@ class UserView(MyOwnerView):
     form_columns = ("username", "email", "password", "admin")
     column_list = ("username", "email", "admin")
 
+    def owner_filter(self, user_id):
+        return User.id == user_id
+
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
             return redirect(url_for("admin.login_view"))
@@ -151,59 +320,188 @@ class UserView(MyOwnerView):
             User.set_password(form.password.data)
 
 
-class RestaurantView(MyOwnerView):
+class RestaurantView(BulkEditMixin, StreamingExportMixin, MyOwnerView):
     can_delete = can_create = can_edit = True
-    column_editable_list = ("user", "name", "address", "landmark")
+    # not "user": the inline editor lists every user, ignoring the owner-scoped query_factory of the form
+    column_editable_list = ("name", "address", "landmark")
+    bulk_edit_columns = ("name", "address", "landmark", "branch", "city", "zip_code")
 
     form_excluded_columns = ("recipes", "menu_card")
+    form_args = {"user": {"query_factory": get_user_options}}
+
+    def owner_filter(self, user_id):
+        return Restaurant.user_id == user_id
+
+    def queue_delete(self, model):
+        # the ORM cascade would load every recipe, menu and link into this request; queue set-based deletes instead
+        return jobs.enqueue("delete_restaurant", {"restaurant_id": model.restaurant_id}, login.current_user.id)
+
+    def delete_model(self, model):
+        job = self.queue_delete(model)
+        self.session.commit()
+        flash('Deletion of "{}" queued as job {}; see Job for progress.'.format(model.name, job.job_id))
+        # False keeps Flask-Admin from also flashing "successfully deleted" for a row that still exists
+        return False
+
+    @action("delete", "Delete", "Are you sure you want to delete selected records?")
+    def action_delete(self, ids):
+        # replaces Flask-Admin's, which counts delete_model() returning True and would report 0 deleted records
+        restaurants = self.get_query().filter(Restaurant.restaurant_id.in_(ids)).all()
+        job_ids = [self.queue_delete(restaurant).job_id for restaurant in restaurants]
+        self.session.commit()
+        flash("Deletion of {} restaurants queued as jobs {}; see Job for progress."
+              .format(len(job_ids), ", ".join(str(job_id) for job_id in job_ids)))
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
             return redirect(url_for("admin.login_view"))
 
 
-class IngredientsView(MyOwnerView):
+def normalized_columns(model):
+    # maintained by services.normalization, so never edited by hand
+    return tuple(normalized(f, basis) for basis in NORMALIZED_BASES[model] for f in NUTRIENT_FIELDS)
+
+
+class IngredientsView(FullTextSearchMixin, StreamingExportMixin, MyOwnerView):
     can_delete = can_create = can_edit = True
 
     # column_editable_list = ("user", "name", "address", "landmark")
     #
-    form_excluded_columns = ("recipe_ingredient")
+    column_exclude_list = normalized_columns(Ingredients)
+    form_excluded_columns = ("recipe_ingredient", "grams_per_unit") + normalized_columns(Ingredients)
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
             return redirect(url_for("admin.login_view"))
 
 
-class RecipesView(MyOwnerView):
+class RecipesView(BulkEditMixin, FullTextSearchMixin, StreamingExportMixin, MyOwnerView):
     can_delete = can_create = can_edit = True
+    bulk_edit_columns = ("name", "type", "cuisine", "price", "serving_size", "serving_unit")
+    column_extra_row_actions = [EndpointLinkRowAction("glyphicon glyphicon-list", ".ingredients_view",
+                                                      title="Edit ingredients")]
 
     # column_editable_list = ("user", "name", "address", "landmark")
     #
-    form_excluded_columns = ("recipe_ingredient", "menu_card_recipes")
+    column_exclude_list = normalized_columns(Recipes)
+    form_excluded_columns = ("recipe_ingredient", "menu_card_recipes", "cost", "weight_grams",
+                             "serving_grams") + normalized_columns(Recipes)
+    form_args = {"restaurant": {"query_factory": lambda: get_options(Restaurant)}}
+
+    def owner_filter(self, user_id):
+        return Recipes.restaurant_id.in_(owned_restaurant_ids(user_id))
+
+    @action("recompute", "Recompute nutrients")
+    def action_recompute(self, ids):
+        ids = [recipe_id for recipe_id, in self.get_query().with_entities(Recipes.recipe_id)
+               .filter(Recipes.recipe_id.in_(ids))]
+        job = jobs.enqueue("recompute_nutrients", {"recipe_ids": ids}, login.current_user.id)
+        self.session.commit()
+        flash("Recomputing {} recipes in the background as job {}.".format(len(ids), job.job_id))
+
+    @expose("/ingredients/", methods=("GET", "POST"))
+    def ingredients_view(self):
+        # every link of one recipe on a single form; unlinking takes the row's remove box, quantities must be positive
+        recipe = self.get_one(request.args.get("id"))
+        if recipe is None:
+            return redirect(url_for(".index_view"))
+        links = RecipeIngredient.query.filter_by(recipe_id=recipe.recipe_id).options(
+            joinedload(RecipeIngredient.ingredient)).order_by(RecipeIngredient.ingredient_id).all()
+        if request.method == "POST":
+            quantities, errors = {}, []
+            for link in links:
+                if request.form.get("remove-{}".format(link.ingredient_id)):
+                    continue
+                raw = request.form.get("quantity-{}".format(link.ingredient_id), "").strip()
+                try:
+                    quantity = float(raw)
+                except ValueError:
+                    errors.append("{}: {!r} is not a number".format(link.ingredient.name, raw))
+                    continue
+                if quantity <= 0:
+                    errors.append("{}: quantity must be positive; tick remove to unlink it".format(
+                        link.ingredient.name))
+                    continue
+                quantities[link.ingredient_id] = quantity
+            additions = []
+            for line in request.form.get("add", "").splitlines():
+                name, _, raw = line.rpartition(",")
+                if not line.strip():
+                    continue
+                try:
+                    additions.append((name.strip(), float(raw)))
+                except ValueError:
+                    errors.append("{!r}: expected 'ingredient name, quantity'".format(line))
+            ids = bulk_edit.ingredient_ids_by_name([name for name, _ in additions])
+            for name, quantity in additions:
+                if name not in ids:
+                    errors.append("unknown ingredient {!r}".format(name))
+                elif quantity <= 0:
+                    errors.append("{}: quantity must be positive".format(name))
+                else:
+                    quantities[ids[name]] = quantity
+            if errors:
+                flash("Nothing saved: " + "; ".join(errors[:10]), "error")
+            else:
+                added, changed, removed = bulk_edit.set_recipe_ingredients(recipe.recipe_id, quantities)
+                flash("Added {}, updated {}, removed {} ingredients.".format(added, changed, removed))
+            return redirect(url_for(".ingredients_view", id=recipe.recipe_id))
+        return self.render("admin/recipe_ingredients.html", recipe=recipe, links=links,
+                           return_url=self.get_url(".index_view"))
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
             return redirect(url_for("admin.login_view"))
 
 
-class RecipeIngredientView(MyOwnerView):
+class RecipeIngredientView(BulkEditMixin, MyOwnerView):
     can_delete = can_create = can_edit = True
+    bulk_edit_columns = ("quantity",)
 
     # column_editable_list = ("user", "name", "address", "landmark")
     #
     # form_excluded_columns = ("recipes", "menu_card")
+    form_args = {"recipe": {"query_factory": get_owned_recipes}}
+
+    def owner_filter(self, user_id):
+        return RecipeIngredient.recipe_id.in_(owned_recipe_ids(user_id))
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
             return redirect(url_for("admin.login_view"))
 
 
-class MenuCardView(MyOwnerView):
+class MenuCardView(BulkEditMixin, MyOwnerView):
     can_delete = can_create = can_edit = True
+    bulk_edit_columns = ("name",)
+    column_extra_row_actions = [EndpointLinkRowAction("glyphicon glyphicon-list", ".recipes_view",
+                                                      title="Choose recipes")]
 
     # column_editable_list = ("user", "name", "address", "landmark")
     #
-    form_excluded_columns = ("menu_card_recipes")
+    form_excluded_columns = ("menu_card_recipes", "cost", "price")
+    form_args = {"restaurant": {"query_factory": lambda: get_options(Restaurant)}}
+
+    def owner_filter(self, user_id):
+        return MenuCard.restaurant_id.in_(owned_restaurant_ids(user_id))
+
+    @expose("/recipes/", methods=("GET", "POST"))
+    def recipes_view(self):
+        # link any number of the restaurant's recipes to the menu in one submit
+        menu = self.get_one(request.args.get("id"))
+        if menu is None:
+            return redirect(url_for(".index_view"))
+        if request.method == "POST":
+            recipe_ids = [r for r, in db.session.query(Recipes.recipe_id).filter(
+                Recipes.restaurant_id == menu.restaurant_id,
+                Recipes.recipe_id.in_(request.form.getlist("recipe_id", type=int)))]
+            added, removed = bulk_edit.set_menu_recipes(menu.menu_id, recipe_ids)
+            flash("Added {} and removed {} recipes.".format(added, removed))
+            return redirect(url_for(".recipes_view", id=menu.menu_id))
+        recipes = Recipes.query.filter_by(restaurant_id=menu.restaurant_id).order_by(Recipes.name).all()
+        selected = set(r for r, in db.session.query(MenuCardRecipes.recipe_id).filter_by(menu_id=menu.menu_id))
+        return self.render("admin/menu_recipes.html", menu=menu, recipes=recipes, selected=selected,
+                           return_url=self.get_url(".index_view"))
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
@@ -216,6 +514,45 @@ class MenuCardRecipesView(MyOwnerView):
     # column_editable_list = ("user", "name", "address", "landmark")
     #
     # form_excluded_columns = ("recipes", "menu_card")
+    form_args = {"recipe": {"query_factory": get_owned_recipes},
+                 "menu_card": {"query_factory": get_owned_menus}}
+
+    def owner_filter(self, user_id):
+        return MenuCardRecipes.menu_id.in_(owned_menu_ids(user_id))
+
+    def _handle_view(self, name, **kwargs):
+        if not login.current_user.is_authenticated:
+            return redirect(url_for("admin.login_view"))
+
+
+class JobView(MyOwnerView):
+    # read-only status page for the background jobs this user queued
+    can_create = can_edit = can_delete = False
+    can_view_details = True
+    column_list = ("job_id", "kind", "status", "attempts", "created_at", "started_at", "heartbeat_at", "finished_at")
+    column_details_list = column_list + ("payload", "result", "error")
+    column_default_sort = ("job_id", True)
+    column_filters = ("status", "kind")
+
+    def owner_filter(self, user_id):
+        return Job.user_id == user_id
+
+    def _handle_view(self, name, **kwargs):
+        if not login.current_user.is_authenticated:
+            return redirect(url_for("admin.login_view"))
+
+
+class AuditLogView(MyOwnerView):
+    # read-only history of this user's edits, written behind the request by services.audit
+    can_create = can_edit = can_delete = False
+    can_view_details = True
+    column_list = ("audit_id", "created_at", "action", "table_name", "row_id")
+    column_details_list = column_list + ("changes",)
+    column_default_sort = ("audit_id", True)
+    column_filters = ("table_name", "action", "row_id")
+
+    def owner_filter(self, user_id):
+        return AuditLog.user_id == user_id
 
     def _handle_view(self, name, **kwargs):
         if not login.current_user.is_authenticated:
@@ -1,6 +1,20 @@
+import glob
+import json
+import os
+from datetime import datetime
+
 import click
+from sqlalchemy import inspect
+from flask import current_app
 from flask.cli import with_appcontext
 from .extensions import db
+from .services.nutrition import recompute_recipe_nutrients
+from .services.menu_snapshot import bump_menu_versions
+from .services.normalization import normalize_ingredients, normalize_recipes
+from .services.nutrition_catalog import catalog_changed
+from .services import pricing, jobs
+from .services.catalog_import import CatalogImporter
+from .models.model import AuditLog
 
 
 @click.command(name="create_tables")
@@ -13,3 +27,112 @@ def create_tables():
 @with_appcontext
 def drop_tables():
     db.drop_all()
+
+
+@click.command(name="create_indexes")
+@with_appcontext
+def create_indexes():
+    # create_tables skips tables that already exist, so indexes added to the models later are created here
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        present = set(index["name"] for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(db.engine)
+                click.echo("Created {}".format(index.name))
+
+
+@click.command(name="recompute_nutrients")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def recompute_nutrients(batch_size):
+    count = recompute_recipe_nutrients(batch_size=batch_size)
+    bump_menu_versions(db.session.connection())
+    catalog_changed(db.session)
+    db.session.commit()
+    click.echo("Recomputed nutrients for {} recipes".format(count))
+
+
+@click.command(name="recompute_costs")
+@click.option("--restaurant-id", type=int, help="Only reprice this restaurant's recipes and menus")
+@with_appcontext
+def recompute_costs(restaurant_id):
+    if restaurant_id is None:
+        pricing.recompute_costs()
+    else:
+        pricing.reprice_restaurant(restaurant_id)
+    db.session.commit()
+    click.echo("Recomputed recipe costs and menu margins")
+
+
+@click.command(name="normalize_units")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def normalize_units(batch_size):
+    # backfills the per-100g and per-serving columns, e.g. after adding them to an existing database
+    connection = db.session.connection()
+    normalize_ingredients(connection, batch_size=batch_size)
+    normalize_recipes(connection, batch_size=batch_size)
+    catalog_changed(db.session)
+    db.session.commit()
+    click.echo("Normalized ingredient and recipe nutrients")
+
+
+@click.command(name="import-catalog")
+@click.option("--ingredients", type=click.Path(exists=True, dir_okay=False), help="CSV/JSONL of ingredients")
+@click.option("--recipes", type=click.Path(exists=True, dir_okay=False), help="CSV/JSONL of recipes")
+@click.option("--links", type=click.Path(exists=True, dir_okay=False), help="CSV/JSONL of recipe ingredients")
+@click.option("--chunk-size", default=5000, show_default=True)
+@click.option("--background", is_flag=True, help="Queue the import for `flask worker` instead of running it")
+@with_appcontext
+def import_catalog(ingredients, recipes, links, chunk_size, background):
+    if background:
+        # the worker may run from another directory, so hand it absolute paths
+        paths = dict((kind, os.path.abspath(path)) for kind, path in
+                     (("ingredients", ingredients), ("recipes", recipes), ("links", links)) if path)
+        job = jobs.enqueue("import_catalog", dict(paths, chunk_size=chunk_size))
+        db.session.commit()
+        click.echo("Queued import as job {}".format(job.job_id))
+        return
+    importer = CatalogImporter(chunk_size=chunk_size, report=click.echo)
+    for path, kind in ((ingredients, "ingredients"), (recipes, "recipes"), (links, "links")):
+        if path:
+            importer.run(path, kind)
+    importer.finish(ingredients_changed=bool(ingredients))
+    if importer.errors.count:
+        click.echo("{} rows rejected:".format(importer.errors.count), err=True)
+        for message in importer.errors.samples:
+            click.echo("  " + message, err=True)
+
+
+@click.command(name="worker")
+@click.option("--once", is_flag=True, help="Exit once the queue is empty")
+@click.option("--poll-interval", type=float, help="Seconds to sleep while the queue is empty")
+@with_appcontext
+def worker(once, poll_interval):
+    poll_interval = poll_interval or current_app.config.get("JOB_POLL_INTERVAL", 1.0)
+    count = jobs.work(poll_interval=poll_interval, once=once, report=click.echo)
+    click.echo("Processed {} jobs".format(count))
+
+
+@click.command(name="replay_audit")
+@with_appcontext
+def replay_audit():
+    # loads the segments the audit writer spilled while audit_log was unreachable; each file is removed once its
+    # entries are committed, so a failed run can simply be repeated
+    directory = current_app.config.get("AUDIT_SPILL_DIR")
+    count = 0
+    for path in sorted(glob.glob(os.path.join(directory, "audit-*.jsonl"))) if directory else []:
+        with open(path, encoding="utf-8") as segment:
+            entries = [json.loads(line) for line in segment if line.strip()]
+        for entry in entries:
+            entry["created_at"] = datetime.fromisoformat(entry["created_at"])
+        if entries:
+            with db.engine.begin() as connection:
+                connection.execute(AuditLog.__table__.insert(), entries)
+        os.unlink(path)
+        count += len(entries)
+    click.echo("Replayed {} audit entries".format(count))
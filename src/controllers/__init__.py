@@ -0,0 +1,9 @@
+from flask_restx import Api
+
+api = Api()
+
+ns_um = api.namespace('User Management', description='User Management operations', path="/api/user")
+ns_menu = api.namespace('Menu Management', description='Menu read operations', path="/api/menu")
+# ns_pm = api.namespace('Product Management', description='Product Management operations', path="/api/product")
+# ns_sm = api.namespace('Sales History Management', description='Sales History Management operations', path="/api/sale")
+# ns_report = api.namespace('Bill Management', description='Bill Management operations', path="/api/bill")
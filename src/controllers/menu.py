@@ -0,0 +1,173 @@
+from flask import Response, request
+from flask_restx import Resource, reqparse
+from sqlalchemy.orm import selectinload
+
+from . import ns_menu
+from ..models.model import MenuCard, MenuCardRecipes, Recipes, NUTRIENT_FIELDS, normalized
+from ..models.schema import menu_cards_schema, recipes_schema
+from ..services.menu_snapshot import get_snapshot, formats, JSON
+from ..services.allergens import filter_recipes
+from ..services.search import search
+from ..services.menu_optimizer import FIELDS, MAX_ITEMS, find_combos
+from ..services.response_cache import response_cache
+
+MAX_PAGE_SIZE = 100
+
+page_parser = reqparse.RequestParser()
+page_parser.add_argument("after", type=int, default=0, help="Return rows with an id greater than this cursor")
+page_parser.add_argument("limit", type=int, default=20, help="Page size (max {})".format(MAX_PAGE_SIZE))
+
+menu_parser = page_parser.copy()
+menu_parser.add_argument("restaurant_id", type=int)
+
+recipe_parser = page_parser.copy()
+recipe_parser.add_argument("cuisine")
+recipe_parser.add_argument("exclude_allergens", action="split", default=[],
+                           help="Comma separated allergy tags the recipes must not carry")
+recipe_parser.add_argument("require_tags", action="split", default=[],
+                           help="Comma separated tags the recipes must all carry")
+
+
+search_parser = reqparse.RequestParser()
+search_parser.add_argument("q", required=True, help="Words to match against recipe name, cuisine and type")
+search_parser.add_argument("restaurant_id", type=int)
+search_parser.add_argument("limit", type=int, default=20, help="Page size (max {})".format(MAX_PAGE_SIZE))
+
+rank_parser = reqparse.RequestParser()
+rank_parser.add_argument("by", required=True, choices=NUTRIENT_FIELDS, help="Nutrient to sort on")
+rank_parser.add_argument("basis", default="per_serving", choices=("per_serving", "per_100g"))
+rank_parser.add_argument("order", default="asc", choices=("asc", "desc"))
+rank_parser.add_argument("menu_id", type=int)
+rank_parser.add_argument("restaurant_id", type=int)
+rank_parser.add_argument("exclude_allergens", action="split", default=[],
+                         help="Comma separated allergy tags the recipes must not carry")
+rank_parser.add_argument("limit", type=int, default=20, help="Page size (max {})".format(MAX_PAGE_SIZE))
+
+combo_parser = reqparse.RequestParser()
+combo_parser.add_argument("exclude_allergens", action="split", default=[],
+                          help="Comma separated allergy tags no recipe in the combo may carry")
+combo_parser.add_argument("objective", default="protein",
+                          help="Field to maximize, or -field to minimize (e.g. -price)")
+combo_parser.add_argument("min_items", type=int, default=1)
+combo_parser.add_argument("max_items", type=int, default=3, help="Recipes per combo (max {})".format(MAX_ITEMS))
+combo_parser.add_argument("limit", type=int, default=5, help="Number of combos (max {})".format(MAX_PAGE_SIZE))
+for field in FIELDS:
+    combo_parser.add_argument("max_" + field, type=float, help="Upper limit on the combo's total " + field)
+    combo_parser.add_argument("min_" + field, type=float, help="Lower limit on the combo's total " + field)
+
+
+def seek(query, key, args):
+    # keyset pagination: filter on the last seen id instead of using OFFSET
+    limit = max(1, min(args["limit"], MAX_PAGE_SIZE))
+    rows = query.filter(key > args["after"]).order_by(key).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+@ns_menu.route("/")
+class MenuCardList(Resource):
+
+    @ns_menu.expect(menu_parser)
+    @response_cache.cached("MenuCard:*", "MenuCardRecipes:*", "Recipes:*", "Restaurant:*", parser=menu_parser)
+    def get(self):
+        args = menu_parser.parse_args()
+        query = MenuCard.query.options(
+            selectinload(MenuCard.restaurant),
+            selectinload(MenuCard.menu_card_recipes).selectinload(MenuCardRecipes.recipe))
+        if args["restaurant_id"] is not None:
+            query = query.filter(MenuCard.restaurant_id == args["restaurant_id"])
+        menus, more = seek(query, MenuCard.menu_id, args)
+        return {"items": menu_cards_schema.dump(menus), "next": menus[-1].menu_id if more else None}
+
+
+@ns_menu.route("/<int:menu_id>/recipes")
+class MenuCardRecipeList(Resource):
+
+    @ns_menu.expect(recipe_parser)
+    @response_cache.cached("MenuCard:{menu_id}", "Recipes:*", parser=recipe_parser)
+    def get(self, menu_id):
+        args = recipe_parser.parse_args()
+        query = Recipes.query.join(MenuCardRecipes, MenuCardRecipes.recipe_id == Recipes.recipe_id) \
+            .filter(MenuCardRecipes.menu_id == menu_id)
+        if args["cuisine"]:
+            query = query.filter(Recipes.cuisine == args["cuisine"])
+        query = filter_recipes(query, exclude=args["exclude_allergens"], require=args["require_tags"])
+        recipes, more = seek(query, Recipes.recipe_id, args)
+        return {"items": recipes_schema.dump(recipes), "next": recipes[-1].recipe_id if more else None}
+
+
+@ns_menu.route("/recipes/search")
+class RecipeSearch(Resource):
+
+    @ns_menu.expect(search_parser)
+    @response_cache.cached("Recipes:*", parser=search_parser)
+    def get(self):
+        args = search_parser.parse_args()
+        query = Recipes.query
+        if args["restaurant_id"] is not None:
+            query = query.filter(Recipes.restaurant_id == args["restaurant_id"])
+        ranked = search(Recipes, args["q"], limit=max(1, min(args["limit"], MAX_PAGE_SIZE)), query=query)
+        items = recipes_schema.dump([recipe for recipe, _ in ranked])
+        for item, (_, score) in zip(items, ranked):
+            item["score"] = round(float(score), 4)
+        return {"items": items}
+
+
+@ns_menu.route("/recipes/ranked")
+class RecipeRanking(Resource):
+
+    @ns_menu.expect(rank_parser)
+    @response_cache.cached("Recipes:*", "MenuCard:*", parser=rank_parser)
+    def get(self):
+        # e.g. lowest sodium per serving; the normalized columns are stored and indexed, so this is an index scan
+        args = rank_parser.parse_args()
+        column = getattr(Recipes, normalized(args["by"], args["basis"]))
+        query = Recipes.query.filter(column.isnot(None))
+        if args["menu_id"] is not None:
+            query = query.join(MenuCardRecipes, MenuCardRecipes.recipe_id == Recipes.recipe_id) \
+                .filter(MenuCardRecipes.menu_id == args["menu_id"])
+        if args["restaurant_id"] is not None:
+            query = query.filter(Recipes.restaurant_id == args["restaurant_id"])
+        query = filter_recipes(query, exclude=args["exclude_allergens"])
+        order = column.asc() if args["order"] == "asc" else column.desc()
+        recipes = query.order_by(order, Recipes.recipe_id).limit(max(1, min(args["limit"], MAX_PAGE_SIZE))).all()
+        return {"items": recipes_schema.dump(recipes)}
+
+
+@ns_menu.route("/<int:menu_id>/combos")
+class MenuCardCombos(Resource):
+
+    @ns_menu.expect(combo_parser)
+    @response_cache.cached("MenuCard:{menu_id}", "Recipes:*", parser=combo_parser)
+    def get(self, menu_id):
+        args = combo_parser.parse_args()
+        if MenuCard.query.get(menu_id) is None:
+            ns_menu.abort(404, "Menu {} not found".format(menu_id))
+        maximum = dict((f, args["max_" + f]) for f in FIELDS if args["max_" + f] is not None)
+        minimum = dict((f, args["min_" + f]) for f in FIELDS if args["min_" + f] is not None)
+        try:
+            combos, exhaustive, unweighable = find_combos(menu_id, maximum, minimum, exclude=args["exclude_allergens"],
+                                             objective=args["objective"], min_items=args["min_items"],
+                                             max_items=args["max_items"],
+                                             top=max(1, min(args["limit"], MAX_PAGE_SIZE)))
+        except ValueError as error:
+            ns_menu.abort(400, str(error))
+        # recipes without a weighable serving have no per-serving nutrients and are not part of any combo
+        return {"items": combos, "exhaustive": exhaustive, "unweighable": unweighable}
+
+
+@ns_menu.route("/restaurant/<int:restaurant_id>/snapshot")
+class RestaurantMenuSnapshot(Resource):
+
+    @ns_menu.response(304, "Menu unchanged since the given ETag")
+    def get(self, restaurant_id):
+        mimetype = request.accept_mimetypes.best_match(formats(), default=JSON)
+        snapshot = get_snapshot(restaurant_id, mimetype, request.if_none_match)
+        if snapshot is None:
+            ns_menu.abort(404, "Restaurant {} not found".format(restaurant_id))
+        etag, body = snapshot
+
+        response = Response(status=304) if body is None else Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept")
+        return response
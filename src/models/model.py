@@ -1,26 +1,59 @@
-from hashlib import md5
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+import secrets
+from hashlib import md5, sha256
+from datetime import datetime, timedelta
 from collections import defaultdict
 import jwt
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import DDL, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import validates
+from sqlalchemy.sql.expression import ColumnElement
 
 from ..config import Config
-from ..extensions import db
+from ..extensions import db, hasher
 
 
 def generate_token(id_):
-    return jwt.encode({"user_id": id_, "last_login": datetime.now().strftime("%d-%m-%Y %H:%M:%S")},
+    # jti keeps two tokens issued within the same second distinct (token_hash is unique)
+    return jwt.encode({"user_id": id_, "last_login": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+                       "jti": secrets.token_hex(16)},
                       Config.SECRET_KEY).decode(
         "UTF_8")
 
 
+def hash_token(token):
+    return sha256(token.encode("utf-8")).hexdigest()
+
+
+def normalize_tags(tags):
+    # allergy tags are matched exactly (PostgreSQL array operators), so they are stored trimmed and lowercased
+    return sorted(set(t.strip().lower() for t in tags or () if t and t.strip()))
+
+
+class EmptyTags(ColumnElement):
+    # server default of Recipes.allergy_tag: '{}' is an empty PostgreSQL array but a JSON object on SQLite
+    pass
+
+
+@compiles(EmptyTags)
+def empty_json_list(element, compiler, **kw):
+    return "'[]'"
+
+
+@compiles(EmptyTags, "postgresql")
+def empty_array(element, compiler, **kw):
+    return "'{}'"
+
+
+NUTRIENT_FIELDS = ("calories", "total_fat", "saturated_fat", "trans_fat", "cholesterol", "sodium",
+                   "total_carbohydrate", "dietary_fiber", "total_sugars", "protein", "vitamin_d", "calcium", "iron",
+                   "potassium")
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(120), index=True, unique=True)
     password_hash = db.Column(db.String(128), default="Test@123")
-    token = db.Column(db.String(512), default="")
     admin = db.Column(db.Boolean(), default=False)
 
     @property
@@ -56,28 +89,51 @@ class User(db.Model):
             self.set_password("Test@123")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.check(self.password_hash, password)
 
     def avatar(self, size):
         digest = md5(self.email.lower().encode('utf-8')).hexdigest()
         return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(digest, size)
 
+    def issue_token(self, expires_in=None):
+        token = generate_token(self.id)
+        expires_in = expires_in or Config.TOKEN_EXPIRES_IN
+        db.session.add(UserSession(user_id=self.id, token_hash=hash_token(token),
+                                   expires_at=datetime.utcnow() + timedelta(seconds=expires_in)))
+        return token
+
     def verify_token(self, token):
-        return self.token and token in self.token.split(",")
+        return db.session.query(UserSession.query.filter(UserSession.token_hash == hash_token(token),
+                                                         UserSession.user_id == self.id,
+                                                         UserSession.expires_at > datetime.utcnow()).exists()).scalar()
 
     def remove_token(self, token):
-        tokens = self.token.split(",")
-        if token in tokens:
-            tokens.remove(token)
-            self.token = ",".join(tokens)
-            return True
-        return False
+        session = UserSession.query.filter_by(token_hash=hash_token(token), user_id=self.id).first()
+        if session is None:
+            return False
+        db.session.delete(session)
+        return True
+
+
+class UserSession(db.Model):
+    session_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True, nullable=False)
+    token_hash = db.Column(db.String(64), index=True, unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    user = db.relationship("User", backref=db.backref("sessions", cascade="all,delete"))
+
+    def __repr__(self):
+        return '<UserSession : {}>'.format(self.user_id)
 
 
 class Restaurant(db.Model):
+    # owner-scoped admin lists filter on user_id and page by restaurant_id
+    __table_args__ = (db.Index("ix_restaurant_user_restaurant", "user_id", "restaurant_id"),)
+
     restaurant_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(120), index=True, unique=True, nullable=False)
@@ -87,6 +143,7 @@ class Restaurant(db.Model):
     city = db.Column(db.String(64), nullable=False)
     zip_code = db.Column(db.String(16), nullable=False)
     landmark = db.Column(db.String(128))
+    menu_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
     user = db.relationship("User", backref=db.backref("restaurant", cascade="all,delete"))
 
     def get_owner_id(self):
@@ -114,6 +171,14 @@ class Ingredients(db.Model):
     ingredient_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(120), index=True, unique=True, nullable=False)
     quantity = db.Column(db.Float, default=0.0)
+    # cost of one unit, in the same units as RecipeIngredient.quantity
+    unit_cost = db.Column(db.Float, default=0.0, server_default="0")
+    # unit of `quantity` and of RecipeIngredient.quantity, see services.units
+    unit = db.Column(db.String(32), default="g", server_default="g", nullable=False)
+    # grams in one unit where the unit alone does not say (a piece, a cup of flour)
+    unit_weight = db.Column(db.Float)
+    # resolved from unit and unit_weight by services.normalization
+    grams_per_unit = db.Column(db.Float)
     calories = db.Column(db.Float, default=0.0)
     total_fat = db.Column(db.Float, default=0.0)
     saturated_fat = db.Column(db.Float, default=0.0)
@@ -158,25 +223,36 @@ class Ingredients(db.Model):
         self.calcium = calcium
         self.iron = iron
         self.potassium = potassium
+        self.unit_cost = kwargs.get("unit_cost", 0.0)
+        self.unit = kwargs.get("unit", "g")
+        self.unit_weight = kwargs.get("unit_weight")
 
 
 class Recipes(db.Model):
+    __table_args__ = (db.Index("ix_recipes_allergy_tag", "allergy_tag", postgresql_using="gin"),
+                      db.Index("ix_recipes_restaurant_recipe", "restaurant_id", "recipe_id"))
+
     recipe_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.restaurant_id'), nullable=False)
     name = db.Column(db.String(120), index=True, unique=True, nullable=False)
     image_string = db.Column(db.String(1024))
-    # price = db.Column(db.Float, default=0.0)
+    price = db.Column(db.Float, default=0.0, server_default="0")
+    # sum of ingredient quantity x unit cost, maintained by services.pricing
+    cost = db.Column(db.Float, default=0.0, server_default="0")
     type = db.Column(db.String(120), index=True, nullable=False)
 
     serving_size = db.Column(db.Float, default=0.0)
     serving_unit = db.Column(db.String(120), nullable=False)
     cuisine = db.Column(db.String(120), nullable=False)
     allergy_tag = db.Column(
-        db.ARRAY(db.String),
-        server_default="{}"
+        db.ARRAY(db.String).with_variant(db.JSON, "sqlite"),
+        server_default=EmptyTags()
     )
 
     quantity = db.Column(db.Float, default=0.0)
+    # total ingredient weight and the weight of one serving, maintained by services.normalization
+    weight_grams = db.Column(db.Float)
+    serving_grams = db.Column(db.Float)
     calories = db.Column(db.Float, default=0.0)
     total_fat = db.Column(db.Float, default=0.0)
     saturated_fat = db.Column(db.Float, default=0.0)
@@ -193,6 +269,14 @@ class Recipes(db.Model):
     potassium = db.Column(db.Float, default=0.0)
     restaurant = db.relationship("Restaurant", backref=db.backref("recipes", cascade="all,delete"))
 
+    @property
+    def margin(self):
+        return (self.price or 0.0) - (self.cost or 0.0)
+
+    @validates("allergy_tag")
+    def validate_allergy_tag(self, key, tags):
+        return normalize_tags(tags)
+
     def get_recipe_name(self):
         return self.name
 
@@ -226,12 +310,16 @@ class Recipes(db.Model):
         self.serving_unit = serving_unit
         self.cuisine = cuisine
         self.allergy_tag = allergy_tag
+        self.price = kwargs.get("price", 0.0)
 
 
 class RecipeIngredient(db.Model):
+    __table_args__ = (db.UniqueConstraint("recipe_id", "ingredient_id", name="uq_recipe_ingredient"),)
+
     recipe_ingredient_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), nullable=False)
-    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.ingredient_id'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), index=True, nullable=False)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.ingredient_id'), index=True, nullable=False)
+    quantity = db.Column(db.Float, default=0.0)
     # name = db.Column(db.String(120), index=True, unique=True, nullable=False)
 
     # calories = db.Column(db.Float, default=0.0)
@@ -261,12 +349,13 @@ class RecipeIngredient(db.Model):
     def __repr__(self):
         return '<RecipeIngredient : {}>'.format(self.recipe.name)
 
-    def __init__(self, recipe_id, ingredient_id,
+    def __init__(self, recipe_id, ingredient_id, quantity=0.0,
                  # calories, total_fat, saturated_fat, trans_fat, cholesterol, sodium,
                  # total_carbohydrate, dietary_fiber, total_sugars, protein, vitamin_d, calcium, iron, potassium,
                  **kwargs):
         self.recipe_id = recipe_id
         self.ingredient_id = ingredient_id
+        self.quantity = quantity
         # self.calories = calories
         # self.total_fat = total_fat
         # self.saturated_fat = saturated_fat
@@ -283,12 +372,70 @@ class RecipeIngredient(db.Model):
         # self.potassium = potassium
 
 
+# (column, ts_rank weight label) per searchable model, see services.search
+SEARCH_FIELDS = {
+    Recipes: (("name", "A"), ("cuisine", "B"), ("type", "B")),
+    Ingredients: (("name", "A"),),
+}
+
+
+def has_search_vector(dialect):
+    # stored generated columns need PostgreSQL 12; older servers and SQLite search through services.search's
+    # in-process index instead
+    return dialect.name == "postgresql" and (dialect.server_version_info or (0,)) >= (12,)
+
+
+def search_ddl(table, fields):
+    # A stored generated tsvector plus GIN indexes for it and for trigram matching on name, created with the tables;
+    # existing databases get them from migration a2dcf982cfb8. Kept out of the mapped columns so SQLite (tests,
+    # benchmarks) creates the tables unchanged.
+    vector = " || ".join("setweight(to_tsvector('simple', coalesce({}, '')), '{}')".format(column, label)
+                         for column, label in fields)
+    for statement in ("ALTER TABLE {0} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({1}) STORED",
+                      "CREATE INDEX ix_{0}_search_vector ON {0} USING gin (search_vector)",
+                      "CREATE INDEX ix_{0}_name_trgm ON {0} USING gin (name gin_trgm_ops)"):
+        event.listen(table, "after_create", DDL(statement.format(table.name, vector)).execute_if(
+            callable_=lambda ddl, target, bind, **kw: has_search_vector(bind.dialect)))
+
+
+event.listen(db.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(
+    callable_=lambda ddl, target, bind, **kw: has_search_vector(bind.dialect)))
+# loop variables are underscored so `from .model import *` (src.admin) never picks them up
+for _model, _fields in SEARCH_FIELDS.items():
+    search_ddl(_model.__table__, _fields)
+
+
+# Nutrients per 100 g and per serving, stored next to the totals and kept current on write by
+# services.normalization, so filtering and sorting on them are indexed column reads.
+NORMALIZED_BASES = {Ingredients: ("per_100g",), Recipes: ("per_100g", "per_serving")}
+INDEXED_NUTRIENTS = ("calories", "total_fat", "sodium", "total_carbohydrate", "total_sugars", "protein")
+
+
+def normalized(field, basis):
+    return "{}_{}".format(field, basis)
+
+
+for _model, _bases in NORMALIZED_BASES.items():
+    for _basis in _bases:
+        for _field in NUTRIENT_FIELDS:
+            setattr(_model, normalized(_field, _basis), db.Column(db.Float, index=_field in INDEXED_NUTRIENTS))
+
+
 class MenuCard(db.Model):
+    __table_args__ = (db.Index("ix_menu_card_restaurant_menu", "restaurant_id", "menu_id"),)
+
     menu_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(120), index=True, unique=True, nullable=False)
     restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.restaurant_id'), nullable=False)
+    # totals over the menu's recipes, maintained by services.pricing
+    cost = db.Column(db.Float, default=0.0, server_default="0")
+    price = db.Column(db.Float, default=0.0, server_default="0")
     restaurant = db.relationship("Restaurant", backref=db.backref("menu_card", cascade="all,delete"))
 
+    @property
+    def margin(self):
+        return (self.price or 0.0) - (self.cost or 0.0)
+
     # Required for administrative interface
     def __unicode__(self):
         return self.name
@@ -302,12 +449,66 @@ class MenuCard(db.Model):
 
 
 class MenuCardRecipes(db.Model):
+    __table_args__ = (db.Index("ix_menu_card_recipes_menu_recipe", "menu_id", "recipe_id"),)
+
     menu_recipe_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     menu_id = db.Column(db.Integer, db.ForeignKey('menu_card.menu_id'), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), index=True, nullable=False)
     recipe = db.relationship("Recipes", backref=db.backref("menu_card_recipes", cascade="all,delete"))
     menu_card = db.relationship("MenuCard", backref=db.backref("menu_card_recipes", cascade="all,delete"))
 
     def __init__(self, menu_id, recipe_id):
         self.menu_id = menu_id
         self.recipe_id = recipe_id
+
+
+class Job(db.Model):
+    # queued -> running -> done | failed; claimed with SELECT .. FOR UPDATE SKIP LOCKED, see services.jobs
+    __table_args__ = (db.Index("ix_job_status_job", "status", "job_id"),)
+
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(16), nullable=False, default="queued", server_default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete="SET NULL"), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    # refreshed by the running worker; a stale heartbeat, not a long run, is what makes a job claimable again
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Job : {} {} {}>'.format(self.job_id, self.kind, self.status)
+
+
+class AuditLog(db.Model):
+    # append-only change history, written in batches behind the request by services.audit
+    # no foreign keys: the history outlives the rows and users it describes
+    __table_args__ = (db.Index("ix_audit_log_table_row", "table_name", "row_id"),
+                      db.Index("ix_audit_log_user_audit", "user_id", "audit_id"))
+
+    audit_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(8), nullable=False)
+    # {column: [old, new]}; inserts have no old value, deletes no new one
+    changes = db.Column(db.JSON, nullable=False, default=dict)
+    user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return '<AuditLog : {} {} {}>'.format(self.action, self.table_name, self.row_id)
+
+
+class CatalogVersion(db.Model):
+    # a single row whose generation is bumped in the same transaction as every write to nutrient data, so the
+    # columnar files of services.nutrition_catalog can tell which commit they were built after
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+
+event.listen(CatalogVersion.__table__, "after_create",
+             DDL("INSERT INTO catalog_version (id, generation) VALUES (1, 0)"))
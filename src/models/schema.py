@@ -0,0 +1,32 @@
+from marshmallow import fields
+
+from ..extensions import ma
+from .model import NUTRIENT_FIELDS, normalized
+
+
+class RecipeSchema(ma.Schema):
+    class Meta:
+        fields = ("recipe_id", "restaurant_id", "name", "type", "cuisine", "image_string", "serving_size",
+                  "serving_unit", "price", "allergy_tag", "quantity", "weight_grams", "serving_grams") + \
+            NUTRIENT_FIELDS + tuple(normalized(f, "per_serving") for f in NUTRIENT_FIELDS)
+        ordered = True
+
+
+class MenuCardSchema(ma.Schema):
+    menu_id = fields.Integer()
+    name = fields.String()
+    restaurant_id = fields.Integer()
+    restaurant = fields.Function(lambda menu: menu.restaurant.name)
+    recipes = fields.Method("get_recipes")
+
+    class Meta:
+        ordered = True
+
+    def get_recipes(self, menu):
+        recipes = sorted((link.recipe for link in menu.menu_card_recipes), key=lambda recipe: recipe.recipe_id)
+        return recipes_schema.dump(recipes)
+
+
+recipe_schema = RecipeSchema()
+recipes_schema = RecipeSchema(many=True)
+menu_cards_schema = MenuCardSchema(many=True)
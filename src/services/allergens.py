@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+from sqlalchemy import event, cast, text
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Recipes, normalize_tags as normalize
+
+
+class AllergenBitsetIndex:
+    # allergen -> bitmap over recipe row positions, used where the database has no array operators (SQLite)
+
+    def __init__(self):
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.bitmaps = {}
+        self.all_rows = 0
+        self.stale = True
+        # bumped by every invalidation, so one landing while a build is reading is not lost
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self.generation += 1
+        self.stale = True
+
+    def build(self, rows, generation=None):
+        recipe_ids, positions = [], {}
+        for position, (recipe_id, tags) in enumerate(sorted(rows)):
+            recipe_ids.append(recipe_id)
+            for tag in normalize(tags):
+                positions.setdefault(tag, []).append(position)
+        self.recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        self.bitmaps = dict((tag, self.bitmap(tagged)) for tag, tagged in positions.items())
+        self.all_rows = (1 << len(recipe_ids)) - 1
+        self.stale = generation is not None and generation != self.generation
+
+    def bitmap(self, positions):
+        flags = np.zeros(len(self.recipe_ids), dtype=np.uint8)
+        flags[positions] = 1
+        return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+    def ensure(self, session):
+        if self.stale:
+            with self._lock:
+                if self.stale:
+                    generation = self.generation
+                    self.build(session.query(Recipes.recipe_id, Recipes.allergy_tag).all(), generation)
+        return self
+
+    def matching(self, exclude=(), require=()):
+        bits = self.all_rows
+        for tag in normalize(exclude):
+            bits &= ~self.bitmaps.get(tag, 0)
+        for tag in normalize(require):
+            bits &= self.bitmaps.get(tag, 0)
+        return bits
+
+    def ids(self, bits):
+        raw = np.frombuffer(bits.to_bytes((len(self.recipe_ids) + 7) // 8, "little"), dtype=np.uint8)
+        positions = np.flatnonzero(np.unpackbits(raw, bitorder="little"))
+        return self.recipe_ids[positions].tolist()
+
+
+bitset_index = AllergenBitsetIndex()
+
+
+def _id_filter(ids, negate):
+    # ids come from our own integer index, so they are safe to inline; this sidesteps the
+    # bound parameter limit of SQLite for very large id lists
+    if not ids:
+        return text("1 = 1") if negate else text("1 = 0")
+    clause = "{}.recipe_id {}IN ({})".format(Recipes.__tablename__, "NOT " if negate else "",
+                                            ",".join(str(int(i)) for i in ids))
+    return text(clause)
+
+
+def filter_recipes(query, exclude=(), require=()):
+    exclude, require = normalize(exclude), normalize(require)
+    if not exclude and not require:
+        return query
+    session = query.session
+    if session.get_bind(Recipes.__mapper__).dialect.name == "postgresql":
+        # both operators are served by the GIN index on recipes.allergy_tag; tags are stored lowercased
+        tags = Recipes.allergy_tag
+        if exclude:
+            query = query.filter(~tags.op("&&")(cast(array(exclude), ARRAY(db.String))))
+        if require:
+            query = query.filter(tags.op("@>")(cast(array(require), ARRAY(db.String))))
+        return query
+
+    index = bitset_index.ensure(session)
+    bits = index.matching(exclude, require)
+    # inline whichever side of the split is smaller
+    if bin(bits).count("1") * 2 <= len(index.recipe_ids):
+        return query.filter(_id_filter(index.ids(bits), negate=False))
+    return query.filter(_id_filter(index.ids(index.all_rows & ~bits), negate=True))
+
+
+@event.listens_for(Session, "after_flush")
+def track_allergen_changes(session, flush_context):
+    changed = [o for o in list(session.new) + list(session.deleted) if isinstance(o, Recipes)] + \
+              [o for o in session.dirty if isinstance(o, Recipes) and get_history(o, "allergy_tag").has_changes()]
+    if changed:
+        session.info["allergens_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_allergen_index(session):
+    if session.info.pop("allergens_changed", False):
+        bitset_index.invalidate()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_allergen_changes(session, previous_transaction):
+    session.info.pop("allergens_changed", None)
@@ -0,0 +1,348 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models.model import AuditLog, UserSession
+
+# sessions churn on every login and carry token hashes; the log itself is never logged
+SKIPPED = (AuditLog, UserSession)
+# changes to these are recorded without their values
+REDACTED = frozenset(("password_hash", "token_hash"))
+
+
+def plain(value):
+    # JSON-safe copy of a column value
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (list, tuple, set)):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return dict((str(k), plain(v)) for k, v in value.items())
+    return str(value)
+
+
+def entry(table_name, row_id, action, changes, user_id=None):
+    return dict(table_name=table_name, row_id=str(row_id), action=action, changes=changes, user_id=user_id,
+                created_at=datetime.utcnow())
+
+
+def diff(obj, action):
+    # {column: [old, new]} from the attribute history, which after_flush still sees
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if action == "update":
+            history = state.attrs[key].history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        elif key not in state.dict:
+            continue
+        else:
+            old, new = (None, state.dict[key]) if action == "insert" else (state.dict[key], None)
+        changes[key] = ["***", "***"] if key in REDACTED else [plain(old), plain(new)]
+    row_id = ",".join(str(v) for v in state.mapper.primary_key_from_instance(obj))
+    return state.mapper.local_table.name, row_id, changes
+
+
+def acting_user():
+    if has_request_context() and current_user and current_user.is_authenticated:
+        return current_user.get_id()
+    return None
+
+
+class DatabaseSink:
+    # one executemany INSERT per batch, on its own connection so it never joins a request's transaction
+
+    def __init__(self, app):
+        self.app = app
+
+    def write(self, entries):
+        with db.get_engine(self.app).begin() as connection:
+            connection.execute(AuditLog.__table__.insert(), entries)
+
+    def close(self):
+        pass
+
+
+class SegmentSink:
+    # JSON lines appended to the current segment; a full segment is closed and never touched again
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.handle = None
+        self.sequence = 0
+
+    def rotate(self):
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.sequence += 1
+        name = "audit-{:%Y%m%dT%H%M%S}-{}-{}.jsonl".format(datetime.utcnow(), os.getpid(), self.sequence)
+        self.handle = open(os.path.join(self.directory, name), "a", encoding="utf-8")
+
+    def write(self, entries):
+        if self.handle is None or self.handle.tell() >= self.max_bytes:
+            self.rotate()
+        self.handle.write("".join(json.dumps(e, default=plain) + "\n" for e in entries))
+        self.handle.flush()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+class ChangeLog:
+    # Write-behind audit trail. Commits hand their diffs to a bounded in-memory buffer and return; a daemon
+    # thread drains it in batches of `batch_size`, at the latest `interval` seconds after the first entry.
+    # When the buffer stays full for `block` seconds the committing thread writes its own entries, so a slow
+    # sink turns into request latency (backpressure) instead of unbounded memory. A batch the sink still rejects
+    # after `retries` attempts is appended to a local spill segment (`flask replay_audit` loads it later); only
+    # when that fails too are entries lost, and counted in `failed`.
+
+    def __init__(self):
+        self.enabled = False
+        self.capacity = 10000
+        self.batch_size = 500
+        self.interval = 1.0
+        self.block = 0.5
+        self.retries = 2
+        self.sink = None
+        self.spill = None
+        self.app = None
+        self.written = self.inline = self.spilled = self.failed = 0
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closing = self._draining = self._busy = False
+        self._exit_hook = False
+
+    def init_app(self, app):
+        self.close()
+        self.enabled = app.config.get("AUDIT_ENABLED", False)
+        self.capacity = app.config.get("AUDIT_CAPACITY", self.capacity)
+        self.batch_size = app.config.get("AUDIT_BATCH_SIZE", self.batch_size)
+        self.interval = app.config.get("AUDIT_FLUSH_INTERVAL", self.interval)
+        self.block = app.config.get("AUDIT_BLOCK_SECONDS", self.block)
+        self.retries = app.config.get("AUDIT_RETRIES", self.retries)
+        self.app = app
+        directory = app.config.get("AUDIT_SEGMENT_DIR")
+        segment_bytes = app.config.get("AUDIT_SEGMENT_BYTES", 64 * 1024 * 1024)
+        self.sink = SegmentSink(directory, segment_bytes) if directory else DatabaseSink(app)
+        spill = app.config.get("AUDIT_SPILL_DIR")
+        self.spill = SegmentSink(spill, segment_bytes) if spill and spill != directory else None
+        self._closing = False
+        if self.enabled and not self._exit_hook:
+            atexit.register(self.close)
+            self._exit_hook = True
+
+    def ensure_writer(self):
+        # threads do not survive fork, so each (gunicorn) worker starts its own; called with _cond held
+        if self._pid != os.getpid():
+            self._buffer.clear()
+            self._thread = None
+            self._pid = os.getpid()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, entries):
+        with self._cond:
+            if not self._closing and len(entries) <= self.capacity:
+                self.ensure_writer()
+                deadline = time.monotonic() + self.block
+                while len(self._buffer) + len(entries) > self.capacity and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                if len(self._buffer) + len(entries) <= self.capacity:
+                    self._buffer.extend(entries)
+                    self._cond.notify_all()
+                    return
+            self.inline += 1
+        self.write(entries)
+
+    def take(self):
+        # the next batch: full, or whatever arrived within `interval` of the oldest entry
+        with self._cond:
+            deadline = None
+            while not self._closing:
+                if not self._buffer:
+                    self._cond.wait()
+                    continue
+                if len(self._buffer) >= self.batch_size or self._draining:
+                    break
+                deadline = deadline or time.monotonic() + self.interval
+                if time.monotonic() >= deadline:
+                    break
+                self._cond.wait(deadline - time.monotonic())
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._busy = bool(batch)
+            # producers waiting for room
+            self._cond.notify_all()
+            return batch
+
+    def run(self):
+        while True:
+            batch = self.take()
+            if batch:
+                self.write(batch)
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+            elif self._closing:
+                return
+
+    def write(self, entries):
+        for attempt in range(self.retries + 1):
+            try:
+                self.sink.write(entries)
+            except Exception:
+                if attempt < self.retries:
+                    time.sleep(0.1 * 2 ** attempt)
+                    continue
+                self.app.logger.exception("could not write %d audit entries", len(entries))
+            else:
+                with self._cond:
+                    self.written += len(entries)
+                return
+        try:
+            if self.spill is None:
+                raise RuntimeError("no AUDIT_SPILL_DIR")
+            self.spill.write(entries)
+        except Exception:
+            with self._cond:
+                self.failed += len(entries)
+            self.app.logger.exception("lost %d audit entries", len(entries))
+        else:
+            with self._cond:
+                self.spilled += len(entries)
+
+    def drain(self, timeout=10.0):
+        # writes everything queued so far without waiting for the interval, e.g. before reading the table
+        with self._cond:
+            self._draining = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._buffer and not self._busy, timeout)
+            self._draining = False
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout=5)
+        with self._cond:
+            leftover = list(self._buffer)
+            self._buffer.clear()
+            self._thread = None
+        if leftover:
+            self.write(leftover)
+        if self.sink is not None:
+            self.sink.close()
+        if self.spill is not None:
+            self.spill.close()
+
+    def stats(self):
+        with self._cond:
+            return {"queued": len(self._buffer), "written": self.written, "inline": self.inline,
+                    "spilled": self.spilled, "failed": self.failed}
+
+
+change_log = ChangeLog()
+
+
+def record(session, table_name, row_id, action, changes):
+    # for set-based writes, which never reach after_flush
+    if change_log.enabled:
+        session.info.setdefault("audit", []).append(entry(table_name, row_id, action, changes, acting_user()))
+
+
+def current_values(session, table, key, rows, columns):
+    # {key tuple: (row id, {column: value})} for the rows a set-based write is about to change; one query, each
+    # key column filtered with IN and the combinations checked here
+    wanted = set(tuple(row[k] for k in key) for row in rows)
+    if not wanted:
+        return {}
+    primary_key = list(table.primary_key.columns)[0]
+    query = session.query(primary_key, *[table.c[c] for c in key + tuple(columns)])
+    for position, name in enumerate(key):
+        query = query.filter(table.c[name].in_(sorted(set(k[position] for k in wanted))))
+    current = {}
+    for row in query:
+        found = tuple(row[1:1 + len(key)])
+        if found in wanted:
+            current[found] = (row[0], dict(zip(columns, row[1 + len(key):])))
+    return current
+
+
+def record_writes(session, table, key, rows, before):
+    # audit entries for rows written by bulk_update_mappings or an upsert, from their values before the write;
+    # rows whose key was not there before are inserts and get their new ids looked up
+    if not change_log.enabled:
+        return
+    inserted = [row for row in rows if tuple(row[k] for k in key) not in before]
+    ids = dict((k, row_id) for k, (row_id, _) in current_values(session, table, key, inserted, ()).items())
+    for row in rows:
+        found = tuple(row[k] for k in key)
+        if found in before:
+            row_id, old = before[found]
+            changes = dict((c, [plain(old[c]), plain(v)]) for c, v in row.items() if c in old and old[c] != v)
+            if changes:
+                record(session, table.name, row_id, "update", redact(changes))
+        elif found in ids:
+            record(session, table.name, ids[found], "insert",
+                   redact(dict((c, [None, plain(v)]) for c, v in row.items())))
+
+
+def redact(changes):
+    return dict((c, ["***", "***"] if c in REDACTED else v) for c, v in changes.items())
+
+
+@event.listens_for(Session, "after_flush")
+def capture_changes(session, flush_context):
+    if not change_log.enabled:
+        return
+    captured = []
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if isinstance(obj, SKIPPED) or not isinstance(obj, db.Model):
+                continue
+            table_name, row_id, changes = diff(obj, action)
+            if action == "update" and not changes:
+                continue
+            captured.append((table_name, row_id, action, changes))
+    if captured:
+        user_id = acting_user()
+        session.info.setdefault("audit", []).extend(entry(*c, user_id=user_id) for c in captured)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_changes(session):
+    # only committed changes reach the log
+    entries = session.info.pop("audit", None)
+    if entries:
+        change_log.put(entries)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_changes(session, previous_transaction):
+    session.info.pop("audit", None)
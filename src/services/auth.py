@@ -0,0 +1,128 @@
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..extensions import db
+from ..models.model import User, UserSession, hash_token
+from .cache import TTLCache, LocalPubSub, open_store
+
+USER_CHANNEL = "auth:user"
+TOKEN_CHANNEL = "auth:token"
+
+
+def detached_copy(user):
+    # A clean, session-less copy that can be merged into any request's session without SQL.
+    mapper = inspect(User)
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        set_committed_value(copy, attr.key, getattr(user, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+class AuthCache:
+    # The pubsub only reaches this process. With AUTH_CACHE_URL set, every invalidation also bumps a generation in
+    # the shared store and cached entries are checked against it, so a revoked token or demoted user stops working
+    # in every worker at once; without it other workers keep their copy for up to AUTH_CACHE_TTL seconds.
+
+    def __init__(self, pubsub=None):
+        self.pubsub = pubsub or LocalPubSub()
+        self.users = TTLCache()
+        self.tokens = TTLCache()
+        self.shared = None
+        self.pubsub.subscribe(USER_CHANNEL, self.users.delete)
+        self.pubsub.subscribe(TOKEN_CHANNEL, self.tokens.delete)
+
+    def init_app(self, app):
+        for cache in (self.users, self.tokens):
+            cache.maxsize = app.config.get("AUTH_CACHE_SIZE", cache.maxsize)
+            cache.ttl = app.config.get("AUTH_CACHE_TTL", cache.ttl)
+        self.shared = open_store(app.config.get("AUTH_CACHE_URL"), "AUTH_CACHE_URL")
+
+    def generation(self, channel, key):
+        if self.shared is None:
+            return 0
+        return int(self.shared.get("{}:{}".format(channel, key)) or 0)
+
+    def cached(self, cache, channel, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        generation, value = entry
+        if generation != self.generation(channel, key):
+            cache.delete(key)
+            return None
+        return value
+
+    def load_user(self, user_id):
+        user_id = int(user_id)
+        cached = self.cached(self.users, USER_CHANNEL, user_id)
+        if cached is None:
+            # read before the query: an invalidation that lands meanwhile leaves this copy already outdated
+            generation = self.generation(USER_CHANNEL, user_id)
+            user = db.session.query(User).get(user_id)
+            if user is None:
+                return None
+            self.users.set(user_id, (generation, detached_copy(user)))
+            return user
+        return db.session.merge(cached, load=False)
+
+    def user_id_for_token(self, token):
+        token_hash = hash_token(token)
+        entry = self.cached(self.tokens, TOKEN_CHANNEL, token_hash)
+        if entry is None:
+            generation = self.generation(TOKEN_CHANNEL, token_hash)
+            entry = db.session.query(UserSession.user_id, UserSession.expires_at) \
+                .filter_by(token_hash=token_hash).first()
+            if entry is None:
+                return None
+            entry = tuple(entry)
+            self.tokens.set(token_hash, (generation, entry))
+        user_id, expires_at = entry
+        if expires_at <= datetime.utcnow():
+            self.tokens.delete(token_hash)
+            return None
+        return user_id
+
+    def load_user_from_token(self, token):
+        user_id = self.user_id_for_token(token)
+        return self.load_user(user_id) if user_id is not None else None
+
+    def invalidate_user(self, user_id):
+        if self.shared is not None:
+            self.shared.incr("{}:{}".format(USER_CHANNEL, user_id))
+        self.pubsub.publish(USER_CHANNEL, user_id)
+
+    def invalidate_token(self, token_hash):
+        if self.shared is not None:
+            self.shared.incr("{}:{}".format(TOKEN_CHANNEL, token_hash))
+        self.pubsub.publish(TOKEN_CHANNEL, token_hash)
+
+
+auth_cache = AuthCache()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_auth_changes(session, flush_context):
+    users, tokens = session.info.setdefault("auth_invalidations", (set(), set()))
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            users.add(obj.id)
+        elif isinstance(obj, UserSession):
+            tokens.add(obj.token_hash)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_auth_changes(session):
+    users, tokens = session.info.pop("auth_invalidations", ((), ()))
+    for user_id in users:
+        auth_cache.invalidate_user(user_id)
+    for token_hash in tokens:
+        auth_cache.invalidate_token(token_hash)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_auth_changes(session, previous_transaction):
+    session.info.pop("auth_invalidations", None)
@@ -0,0 +1,188 @@
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.model import Ingredients, Restaurant, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes
+from .audit import change_log, current_values, record, record_writes
+from .menu_snapshot import bump_menu_versions
+from .normalization import normalize_ingredients, normalize_recipes
+from .nutrition_catalog import catalog_changed
+from .nutrition import recompute_recipe_nutrients
+from .pricing import menus_serving, recipes_using, recompute_menu_totals, recompute_recipe_costs
+from .response_cache import touch
+
+
+def refresh_derived(session, relinked=(), recipes=(), menus=(), restaurants=()):
+    # Bulk writes skip the after_flush hooks, so everything they would have done happens here in one pass:
+    # `relinked` recipes had ingredient links change, `recipes`/`menus`/`restaurants` had their own rows edited.
+    connection = session.connection()
+    relinked = sorted(set(relinked))
+    if relinked:
+        recompute_recipe_nutrients(relinked, session=session)
+        recompute_recipe_costs(connection, relinked)
+    edited = sorted(set(recipes) - set(relinked))
+    if edited:
+        # relinked recipes were normalized along with their new totals
+        normalize_recipes(connection, edited)
+    recipe_ids = sorted(set(recipes) | set(relinked))
+    menu_ids = set(menus)
+    if recipe_ids:
+        menu_ids.update(m for m, in session.execute(menus_serving(recipe_ids)))
+    if menu_ids:
+        recompute_menu_totals(connection, sorted(menu_ids))
+    restaurant_ids = set(restaurants)
+    if recipe_ids:
+        restaurant_ids.update(r for r, in session.query(Recipes.restaurant_id)
+                              .filter(Recipes.recipe_id.in_(recipe_ids)))
+    if menu_ids:
+        restaurant_ids.update(r for r, in session.query(MenuCard.restaurant_id)
+                              .filter(MenuCard.menu_id.in_(menu_ids)))
+    if restaurant_ids:
+        bump_menu_versions(connection, restaurant_ids)
+    # the read indexes refresh from these flags in their after_commit hooks
+    if recipe_ids:
+        catalog_changed(session)
+        session.info["allergens_changed"] = True
+        session.info.setdefault("search_changed", set()).add(Recipes)
+
+
+class Conflict(ValueError):
+    # rows a bulk write could not apply; nothing was saved
+    def __init__(self, errors):
+        super(Conflict, self).__init__("; ".join(errors))
+        self.errors = errors
+
+
+def unique_conflicts(model, rows, session):
+    # New values of unique columns (names) that another row already holds or that repeat within the batch. A swap
+    # within the batch counts as well: the executemany applies one row at a time, so it would fail the same way.
+    key = model.__mapper__.primary_key[0].key
+    errors = []
+    for column in model.__table__.columns:
+        if not column.unique:
+            continue
+        wanted = {}
+        for row in rows:
+            if column.key in row and row[column.key] is not None:
+                wanted.setdefault(row[column.key], []).append(row[key])
+        if not wanted:
+            continue
+        taken = dict(session.query(column, model.__mapper__.primary_key[0]).filter(column.in_(sorted(wanted))))
+        for value, ids in sorted(wanted.items()):
+            holders = set(ids) | ({taken[value]} if value in taken else set())
+            if len(holders) > 1:
+                errors.append("{} {!r} is used by rows {}".format(
+                    column.key, value, ", ".join(str(i) for i in sorted(holders))))
+    return errors
+
+
+def apply_updates(model, rows, session=None):
+    # rows: [{primary key: .., column: new value}] -> one executemany UPDATE; raises Conflict, with nothing saved,
+    # when a row would break a unique or foreign key constraint
+    session = session or db.session
+    if not rows:
+        return 0
+    errors = unique_conflicts(model, rows, session)
+    if errors:
+        raise Conflict(errors)
+    try:
+        write_updates(model, rows, session)
+        session.commit()
+    except IntegrityError as exc:
+        # a concurrent edit took the value after the check, or another constraint failed
+        session.rollback()
+        raise Conflict([str(exc.orig).strip()])
+    return len(rows)
+
+
+def write_updates(model, rows, session):
+    key = model.__mapper__.primary_key[0].key
+    ids = [row[key] for row in rows]
+    # bulk updates skip after_flush, so the audit entries are diffed against the values read just before
+    before = {}
+    if change_log.enabled:
+        columns = sorted(set(c for row in rows for c in row if c != key))
+        before = current_values(session, model.__table__, (key,), rows, columns)
+    session.bulk_update_mappings(model, rows)
+    record_writes(session, model.__table__, (key,), rows, before)
+    touch(session, model, ids)
+    if model is RecipeIngredient:
+        relinked = [r for r, in session.query(RecipeIngredient.recipe_id)
+                    .filter(RecipeIngredient.recipe_ingredient_id.in_(ids))]
+        refresh_derived(session, relinked=relinked)
+        touch(session, Recipes, relinked)
+    elif model is Ingredients:
+        normalize_ingredients(session.connection(), ids)
+        relinked = [r for r, in session.execute(recipes_using(ids))]
+        refresh_derived(session, relinked=relinked)
+        touch(session, Recipes, relinked)
+        session.info.setdefault("search_changed", set()).add(Ingredients)
+    elif model is Recipes:
+        refresh_derived(session, recipes=ids)
+    elif model is MenuCard:
+        refresh_derived(session, menus=ids)
+    elif model is Restaurant:
+        refresh_derived(session, restaurants=ids)
+
+
+def set_menu_recipes(menu_id, recipe_ids, session=None):
+    # makes the menu list exactly `recipe_ids`; one INSERT executemany and one DELETE for the difference
+    session = session or db.session
+    table = MenuCardRecipes.__table__
+    current = set(r for r, in session.query(MenuCardRecipes.recipe_id).filter(MenuCardRecipes.menu_id == menu_id))
+    wanted = set(recipe_ids)
+    added, removed = sorted(wanted - current), sorted(current - wanted)
+    connection = session.connection()
+    if added:
+        connection.execute(table.insert(), [dict(menu_id=menu_id, recipe_id=r) for r in added])
+    if removed:
+        connection.execute(table.delete().where((table.c.menu_id == menu_id) & table.c.recipe_id.in_(removed)))
+    if added or removed:
+        refresh_derived(session, menus=[menu_id])
+        record(session, MenuCard.__tablename__, menu_id, "update", {"recipe_ids": [sorted(current), sorted(wanted)]})
+        touch(session, MenuCard, [menu_id])
+    session.commit()
+    return len(added), len(removed)
+
+
+def set_recipe_ingredients(recipe_id, quantities, session=None):
+    # quantities: {ingredient_id: quantity}; ingredients left out are unlinked. Nutrients are recomputed once.
+    invalid = sorted(i for i, q in quantities.items() if q is None or q <= 0)
+    if invalid:
+        raise ValueError("quantities must be positive, got {} for ingredients {}".format(
+            ", ".join(str(quantities[i]) for i in invalid), ", ".join(map(str, invalid))))
+    session = session or db.session
+    table = RecipeIngredient.__table__
+    current = dict(session.query(RecipeIngredient.ingredient_id, RecipeIngredient.quantity)
+                   .filter(RecipeIngredient.recipe_id == recipe_id))
+    added = [dict(recipe_id=recipe_id, ingredient_id=i, quantity=q) for i, q in sorted(quantities.items())
+             if i not in current]
+    changed = [dict(b_ingredient_id=i, b_quantity=q) for i, q in sorted(quantities.items())
+               if i in current and current[i] != q]
+    removed = sorted(set(current) - set(quantities))
+    connection = session.connection()
+    if added:
+        connection.execute(table.insert(), added)
+    if changed:
+        connection.execute(table.update().where((table.c.recipe_id == recipe_id) &
+                                                (table.c.ingredient_id == bindparam("b_ingredient_id")))
+                           .values(quantity=bindparam("b_quantity")), changed)
+    if removed:
+        connection.execute(table.delete().where((table.c.recipe_id == recipe_id) &
+                                                table.c.ingredient_id.in_(removed)))
+    if added or changed or removed:
+        refresh_derived(session, relinked=[recipe_id])
+        record(session, Recipes.__tablename__, recipe_id, "update",
+               {"ingredients": [dict((str(i), q) for i, q in sorted(current.items())),
+                                dict((str(i), q) for i, q in sorted(quantities.items()))]})
+        touch(session, Recipes, [recipe_id])
+    session.commit()
+    return len(added), len(changed), len(removed)
+
+
+def ingredient_ids_by_name(names, session=None):
+    session = session or db.session
+    if not names:
+        return {}
+    return dict(session.execute(select([Ingredients.name, Ingredients.ingredient_id])
+                                .where(Ingredients.name.in_(sorted(set(names))))).fetchall())
@@ -0,0 +1,268 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; FileStore then only serializes INCR within one process
+    fcntl = None
+
+MISSING = object()
+
+
+class TTLCache:
+    # Thread-safe LRU with a per-entry time to live, local to one worker process.
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=MISSING):
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, MISSING) is not MISSING
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalPubSub:
+    # In-process stand-in for a Redis style publish/subscribe channel.
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].append(callback)
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+        return len(callbacks)
+
+
+class LocalRedis:
+    # In-process stand-in for the few Redis commands the rate limiter and response cache use (GET, SET, MGET,
+    # INCRBY, EXPIRE, pipelines).
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self.clock():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            return entry[0] if isinstance(entry[0], bytes) else str(entry[0]).encode()
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, self.clock() + ex if ex else None)
+            return True
+
+    def mget(self, keys):
+        with self._lock:
+            return [self.get(key) for key in keys]
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            entry = self._live(key)
+            value = (int(entry[0]) if entry else 0) + amount
+            self._data[key] = (value, entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], self.clock() + seconds)
+            return True
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    # queues commands and runs them under the store lock, like MULTI/EXEC
+
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.store._lock:
+            results = [getattr(self.store, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+class FileStore:
+    # Redis-style GET/SET/MGET/INCR with one file per key, shared by every worker process on a host. Values are
+    # written to a temporary file and renamed into place, so readers never see half a value; INCR holds a lock file.
+    # Every `sweep_every` sets a background thread sweeps the directory down to `max_entries`: expired files first,
+    # then the least recently written keys that have an expiry. Keys without one (counters, cache versions) are
+    # never evicted, since losing them would reset them.
+
+    def __init__(self, directory, clock=time.time, max_entries=50000, sweep_every=256):
+        self.directory = directory
+        self.clock = clock
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self._sets = 0
+        self._sweeper = None
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as handle:
+                header, _, value = handle.read().partition(b"\n")
+        except OSError:
+            return None
+        expires_at = float(header.decode() or 0)
+        if expires_at and expires_at <= self.clock():
+            self.remove(path)
+            return None
+        return value
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def write(self, key, value, ex=None):
+        value = value if isinstance(value, bytes) else str(value).encode()
+        header = repr(self.clock() + ex if ex else 0).encode()
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix="tmp")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(header + b"\n" + value)
+        os.replace(temporary, self.path(key))
+
+    def set(self, key, value, ex=None):
+        self.write(key, value, ex)
+        with self._sweep_lock:
+            self._sets += 1
+            # a full scan reads every file's header, so it never runs on the request that made the Nth set
+            if self.max_entries and self._sets % self.sweep_every == 0 and \
+                    (self._sweeper is None or not self._sweeper.is_alive()):
+                self._sweeper = threading.Thread(target=self.sweep, name="file-store-sweep", daemon=True)
+                self._sweeper.start()
+        return True
+
+    def sweep(self):
+        now = self.clock()
+        evictable = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue
+            if entry.name.startswith("tmp"):
+                # a value still being written, or left behind by a writer that died
+                try:
+                    if entry.stat().st_mtime < time.time() - 60:
+                        self.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(entry.path, "rb") as handle:
+                    header = handle.readline(32).strip()
+                expires_at = float(header.decode() or 0)
+                modified = entry.stat().st_mtime
+            except (OSError, ValueError):
+                expires_at, modified = now, 0
+            if expires_at and expires_at <= now:
+                self.remove(entry.path)
+            elif expires_at:
+                evictable.append((modified, entry.path))
+        excess = len(evictable) - self.max_entries
+        for _, path in sorted(evictable)[:max(0, excess)]:
+            self.remove(path)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def incr(self, key, amount=1):
+        with self._lock, open(os.path.join(self.directory, ".lock"), "a") as lock:
+            if fcntl is not None:
+                # released when the lock file closes
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            value = int(self.get(key) or 0) + amount
+            # counters never expire, so they are not counted towards a sweep
+            self.write(key, value)
+            return value
+
+
+def open_store(url, setting, max_entries=50000):
+    # a store several worker processes can share, or None when `url` is empty; max_entries only bounds a FileStore,
+    # Redis evicts by its own maxmemory policy
+    if not url:
+        return None
+    if url.startswith("file://"):
+        default = os.path.join(tempfile.gettempdir(), "restaurant_" + setting.lower().rsplit("_url", 1)[0])
+        return FileStore(url[len("file://"):] or default, max_entries=max_entries)
+    if url.startswith("local-redis://"):
+        return LocalRedis()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("{} {!r} needs the redis package".format(setting, url))
+        return redis.Redis.from_url(url)
+    raise ValueError("unsupported {} {!r}".format(setting, url))
@@ -0,0 +1,279 @@
+import csv
+import io
+import json
+import time
+
+from sqlalchemy import bindparam, text
+
+from ..extensions import db
+from ..models.model import Ingredients, Recipes, RecipeIngredient, Restaurant, NUTRIENT_FIELDS, normalize_tags
+from .audit import change_log, current_values, record_writes
+from .normalization import normalize_ingredients, normalize_recipes
+from .nutrition import recompute_recipe_nutrients
+from .menu_snapshot import bump_menu_versions
+from .pricing import recompute_recipe_costs, recompute_menu_totals
+from .search import indexes as search_indexes
+from .nutrition_catalog import catalog_changed
+from .response_cache import touch
+from .units import canonical
+
+
+def number(value):
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+
+def tags(value):
+    # bulk inserts skip the model validator, so the tags are normalized here
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return normalize_tags(str(v) for v in value)
+    return normalize_tags(value.split("|"))
+
+
+def optional_number(value):
+    return None if value is None or value == "" else float(value)
+
+
+def unit(value):
+    # unknown units are kept; they only need a unit_weight to be normalized
+    return canonical(optional(value) or "g")
+
+
+def optional(value):
+    return None if value is None or value == "" else str(value)
+
+
+def required(value):
+    if value is None or str(value).strip() == "":
+        raise ValueError("is required")
+    return str(value).strip()
+
+
+INGREDIENT_FIELDS = dict([("name", required), ("quantity", number), ("unit_cost", number), ("unit", unit),
+                          ("unit_weight", optional_number)] + [(f, number) for f in NUTRIENT_FIELDS])
+RECIPE_FIELDS = dict([("name", required), ("type", required), ("cuisine", required), ("serving_unit", required),
+                      ("serving_size", number), ("price", number), ("image_string", optional), ("allergy_tag", tags)] +
+                     [(f, number) for f in NUTRIENT_FIELDS])
+LINK_FIELDS = {"recipe": required, "ingredient": required, "quantity": number}
+
+
+class ErrorLog:
+    # Counts every rejected row but only keeps the first few messages, so memory stays bounded.
+
+    def __init__(self, limit=100):
+        self.limit = limit
+        self.count = 0
+        self.samples = []
+
+    def append(self, message):
+        self.count += 1
+        if len(self.samples) < self.limit:
+            self.samples.append(message)
+
+
+def read_rows(path):
+    # Streams dict rows from a .csv or .jsonl file; nothing is held beyond the current line.
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.endswith(".jsonl") or path.endswith(".json"):
+            for line_number, line in enumerate(handle, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+        else:
+            for line_number, row in enumerate(csv.DictReader(handle), 2):
+                yield line_number, row
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(chunk, fields, errors):
+    # Returns (converted row, source row) pairs; invalid rows are reported and skipped.
+    valid = []
+    for line_number, row in chunk:
+        converted = {}
+        for name, convert in fields.items():
+            try:
+                converted[name] = convert(row.get(name))
+            except (TypeError, ValueError) as exc:
+                errors.append("line {}: {} {}".format(line_number, name, exc))
+                break
+        else:
+            valid.append((converted, row))
+    return valid
+
+
+def dedupe(rows, key):
+    # ON CONFLICT cannot touch the same row twice in one statement; the last row wins
+    return list(dict((tuple(row[k] for k in key), row) for row in rows).values())
+
+
+def update_clause(columns, key):
+    return ", ".join("{0} = excluded.{0}".format(c) for c in columns if c not in key) or \
+        "{0} = excluded.{0}".format(key[0])
+
+
+def upsert_statement(table, columns, key):
+    return text("INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}".format(
+        table.name, ", ".join(columns), ", ".join(":" + c for c in columns), ", ".join(key),
+        update_clause(columns, key))) \
+        .bindparams(*[bindparam(c, type_=table.c[c].type) for c in columns])
+
+
+def copy_value(value):
+    if isinstance(value, list):
+        return "{" + ",".join('"{}"'.format(v.replace("\\", "\\\\").replace('"', '\\"')) for v in value) + "}"
+    return value
+
+
+def copy_upsert(connection, table, columns, key, rows):
+    # PostgreSQL: COPY the chunk into a temporary table, then merge it in one INSERT .. SELECT
+    staging = "import_" + table.name
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+                       .format(staging, table.name))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[c]) for c in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(staging, ", ".join(columns)), buffer)
+    connection.execute("INSERT INTO {0} ({1}) SELECT {1} FROM {2} ON CONFLICT ({3}) DO UPDATE SET {4}".format(
+        table.name, ", ".join(columns), staging, ", ".join(key), update_clause(columns, key)))
+    connection.execute("TRUNCATE {}".format(staging))
+
+
+def write_chunk(connection, table, rows, key):
+    if not rows:
+        return
+    rows = dedupe(rows, key)
+    columns = sorted(rows[0])
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg2":
+        copy_upsert(connection, table, columns, key, rows)
+    else:
+        connection.execute(upsert_statement(table, columns, key), rows)
+
+
+def lookup(session, column, key, names):
+    return dict(session.query(column, key).filter(column.in_(sorted(names))).all()) if names else {}
+
+
+def given_restaurant_id(source):
+    value = source.get("restaurant_id")
+    return None if value is None or str(value).strip() == "" else str(value).strip()
+
+
+def resolve_restaurants(session, pairs, errors):
+    names = set(source["restaurant"] for _, source in pairs if source.get("restaurant"))
+    ids = lookup(session, Restaurant.name, Restaurant.restaurant_id, names)
+    given = set(int(v) for v in (given_restaurant_id(source) for _, source in pairs) if v and v.isdigit())
+    # an id that does not exist would abort the whole chunk on the foreign key, so it is rejected per row
+    known = set(r for r, in session.query(Restaurant.restaurant_id)
+                .filter(Restaurant.restaurant_id.in_(sorted(given)))) if given else set()
+    resolved = []
+    for row, source in pairs:
+        value = given_restaurant_id(source)
+        if value is not None:
+            if not value.isdigit() or int(value) not in known:
+                errors.append("recipe {}: unknown restaurant_id {!r}".format(row["name"], value))
+                continue
+            row["restaurant_id"] = int(value)
+        elif source.get("restaurant") in ids:
+            row["restaurant_id"] = ids[source["restaurant"]]
+        else:
+            errors.append("recipe {}: unknown restaurant".format(row["name"]))
+            continue
+        resolved.append(row)
+    return resolved
+
+
+def resolve_links(session, rows, errors):
+    recipes = lookup(session, Recipes.name, Recipes.recipe_id, set(r["recipe"] for r in rows))
+    ingredients = lookup(session, Ingredients.name, Ingredients.ingredient_id, set(r["ingredient"] for r in rows))
+    resolved = []
+    for row in rows:
+        if row["recipe"] not in recipes or row["ingredient"] not in ingredients:
+            errors.append("link {} -> {}: unknown recipe or ingredient".format(row["recipe"], row["ingredient"]))
+            continue
+        resolved.append(dict(recipe_id=recipes[row["recipe"]], ingredient_id=ingredients[row["ingredient"]],
+                             quantity=row.get("quantity", 0.0)))
+    return resolved
+
+
+class CatalogImporter:
+
+    def __init__(self, session=None, chunk_size=5000, report=None):
+        self.session = session or db.session
+        self.chunk_size = chunk_size
+        self.report = report or (lambda message: None)
+        self.errors = ErrorLog()
+        # recipes whose links were written; their totals are recomputed once in finish()
+        self.relinked = set()
+
+    def run(self, path, kind):
+        started, count = time.perf_counter(), 0
+        for chunk in chunked(read_rows(path), self.chunk_size):
+            count += getattr(self, "import_" + kind)(chunk)
+            self.session.commit()
+            elapsed = time.perf_counter() - started
+            self.report("{}: {} rows ({:.0f} rows/s)".format(kind, count, count / elapsed if elapsed else 0.0))
+        return count
+
+    def write(self, table, rows, key):
+        # upserts skip after_flush, so the audit entries are diffed against the rows as they were before
+        if not change_log.enabled or not rows:
+            write_chunk(self.session.connection(), table, rows, key)
+            return
+        rows = dedupe(rows, key)
+        before = current_values(self.session, table, key, rows, [c for c in rows[0] if c not in key])
+        write_chunk(self.session.connection(), table, rows, key)
+        record_writes(self.session, table, key, rows, before)
+
+    def import_ingredients(self, chunk):
+        rows = [row for row, _ in validate(chunk, INGREDIENT_FIELDS, self.errors)]
+        self.write(Ingredients.__table__, rows, ("name",))
+        return len(rows)
+
+    def import_recipes(self, chunk):
+        rows = resolve_restaurants(self.session, validate(chunk, RECIPE_FIELDS, self.errors), self.errors)
+        self.write(Recipes.__table__, rows, ("name",))
+        return len(rows)
+
+    def import_links(self, chunk):
+        rows = [row for row, _ in validate(chunk, LINK_FIELDS, self.errors)]
+        rows = resolve_links(self.session, rows, self.errors)
+        self.write(RecipeIngredient.__table__, rows, ("recipe_id", "ingredient_id"))
+        self.relinked.update(r["recipe_id"] for r in rows)
+        return len(rows)
+
+    def finish(self, ingredients_changed):
+        # set-based writes bypass the ORM flush hooks, so refresh derived data once at the end
+        if ingredients_changed:
+            # recipe weights read grams_per_unit, so ingredients are normalized before the recompute
+            normalize_ingredients(self.session.connection())
+            recompute_recipe_nutrients(session=self.session)
+            recompute_recipe_costs(self.session.connection())
+        else:
+            relinked = sorted(self.relinked)
+            if relinked:
+                recompute_recipe_nutrients(relinked, session=self.session)
+                recompute_recipe_costs(self.session.connection(), relinked)
+            normalize_recipes(self.session.connection())
+        recompute_menu_totals(self.session.connection())
+        bump_menu_versions(self.session.connection())
+        for model in (Ingredients, Recipes, RecipeIngredient):
+            touch(self.session, model)
+        catalog_changed(self.session)
+        self.session.commit()
+        for index in search_indexes.values():
+            index.invalidate()
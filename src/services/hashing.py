@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def hash_method(iterations):
+    return "pbkdf2:sha256:{}".format(iterations)
+
+
+class PasswordHasher:
+    # Runs the KDF in a bounded process pool so hashing does not hold the GIL of the web worker.
+    # With `workers=0` hashing happens inline, which keeps CLI commands and tests simple.
+
+    def __init__(self, iterations=150000, workers=0, max_pending=64):
+        self.iterations = iterations
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def init_app(self, app):
+        self.iterations = app.config.get("PASSWORD_HASH_ITERATIONS", self.iterations)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", self.workers)
+        self.max_pending = app.config.get("PASSWORD_HASH_MAX_PENDING", self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.shutdown()
+
+    @property
+    def method(self):
+        return hash_method(self.iterations)
+
+    def executor(self):
+        # Pools are not fork safe, so every (gunicorn) worker process lazily builds its own.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+        self._executor = self._pid = None
+
+    def submit(self, fn, *args):
+        if not self.workers:
+            future = Future()
+            future.set_result(fn(*args))
+            return future
+        # bounded queue: callers block here instead of piling up unbounded KDF work
+        self._slots.acquire()
+        try:
+            future = self.executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def hash_async(self, password):
+        return self.submit(generate_password_hash, password, self.method)
+
+    def check_async(self, pwhash, password):
+        return self.submit(check_password_hash, pwhash, password)
+
+    def hash(self, password):
+        return self.hash_async(password).result()
+
+    def check(self, pwhash, password):
+        return self.check_async(pwhash, password).result()
+
+    def check_many(self, pairs):
+        futures = [self.check_async(pwhash, password) for pwhash, password in pairs]
+        return [future.result() for future in futures]
+
+    def needs_rehash(self, pwhash):
+        return not (pwhash or "").startswith(self.method + "$")
@@ -0,0 +1,221 @@
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, or_, select
+
+from ..extensions import db
+from ..models.model import Job, Restaurant, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes
+from .allergens import bitset_index
+from .audit import record
+from .catalog_import import CatalogImporter
+from .menu_snapshot import bump_menu_versions
+from .nutrition import recompute_recipe_nutrients
+from .nutrition_catalog import nutrition_catalog, catalog_changed
+from .pricing import recompute_costs, recompute_menu_totals, reprice_restaurant
+from .response_cache import touch
+from .search import indexes as search_indexes
+
+handlers = {}
+
+
+def handler(kind):
+    def register(fn):
+        handlers[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, payload=None, user_id=None, session=None):
+    # the caller commits, so a job is only visible once the request that created it succeeds
+    if kind not in handlers:
+        raise ValueError("unknown job kind {!r}".format(kind))
+    session = session or db.session
+    job = Job(kind=kind, payload=payload or {}, user_id=user_id)
+    session.add(job)
+    session.flush()
+    return job
+
+
+def claimable(timeout, max_attempts):
+    # queued jobs, plus running jobs whose worker stopped sending heartbeats within `timeout` seconds
+    stale = datetime.utcnow() - timedelta(seconds=timeout)
+    return or_(Job.status == "queued",
+               (Job.status == "running") & (Job.heartbeat_at < stale) & (Job.attempts < max_attempts))
+
+
+def fail_abandoned(session, timeout, max_attempts):
+    # running jobs that lost their worker on the last allowed attempt would otherwise stay "running" forever
+    stale = datetime.utcnow() - timedelta(seconds=timeout)
+    session.query(Job).filter(Job.status == "running", Job.heartbeat_at < stale, Job.attempts >= max_attempts) \
+        .update({Job.status: "failed", Job.finished_at: datetime.utcnow(),
+                 Job.error: "worker stopped responding on attempt {}".format(max_attempts)},
+                synchronize_session=False)
+
+
+def claim(session, timeout=120, max_attempts=3):
+    fail_abandoned(session, timeout, max_attempts)
+    criterion = claimable(timeout, max_attempts)
+    # SKIP LOCKED lets concurrent workers pass over each other's rows instead of queueing on them;
+    # SQLite drops the FOR UPDATE, and the conditional update below keeps two claims from both winning
+    job_id = session.query(Job.job_id).filter(criterion).order_by(Job.job_id).limit(1) \
+        .with_for_update(skip_locked=True).scalar()
+    if job_id is None:
+        session.commit()
+        return None
+    now = datetime.utcnow()
+    claimed = session.query(Job).filter(Job.job_id == job_id, criterion).update(
+        {Job.status: "running", Job.started_at: now, Job.heartbeat_at: now, Job.attempts: Job.attempts + 1},
+        synchronize_session=False)
+    session.commit()
+    return session.query(Job).get(job_id) if claimed else None
+
+
+class Heartbeat(threading.Thread):
+    # Refreshes heartbeat_at on its own connection while the handler runs, so the handler's transaction (which
+    # can be long) never holds it back. Only touches the row while this attempt still owns it.
+
+    def __init__(self, engine, job, interval):
+        super(Heartbeat, self).__init__(name="job-heartbeat-{}".format(job.job_id), daemon=True)
+        self.engine = engine
+        self.job_id, self.attempts = job.job_id, job.attempts
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        table = Job.__table__
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(table.update().where(
+                        (table.c.job_id == self.job_id) & (table.c.status == "running") &
+                        (table.c.attempts == self.attempts)).values(heartbeat_at=datetime.utcnow()))
+            except Exception:
+                # a missed beat only matters once `timeout` worth of them are missed
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job, session, heartbeat_interval=None):
+    heartbeat = None
+    if heartbeat_interval:
+        heartbeat = Heartbeat(session.get_bind(Job.__mapper__), job, heartbeat_interval)
+        heartbeat.start()
+    try:
+        result = handlers[job.kind](session=session, **job.payload)
+        session.commit()
+    except Exception:
+        session.rollback()
+        job.status, job.error = "failed", traceback.format_exc(limit=5)
+        current_app.logger.exception("job %s (%s) failed", job.job_id, job.kind)
+    else:
+        job.status, job.result, job.error = "done", result, None
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+    job.finished_at = datetime.utcnow()
+    session.commit()
+    return job
+
+
+def run_next(session=None, timeout=120, max_attempts=3, heartbeat_interval=None):
+    session = session or db.session
+    job = claim(session, timeout, max_attempts)
+    return run(job, session, heartbeat_interval) if job is not None else None
+
+
+def work(poll_interval=1.0, once=False, report=None, session=None):
+    # processes jobs until the queue is empty (once) or forever, sleeping while idle
+    session = session or db.session
+    timeout = current_app.config.get("JOB_TIMEOUT", 120)
+    max_attempts = current_app.config.get("JOB_MAX_ATTEMPTS", 3)
+    heartbeat_interval = current_app.config.get("JOB_HEARTBEAT_INTERVAL", 15)
+    count = 0
+    while True:
+        job = run_next(session, timeout, max_attempts, heartbeat_interval)
+        if job is None:
+            if once:
+                return count
+            time.sleep(poll_interval)
+            continue
+        count += 1
+        if report:
+            report("job {} {}: {}".format(job.job_id, job.kind, job.status))
+
+
+def refresh_read_indexes():
+    # set-based writes bypass the flush hooks that keep these in step
+    bitset_index.invalidate()
+    for index in search_indexes.values():
+        index.invalidate()
+    nutrition_catalog.invalidate()
+
+
+@handler("delete_restaurant")
+def delete_restaurant(restaurant_id, session):
+    # The ORM cascade loads every recipe, menu and link into memory; these deletes touch the same rows
+    # through the restaurant_id / recipe_id / menu_id indexes without materializing any of them.
+    recipes = select([Recipes.recipe_id]).where(Recipes.restaurant_id == restaurant_id)
+    menus = select([MenuCard.menu_id]).where(MenuCard.restaurant_id == restaurant_id)
+    entries = MenuCardRecipes.__table__
+    # menus of other restaurants that list these recipes lose entries, so their totals and snapshots change
+    others = session.query(MenuCard.menu_id, MenuCard.restaurant_id).filter(
+        MenuCard.restaurant_id != restaurant_id,
+        MenuCard.menu_id.in_(select([entries.c.menu_id]).where(entries.c.recipe_id.in_(recipes)))).all()
+
+    connection = session.connection()
+    counts = {}
+    for name, statement in (
+            ("menu_card_recipes", delete(entries).where(or_(entries.c.menu_id.in_(menus),
+                                                            entries.c.recipe_id.in_(recipes)))),
+            ("menu_card", delete(MenuCard.__table__).where(MenuCard.__table__.c.restaurant_id == restaurant_id)),
+            ("recipe_ingredient", delete(RecipeIngredient.__table__).where(
+                RecipeIngredient.__table__.c.recipe_id.in_(recipes))),
+            ("recipes", delete(Recipes.__table__).where(Recipes.__table__.c.restaurant_id == restaurant_id)),
+            ("restaurant", delete(Restaurant.__table__).where(
+                Restaurant.__table__.c.restaurant_id == restaurant_id))):
+        counts[name] = connection.execute(statement).rowcount
+    if others:
+        recompute_menu_totals(connection, sorted(set(m for m, _ in others)))
+        bump_menu_versions(connection, set(r for _, r in others))
+    record(session, Restaurant.__tablename__, restaurant_id, "delete", {"deleted_rows": [counts, None]})
+    for model in (Restaurant, MenuCard, MenuCardRecipes, Recipes, RecipeIngredient):
+        touch(session, model)
+    catalog_changed(session)
+    session.commit()
+    refresh_read_indexes()
+    return counts
+
+
+@handler("import_catalog")
+def import_catalog(session, ingredients=None, recipes=None, links=None, chunk_size=5000):
+    importer = CatalogImporter(session=session, chunk_size=chunk_size)
+    counts = {}
+    for path, kind in ((ingredients, "ingredients"), (recipes, "recipes"), (links, "links")):
+        if path:
+            counts[kind] = importer.run(path, kind)
+    importer.finish(ingredients_changed=bool(ingredients))
+    return {"rows": counts, "rejected": importer.errors.count, "errors": importer.errors.samples[:20]}
+
+
+@handler("recompute_nutrients")
+def recompute_nutrients(session, recipe_ids=None, batch_size=1000):
+    count = recompute_recipe_nutrients(recipe_ids, batch_size=batch_size, session=session)
+    bump_menu_versions(session.connection())
+    touch(session, Recipes, recipe_ids)
+    catalog_changed(session)
+    return {"recipes": count}
+
+
+@handler("recompute_costs")
+def recompute_costs_job(session, restaurant_id=None):
+    if restaurant_id is None:
+        recompute_costs(session)
+    else:
+        reprice_restaurant(restaurant_id, session)
+    return {"restaurant_id": restaurant_id}
@@ -0,0 +1,147 @@
+import heapq
+
+import numpy as np
+
+from ..extensions import db
+from ..models.model import Recipes, MenuCardRecipes, NUTRIENT_FIELDS, normalized
+from .allergens import filter_recipes
+
+FIELDS = ("price",) + NUTRIENT_FIELDS
+MAX_ITEMS = 5
+# NULL, all together, where services.normalization could not weigh the serving
+SERVING_COLUMNS = [getattr(Recipes, normalized(f, "per_serving")) for f in NUTRIENT_FIELDS]
+
+
+class ComboSearch:
+    # Branch and bound over combos of min_items..max_items distinct recipes, keeping the `top` best by objective.
+    # Feasibility and bounds are numpy passes over the remaining candidates, and the last item of every combo is
+    # picked from one vectorized pass instead of a Python loop. `max_nodes` caps the work on pathological menus.
+
+    def __init__(self, values, objective, maximum, minimum, min_items, max_items, top, max_nodes):
+        order = np.argsort(-objective, kind="stable")
+        self.order = order
+        self.objective = objective[order]
+        self.values = values[order]
+        self.maximum = maximum
+        self.minimum = minimum
+        self.min_items = min_items
+        self.max_items = max_items
+        self.top = top
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.best = []
+
+    @property
+    def floor(self):
+        return self.best[0][0] if len(self.best) >= self.top else -np.inf
+
+    def offer(self, score, combo):
+        entry = (score, tuple(int(i) for i in self.order[list(combo)]))
+        if len(self.best) < self.top:
+            heapq.heappush(self.best, entry)
+        elif entry > self.best[0]:
+            heapq.heapreplace(self.best, entry)
+
+    def run(self):
+        self.extend(0, [], np.zeros(self.values.shape[1]), 0.0)
+        return sorted(self.best, reverse=True), self.nodes < self.max_nodes
+
+    def extend(self, start, chosen, totals, score):
+        self.nodes += 1
+        if self.nodes >= self.max_nodes:
+            return
+        depth = len(chosen)
+        if depth >= self.min_items and (totals >= self.minimum).all():
+            self.offer(score, chosen)
+        slots = self.max_items - depth
+        if not slots:
+            return
+        # every candidate must still fit every upper limit on its own
+        feasible = start + np.flatnonzero((self.values[start:] <= self.maximum - totals).all(axis=1))
+        if not len(feasible):
+            return
+        gains = self.objective[feasible]
+        # candidates are sorted by objective, so the first `slots` of them are the best possible completion
+        if score + np.clip(gains[:slots], 0, None).sum() <= self.floor:
+            return
+        # nutrients are non-negative, so the `slots` largest values per column bound what any completion adds
+        if (totals + np.sort(self.values[feasible], axis=0)[::-1][:slots].sum(axis=0) < self.minimum).any():
+            return
+
+        if slots == 1:
+            scores = score + gains
+            complete = ((totals + self.values[feasible]) >= self.minimum).all(axis=1)
+            for position in np.flatnonzero(complete)[:self.top]:
+                # gains are sorted, so the first `top` complete candidates are the best ones
+                self.offer(scores[position], chosen + [feasible[position]])
+            return
+
+        for offset, candidate in enumerate(feasible):
+            if score + np.clip(gains[offset:offset + slots], 0, None).sum() <= self.floor:
+                break
+            self.extend(candidate + 1, chosen + [candidate], totals + self.values[candidate],
+                        score + gains[offset])
+            if self.nodes >= self.max_nodes:
+                return
+
+
+def parse_objective(objective):
+    # "protein" maximizes, "-price" minimizes
+    sense = -1.0 if objective.startswith("-") else 1.0
+    field = objective.lstrip("-")
+    if field not in FIELDS:
+        raise ValueError("objective must be one of {} (prefix - to minimize)".format(", ".join(FIELDS)))
+    return field, sense
+
+
+def menu_matrix(menu_id, exclude=()):
+    # A menu item is one serving, so combos add up per-serving nutrients, read in the same query as the menu rows.
+    # Returns (rows, values, unweighable): recipes whose serving could not be weighed have no per-serving values
+    # and are left out rather than counted with their whole-recipe totals.
+    query = Recipes.query.join(MenuCardRecipes, MenuCardRecipes.recipe_id == Recipes.recipe_id) \
+        .filter(MenuCardRecipes.menu_id == menu_id) \
+        .with_entities(Recipes.recipe_id, Recipes.name, db.func.coalesce(Recipes.price, 0).label("price"),
+                       *SERVING_COLUMNS).distinct()
+    rows = filter_recipes(query, exclude=exclude).order_by(Recipes.recipe_id).all()
+    weighable = [row for row in rows if row[3] is not None]
+    unweighable = [row for row in rows if row[3] is None]
+    if not weighable:
+        return weighable, np.zeros((0, len(FIELDS))), unweighable
+    return weighable, np.array([row[2:] for row in weighable], dtype=np.float64), unweighable
+
+
+def find_combos(menu_id, maximum=None, minimum=None, exclude=(), objective="protein", min_items=1, max_items=3,
+                top=5, max_nodes=200000):
+    # maximum/minimum: {field: limit} over the combo totals; returns (combos, exhaustive, unweighable recipes)
+    field, sense = parse_objective(objective)
+    maximum, minimum = maximum or {}, minimum or {}
+    unknown = set(maximum) | set(minimum)
+    unknown.difference_update(FIELDS)
+    if unknown:
+        raise ValueError("unknown fields: {}".format(", ".join(sorted(unknown))))
+    max_items = max(1, min(max_items, MAX_ITEMS))
+    min_items = max(1, min(min_items, max_items))
+
+    rows, values, unweighable = menu_matrix(menu_id, exclude)
+    skipped = [{"recipe_id": row.recipe_id, "name": row.name} for row in unweighable]
+    upper = np.array([maximum.get(f, np.inf) for f in FIELDS])
+    lower = np.array([minimum.get(f, -np.inf) for f in FIELDS])
+    # vectorized pre-filter: a recipe over any limit on its own can never be part of a combo
+    keep = np.flatnonzero((values <= upper).all(axis=1))
+    if not len(keep):
+        return [], True, skipped
+    search = ComboSearch(values[keep], sense * values[keep, FIELDS.index(field)], upper, lower, min_items,
+                         max_items, top, max_nodes)
+    best, exhaustive = search.run()
+
+    combos = []
+    for score, positions in best:
+        picked = keep[list(positions)]
+        totals = values[picked].sum(axis=0)
+        combos.append({
+            "recipes": [{"recipe_id": rows[i].recipe_id, "name": rows[i].name, "price": rows[i].price}
+                        for i in picked.tolist()],
+            "totals": dict(zip(FIELDS, totals.round(4).tolist())),
+            "score": round(float(score) * sense, 4),
+        })
+    return combos, exhaustive, skipped
@@ -0,0 +1,109 @@
+import json
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Restaurant, Recipes, RecipeIngredient, Ingredients, MenuCard, MenuCardRecipes
+from ..models.schema import menu_cards_schema
+from .cache import TTLCache
+
+try:
+    import msgpack
+except ImportError:  # optional, JSON is always available
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+restaurant_table = Restaurant.__table__
+snapshots = TTLCache(maxsize=256, ttl=0)
+
+
+def formats():
+    return (JSON, MSGPACK) if msgpack is not None else (JSON,)
+
+
+def menu_header(restaurant_id):
+    # Plain core select on the primary key: the only database work on a warm read.
+    statement = select([restaurant_table.c.name, restaurant_table.c.menu_version]) \
+        .where(restaurant_table.c.restaurant_id == restaurant_id)
+    return db.session.execute(statement).first()
+
+
+def build_snapshot(restaurant_id, name, version):
+    menus = MenuCard.query.filter_by(restaurant_id=restaurant_id).order_by(MenuCard.menu_id).options(
+        selectinload(MenuCard.restaurant),
+        selectinload(MenuCard.menu_card_recipes).selectinload(MenuCardRecipes.recipe)).all()
+    return {"restaurant_id": restaurant_id, "name": name, "version": version, "menus": menu_cards_schema.dump(menus)}
+
+
+def encode(snapshot, mimetype):
+    if mimetype == MSGPACK:
+        return msgpack.packb(snapshot, use_bin_type=True)
+    return json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+
+
+def menu_etag(restaurant_id, version, mimetype):
+    return "menu-{}-{}-{}".format(restaurant_id, version, mimetype.rsplit("/", 1)[-1])
+
+
+def get_snapshot(restaurant_id, mimetype=JSON, if_none_match=None):
+    # Returns (etag, body) or None; body is None when the client's copy is still current.
+    header = menu_header(restaurant_id)
+    if header is None:
+        return None
+    key = (restaurant_id, header.menu_version, mimetype)
+    etag = menu_etag(*key)
+    if if_none_match is not None and if_none_match.contains(etag):
+        return etag, None
+    body = snapshots.get(key)
+    if body is None:
+        body = encode(build_snapshot(restaurant_id, header.name, header.menu_version), mimetype)
+        snapshots.set(key, body)
+    return etag, body
+
+
+def bump_menu_versions(connection, restaurant_ids=None):
+    statement = restaurant_table.update().values(menu_version=restaurant_table.c.menu_version + 1)
+    if restaurant_ids is not None:
+        if not restaurant_ids:
+            return
+        statement = statement.where(restaurant_table.c.restaurant_id.in_(sorted(restaurant_ids)))
+    connection.execute(statement)
+
+
+def _values(obj, field):
+    history = get_history(obj, field)
+    return set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+
+
+@event.listens_for(Session, "after_flush")
+def bump_changed_menus(session, flush_context):
+    restaurants, menus, recipes, ingredients = set(), set(), set(), set()
+    changed = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    for obj in changed:
+        if isinstance(obj, Restaurant):
+            # the snapshot embeds the restaurant's own name and details
+            restaurants.add(obj.restaurant_id)
+        elif isinstance(obj, (MenuCard, Recipes)):
+            restaurants |= _values(obj, "restaurant_id")
+        elif isinstance(obj, MenuCardRecipes):
+            menus |= _values(obj, "menu_id")
+        elif isinstance(obj, RecipeIngredient):
+            recipes |= _values(obj, "recipe_id")
+        elif isinstance(obj, Ingredients) and obj in session.dirty:
+            # nutrient edits reach recipes through set-based updates, not through Recipes objects
+            ingredients.add(obj.ingredient_id)
+
+    if menus:
+        restaurants.update(r for r, in session.query(MenuCard.restaurant_id).filter(MenuCard.menu_id.in_(menus)))
+    if ingredients:
+        recipes.update(r for r, in session.query(RecipeIngredient.recipe_id)
+                       .filter(RecipeIngredient.ingredient_id.in_(ingredients)))
+    if recipes:
+        restaurants.update(r for r, in session.query(Recipes.restaurant_id).filter(Recipes.recipe_id.in_(recipes)))
+    restaurants.discard(None)
+    if restaurants:
+        bump_menu_versions(session.connection(), restaurants)
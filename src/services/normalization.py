@@ -0,0 +1,148 @@
+import numpy as np
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Ingredients, Recipes, RecipeIngredient, NUTRIENT_FIELDS, normalized
+from .pricing import recipes_using
+from .units import grams_per_unit, is_count, to_grams
+
+ingredients_table = Ingredients.__table__
+recipes_table = Recipes.__table__
+links_table = RecipeIngredient.__table__
+
+UNIT_FIELDS = ("unit", "unit_weight")
+INGREDIENT_INPUTS = ("quantity",) + UNIT_FIELDS + NUTRIENT_FIELDS
+RECIPE_INPUTS = ("serving_size", "serving_unit") + NUTRIENT_FIELDS
+
+
+def batches(connection, key, ids, batch_size):
+    if ids is None:
+        ids = [i for i, in connection.execute(select([key]).order_by(key))]
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+def scaled(values, scale, basis):
+    # one {column: value} dict per row; rows without a scale (unknown weight) store NULLs
+    known = np.isfinite(scale)
+    vectors = values * np.where(known, scale, 0.0)[:, None]
+    columns = [normalized(f, basis) for f in NUTRIENT_FIELDS]
+    return [dict(zip(columns, vector if ok else [None] * len(columns)))
+            for vector, ok in zip(vectors.tolist(), known.tolist())]
+
+
+def write_rows(connection, table, key, rows):
+    # rows: [{key: id, column: value}] -> one executemany UPDATE
+    if not rows:
+        return
+    statement = table.update().where(table.c[key] == bindparam("b_" + key)).values(
+        **dict((column, bindparam("b_" + column)) for column in rows[0] if column != key))
+    connection.execute(statement, [dict(("b_" + column, value) for column, value in row.items()) for row in rows])
+
+
+def normalize_ingredients(connection, ingredient_ids=None, batch_size=1000):
+    column = ingredients_table.c
+    nutrients = [db.func.coalesce(column[f], 0) for f in NUTRIENT_FIELDS]
+    for chunk in batches(connection, column.ingredient_id, ingredient_ids, batch_size):
+        rows = connection.execute(select([column.ingredient_id, column.unit, column.unit_weight,
+                                          db.func.coalesce(column.quantity, 0)] + nutrients)
+                                  .where(column.ingredient_id.in_(chunk))).fetchall()
+        if not rows:
+            continue
+        grams = np.array([grams_per_unit(r[1], r[2]) or np.nan for r in rows], dtype=np.float64)
+        quantity = np.array([r[3] for r in rows], dtype=np.float64)
+        values = np.array([r[4:] for r in rows], dtype=np.float64).reshape(len(rows), -1)
+        # the values describe `quantity` units, or one unit when it is unset (see nutrition.per_unit)
+        scale = 100.0 / (np.where(quantity > 0, quantity, 1.0) * grams)
+        updates = scaled(values, scale, "per_100g")
+        for row, update, factor in zip(rows, updates, grams.tolist()):
+            update.update(ingredient_id=row[0], grams_per_unit=None if np.isnan(factor) else factor)
+        write_rows(connection, ingredients_table, "ingredient_id", updates)
+
+
+def recipe_weights(connection, recipe_ids):
+    # total grams per recipe; unknown when any linked ingredient has no weight per unit
+    ingredient = ingredients_table.c
+    link = links_table.c
+    rows = connection.execute(
+        select([link.recipe_id,
+                db.func.sum(db.func.coalesce(link.quantity, 0) * ingredient.grams_per_unit),
+                db.func.count(link.ingredient_id) - db.func.count(ingredient.grams_per_unit)])
+        .select_from(links_table.join(ingredients_table, link.ingredient_id == ingredient.ingredient_id))
+        .where(link.recipe_id.in_(recipe_ids)).group_by(link.recipe_id))
+    return dict((recipe_id, weight if not missing else None) for recipe_id, weight, missing in rows)
+
+
+def serving_grams(size, unit):
+    if is_count(unit):
+        return np.nan
+    return to_grams(size or 0.0, unit) or np.nan
+
+
+def portion(size, unit):
+    # a count serving ("2 plates") means the recipe as described makes that many servings
+    if not is_count(unit):
+        return np.nan
+    return 1.0 / size if size and size > 0 else 1.0
+
+
+def normalize_recipes(connection, recipe_ids=None, batch_size=1000):
+    column = recipes_table.c
+    nutrients = [db.func.coalesce(column[f], 0) for f in NUTRIENT_FIELDS]
+    for chunk in batches(connection, column.recipe_id, recipe_ids, batch_size):
+        rows = connection.execute(select([column.recipe_id, column.serving_size, column.serving_unit] + nutrients)
+                                  .where(column.recipe_id.in_(chunk))).fetchall()
+        if not rows:
+            continue
+        weights = recipe_weights(connection, chunk)
+        weight = np.array([weights.get(r[0]) or np.nan for r in rows], dtype=np.float64)
+        serving = np.array([serving_grams(r[1], r[2]) for r in rows], dtype=np.float64)
+        portions = np.array([portion(r[1], r[2]) for r in rows], dtype=np.float64)
+        values = np.array([r[3:] for r in rows], dtype=np.float64).reshape(len(rows), -1)
+        per_100g = scaled(values, 100.0 / weight, "per_100g")
+        per_serving = scaled(values, np.where(np.isnan(serving), portions, serving / weight), "per_serving")
+        updates = []
+        for row, grams, serving_size, hundred, one in zip(rows, weight.tolist(), serving.tolist(), per_100g,
+                                                           per_serving):
+            update = dict(recipe_id=row[0], weight_grams=None if np.isnan(grams) else grams,
+                          serving_grams=None if np.isnan(serving_size) else serving_size)
+            update.update(hundred)
+            update.update(one)
+            updates.append(update)
+        write_rows(connection, recipes_table, "recipe_id", updates)
+
+
+def _changed(obj, fields):
+    return any(get_history(obj, field).has_changes() for field in fields)
+
+
+@event.listens_for(Session, "after_flush")
+def normalize_changes(session, flush_context):
+    # Recipe nutrient totals are normalized where nutrition writes them; this covers edits to the inputs
+    # themselves: an ingredient's unit or values, a recipe's serving size.
+    ingredients, reweigh, recipes = set(), set(), set()
+    for obj in session.new:
+        if isinstance(obj, Ingredients):
+            ingredients.add(obj.ingredient_id)
+        elif isinstance(obj, Recipes):
+            recipes.add(obj.recipe_id)
+    for obj in session.dirty:
+        if isinstance(obj, Ingredients) and _changed(obj, INGREDIENT_INPUTS):
+            ingredients.add(obj.ingredient_id)
+            if _changed(obj, UNIT_FIELDS):
+                reweigh.add(obj.ingredient_id)
+        elif isinstance(obj, Recipes) and _changed(obj, RECIPE_INPUTS):
+            recipes.add(obj.recipe_id)
+    if not ingredients and not recipes:
+        return
+    connection = session.connection()
+    if ingredients:
+        normalize_ingredients(connection, sorted(ingredients))
+    if reweigh:
+        # grams per unit feed every recipe weight that uses the ingredient
+        recipes.update(r for r, in session.execute(recipes_using(sorted(reweigh))))
+    if recipes:
+        normalize_recipes(connection, sorted(recipes))
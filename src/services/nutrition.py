@@ -0,0 +1,167 @@
+import numpy as np
+from sqlalchemy import bindparam, event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Ingredients, Recipes, RecipeIngredient, NUTRIENT_FIELDS
+from .normalization import normalize_recipes
+
+INGREDIENT_FIELDS = ("quantity",) + NUTRIENT_FIELDS
+recipes_table = Recipes.__table__
+
+
+def per_unit(quantity, values):
+    # Ingredient nutrients are stored for `Ingredients.quantity` units; a missing or zero
+    # reference quantity means the values are already per unit.
+    quantity = np.where(quantity > 0, quantity, 1.0)
+    return values / quantity[:, None]
+
+
+def ingredient_unit_matrix(session=None, recipe_ids=None):
+    session = session or db.session
+    columns = [Ingredients.ingredient_id, Ingredients.quantity] + [getattr(Ingredients, f) for f in NUTRIENT_FIELDS]
+    query = session.query(*[db.func.coalesce(c, 0) for c in columns])
+    if recipe_ids is not None:
+        used = session.query(RecipeIngredient.ingredient_id).filter(RecipeIngredient.recipe_id.in_(recipe_ids))
+        query = query.filter(Ingredients.ingredient_id.in_(used.subquery()))
+    data = np.array(query.order_by(Ingredients.ingredient_id).all(), dtype=np.float64).reshape(-1, len(columns))
+    return data[:, 0].astype(np.int64), per_unit(data[:, 1], data[:, 2:])
+
+
+def rollup_links(links, ingredient_ids, vectors_by_row):
+    # links is an (n, 3) array of recipe_id, ingredient_id, quantity
+    recipes, rows = np.unique(links[:, 0].astype(np.int64), return_inverse=True)
+    used, cols = np.unique(links[:, 1].astype(np.int64), return_inverse=True)
+    positions = np.searchsorted(ingredient_ids, used)
+    known = (positions < len(ingredient_ids)) & (ingredient_ids[np.minimum(positions, len(ingredient_ids) - 1)] == used)
+
+    # recipe x ingredient quantity matrix, restricted to the ingredients actually used
+    amounts = np.zeros((len(recipes), len(used)))
+    np.add.at(amounts, (rows, cols), links[:, 2])
+    amounts[:, ~known] = 0.0
+    vectors = np.zeros((len(used), vectors_by_row.shape[1]))
+    vectors[known] = vectors_by_row[positions[known]]
+    return recipes, amounts @ vectors, amounts.sum(axis=1)
+
+
+def fetch_links(session, column, ids):
+    rows = session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id,
+                         db.func.coalesce(RecipeIngredient.quantity, 0)).filter(column.in_(ids)).all()
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def rollup_batch(session, recipe_ids, ingredient_ids, unit_matrix):
+    recipe_ids = np.asarray(sorted(recipe_ids), dtype=np.int64)
+    totals = np.zeros((len(recipe_ids), len(NUTRIENT_FIELDS)))
+    quantities = np.zeros(len(recipe_ids))
+    links = fetch_links(session, RecipeIngredient.recipe_id, recipe_ids.tolist())
+    if len(links):
+        linked, linked_totals, linked_quantities = rollup_links(links, ingredient_ids, unit_matrix)
+        rows = np.searchsorted(recipe_ids, linked)
+        totals[rows] = linked_totals
+        quantities[rows] = linked_quantities
+    return recipe_ids, totals, quantities
+
+
+def write_recipe_totals(connection, recipe_ids, totals, quantities):
+    statement = recipes_table.update().where(recipes_table.c.recipe_id == bindparam("b_recipe_id")).values(
+        quantity=bindparam("b_quantity"), **dict((f, bindparam("b_" + f)) for f in NUTRIENT_FIELDS))
+    params = []
+    for recipe_id, vector, quantity in zip(recipe_ids.tolist(), totals.tolist(), quantities.tolist()):
+        row = dict(("b_" + f, v) for f, v in zip(NUTRIENT_FIELDS, vector))
+        row.update(b_recipe_id=recipe_id, b_quantity=quantity)
+        params.append(row)
+    if params:
+        connection.execute(statement, params)
+        normalize_recipes(connection, recipe_ids.tolist())
+
+
+def apply_recipe_deltas(connection, recipe_ids, deltas):
+    column = recipes_table.c
+    statement = recipes_table.update().where(column.recipe_id == bindparam("b_recipe_id")).values(
+        **dict((f, db.func.coalesce(column[f], 0) + bindparam("b_" + f)) for f in NUTRIENT_FIELDS))
+    params = []
+    for recipe_id, vector in zip(recipe_ids.tolist(), deltas.tolist()):
+        row = dict(("b_" + f, v) for f, v in zip(NUTRIENT_FIELDS, vector))
+        row["b_recipe_id"] = recipe_id
+        params.append(row)
+    if params:
+        connection.execute(statement, params)
+        normalize_recipes(connection, recipe_ids.tolist())
+
+
+def recompute_recipe_nutrients(recipe_ids=None, batch_size=1000, session=None):
+    session = session or db.session
+    if recipe_ids is None:
+        # recipes without ingredient links keep their hand-entered nutrients
+        recipe_ids = [r for r, in session.query(RecipeIngredient.recipe_id).distinct()
+                      .order_by(RecipeIngredient.recipe_id)]
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return 0
+
+    # small targeted recomputes only load the ingredients they reference
+    scoped = recipe_ids if len(recipe_ids) <= batch_size else None
+    ingredient_ids, unit_matrix = ingredient_unit_matrix(session, scoped)
+    connection = session.connection()
+    for start in range(0, len(recipe_ids), batch_size):
+        write_recipe_totals(connection, *rollup_batch(session, recipe_ids[start:start + batch_size], ingredient_ids,
+                                                      unit_matrix))
+    return len(recipe_ids)
+
+
+def _old_and_new(obj, fields):
+    old, new, complete = [], [], True
+    for field in fields:
+        history = get_history(obj, field)
+        value = getattr(obj, field) or 0.0
+        if history.has_changes() and not history.deleted:
+            # the previous value was never loaded, so no delta can be formed
+            complete = False
+        old.append((history.deleted[0] if history.deleted else value) or 0.0)
+        new.append(value)
+    return old, new, complete
+
+
+@event.listens_for(Session, "after_flush")
+def update_recipe_nutrients(session, flush_context):
+    changed, recompute = {}, set()
+
+    for obj in session.dirty:
+        if isinstance(obj, Ingredients) and session.is_modified(obj):
+            old, new, complete = _old_and_new(obj, INGREDIENT_FIELDS)
+            if old == new:
+                continue
+            if complete:
+                old, new = np.array([old]), np.array([new])
+                changed[obj.ingredient_id] = (per_unit(new[:, 0], new[:, 1:]) - per_unit(old[:, 0], old[:, 1:]))[0]
+            else:
+                recompute.update(r for r, in session.query(RecipeIngredient.recipe_id)
+                                 .filter_by(ingredient_id=obj.ingredient_id))
+        elif isinstance(obj, RecipeIngredient) and session.is_modified(obj):
+            # a link moved to another recipe also changes the recipe it left
+            recompute.update(get_history(obj, "recipe_id").deleted)
+            recompute.add(obj.recipe_id)
+
+    for obj in session.new:
+        if isinstance(obj, RecipeIngredient):
+            recompute.add(obj.recipe_id)
+    for obj in session.deleted:
+        if isinstance(obj, RecipeIngredient):
+            recompute.add(obj.recipe_id)
+    recompute.discard(None)
+
+    if changed:
+        ingredient_ids = np.array(sorted(changed), dtype=np.int64)
+        deltas = np.array([changed[i] for i in ingredient_ids.tolist()])
+        # recipe_ingredient.ingredient_id is indexed, so this only touches recipes using the edited ingredients
+        links = fetch_links(session, RecipeIngredient.ingredient_id, ingredient_ids.tolist())
+        if recompute:
+            links = links[~np.isin(links[:, 0].astype(np.int64), list(recompute))]
+        if len(links):
+            recipe_ids, recipe_deltas, _ = rollup_links(links, ingredient_ids, deltas)
+            apply_recipe_deltas(session.connection(), recipe_ids, recipe_deltas)
+
+    if recompute:
+        recompute_recipe_nutrients(sorted(recompute), session=session)
@@ -0,0 +1,233 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models.model import Ingredients, Recipes, RecipeIngredient, CatalogVersion, NUTRIENT_FIELDS, normalized
+from .nutrition import per_unit, rollup_links
+
+
+class ColumnarTable:
+    # One float64 matrix per table: column 0 holds the id (exact up to 2**53), the rest one column per field.
+    # Rows are sorted by id, so searchsorted is the id -> row offset index and no per-row objects exist.
+    __slots__ = ("fields", "data", "identity")
+
+    def __init__(self, fields, data, identity=None):
+        self.fields = fields
+        self.data = data
+        self.identity = identity
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def ids(self):
+        return self.data[:, 0]
+
+    @property
+    def values(self):
+        return self.data[:, 1:]
+
+    def offsets(self, ids):
+        # row offset per id, -1 where the id is unknown
+        ids = np.asarray(ids, dtype=np.float64)
+        positions = np.searchsorted(self.ids, ids)
+        clipped = np.minimum(positions, max(len(self) - 1, 0))
+        found = (positions < len(self)) & (self.ids[clipped] == ids) if len(self) else np.zeros(len(ids), bool)
+        return np.where(found, positions, -1)
+
+    def rows(self, ids):
+        # values for each id, zeros where the id is unknown
+        offsets = self.offsets(ids)
+        rows = np.zeros((len(offsets), len(self.fields)))
+        rows[offsets >= 0] = self.values[offsets[offsets >= 0]]
+        return rows
+
+    def get(self, id_):
+        offset = self.offsets([id_])[0]
+        if offset < 0:
+            return None
+        return dict(zip(self.fields, self.values[offset].tolist()))
+
+
+def ingredient_rows(session):
+    columns = [Ingredients.ingredient_id, Ingredients.quantity] + [getattr(Ingredients, f) for f in NUTRIENT_FIELDS]
+    data = np.array(session.query(*[db.func.coalesce(c, 0) for c in columns]).order_by(Ingredients.ingredient_id)
+                    .all(), dtype=np.float64).reshape(-1, len(columns))
+    # stored per unit, the form every rollup needs
+    return np.column_stack([data[:, 0], per_unit(data[:, 1], data[:, 2:])])
+
+
+def recipe_rows(session):
+    columns = [Recipes.recipe_id, Recipes.quantity] + [getattr(Recipes, f) for f in NUTRIENT_FIELDS]
+    return np.array(session.query(*[db.func.coalesce(c, 0) for c in columns]).order_by(Recipes.recipe_id).all(),
+                    dtype=np.float64).reshape(-1, len(columns))
+
+
+def serving_rows(session):
+    # only recipes whose serving could be weighed; the others are unknown ids (get() is None) rather than
+    # passing their whole-recipe totals off as one serving
+    serving = [getattr(Recipes, normalized(f, "per_serving")) for f in NUTRIENT_FIELDS]
+    columns = [Recipes.recipe_id] + [db.func.coalesce(c, 0) for c in serving]
+    return np.array(session.query(*columns).filter(serving[0].isnot(None)).order_by(Recipes.recipe_id).all(),
+                    dtype=np.float64).reshape(-1, len(columns))
+
+
+version_table = CatalogVersion.__table__
+
+TABLES = {
+    "ingredients": (NUTRIENT_FIELDS, ingredient_rows),
+    "recipes": (("quantity",) + NUTRIENT_FIELDS, recipe_rows),
+    "servings": (NUTRIENT_FIELDS, serving_rows),
+}
+
+
+class NutritionCatalog:
+    # Read-only columnar copy of ingredient and recipe nutrients. Each table lives in a .npy file that every
+    # worker maps read-only, so the pages are shared through the OS page cache instead of copied per process.
+    # Files are stamped with the catalog_version generation read before the rows; every commit touching nutrient
+    # data bumps it right after committing, in a transaction of its own so the row lock is held only for that one
+    # UPDATE rather than for the whole (possibly long) write. A file built from an older snapshot is never used
+    # once the bump is visible, even if it is written after another worker removed the old files; between the
+    # commit and the bump readers may still see the previous build.
+
+    def __init__(self):
+        self.directory = os.path.join(tempfile.gettempdir(), "restaurant_catalog")
+        self.ttl = 3600
+        self.prefix = "catalog"
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get("NUTRITION_CATALOG_DIR", self.directory)
+        self.ttl = app.config.get("NUTRITION_CATALOG_TTL", self.ttl)
+        # one set of files per database, so benchmarks and the app never read each other's catalog
+        self.prefix = hashlib.sha1(app.config["SQLALCHEMY_DATABASE_URI"].encode("utf-8")).hexdigest()[:12]
+        self.tables = {}
+
+    def path(self, name, generation):
+        return os.path.join(self.directory, "{}-{}-{}.npy".format(self.prefix, name, generation))
+
+    def generation(self, session):
+        # primary key read of a single row: the only database work on a warm read
+        return session.execute(select([version_table.c.generation]).where(version_table.c.id == 1)).scalar() or 0
+
+    def fresh_stat(self, name, generation):
+        # the ttl only bounds how long an unused build stays around
+        try:
+            stat = os.stat(self.path(name, generation))
+        except FileNotFoundError:
+            return None
+        return stat if time.time() - stat.st_mtime <= self.ttl else None
+
+    def table(self, name, session=None):
+        session = session or db.session
+        generation = self.generation(session)
+        stat = self.fresh_stat(name, generation)
+        if stat is None:
+            with self._lock:
+                generation = self.generation(session)
+                stat = self.fresh_stat(name, generation)
+                if stat is None:
+                    self.write(name, session, generation)
+                    stat = os.stat(self.path(name, generation))
+        current = self.tables.get(name)
+        identity = (generation, stat.st_ino, stat.st_mtime_ns)
+        if current is None or current.identity != identity:
+            data = np.load(self.path(name, generation), mmap_mode="r")
+            current = ColumnarTable(TABLES[name][0], data, identity)
+            self.tables[name] = current
+        return current
+
+    def write(self, name, session, generation):
+        # the rows are read after the generation, so they are at least as new as the stamp
+        os.makedirs(self.directory, exist_ok=True)
+        data = np.ascontiguousarray(TABLES[name][1](session))
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as output:
+            np.save(output, data)
+        # atomic on POSIX: workers mapping the old file keep their pages until they remap
+        os.replace(temporary, self.path(name, generation))
+        self.remove(name, below=generation)
+
+    def remove(self, name, below=None):
+        # a slower worker finishing an older build must not delete a newer one, hence only older generations
+        for path in glob.glob(self.path(name, "*")):
+            generation = path[:-len(".npy")].rsplit("-", 1)[-1]
+            if below is None or (generation.isdigit() and int(generation) < below):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def invalidate(self):
+        # only frees disk space: the generation stamp is what keeps stale files from being read
+        for name in TABLES:
+            self.remove(name)
+
+    @property
+    def ingredients(self):
+        return self.table("ingredients")
+
+    @property
+    def recipes(self):
+        return self.table("recipes")
+
+    @property
+    def servings(self):
+        return self.table("servings")
+
+    def rollup(self, links):
+        # links: (n, 3) recipe_id, ingredient_id, quantity -> (recipe ids, nutrient totals, quantities)
+        ingredients = self.ingredients
+        return rollup_links(np.asarray(links, dtype=np.float64).reshape(-1, 3), ingredients.ids, ingredients.values)
+
+
+nutrition_catalog = NutritionCatalog()
+
+
+def catalog_changed(session):
+    # for set-based writes too; remembers the engine the transaction writes to, the generation is bumped on commit
+    if "catalog_changed" not in session.info:
+        session.info["catalog_changed"] = session.connection(mapper=CatalogVersion.__mapper__).engine
+
+
+def bump_generation(engine):
+    with engine.begin() as connection:
+        connection.execute(version_table.update().where(version_table.c.id == 1)
+                           .values(generation=version_table.c.generation + 1))
+
+
+@event.listens_for(Session, "after_flush")
+def track_catalog_changes(session, flush_context):
+    # recipe totals follow ingredient and link edits through set-based updates, so any of the three counts
+    models = (Ingredients, Recipes, RecipeIngredient)
+    if any(isinstance(o, models) for o in list(session.new) + list(session.deleted)) or \
+            any(isinstance(o, models) and session.is_modified(o) for o in session.dirty):
+        catalog_changed(session)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_catalog(session):
+    engine = session.info.pop("catalog_changed", None)
+    if engine is not None:
+        try:
+            bump_generation(engine)
+        except Exception:
+            # the data is committed either way; old builds then only age out after NUTRITION_CATALOG_TTL
+            if has_app_context():
+                current_app.logger.exception("could not bump the nutrition catalog generation")
+        nutrition_catalog.invalidate()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_catalog_changes(session, previous_transaction):
+    session.info.pop("catalog_changed", None)
@@ -0,0 +1,139 @@
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Ingredients, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes
+
+recipes_table = Recipes.__table__
+menus_table = MenuCard.__table__
+links_table = RecipeIngredient.__table__
+ingredients_table = Ingredients.__table__
+entries_table = MenuCardRecipes.__table__
+
+
+def recipe_cost():
+    # sum(quantity x unit cost) over a recipe's links, correlated to the recipes row being updated
+    amount = db.func.coalesce(links_table.c.quantity, 0) * db.func.coalesce(ingredients_table.c.unit_cost, 0)
+    return select([db.func.coalesce(db.func.sum(amount), 0)]) \
+        .select_from(links_table.join(ingredients_table)) \
+        .where(links_table.c.recipe_id == recipes_table.c.recipe_id).as_scalar()
+
+
+def menu_total(column):
+    return select([db.func.coalesce(db.func.sum(db.func.coalesce(column, 0)), 0)]) \
+        .select_from(entries_table.join(recipes_table)) \
+        .where(entries_table.c.menu_id == menus_table.c.menu_id).as_scalar()
+
+
+def recipes_using(ingredient_ids):
+    return select([links_table.c.recipe_id]).where(links_table.c.ingredient_id.in_(ingredient_ids))
+
+
+def menus_serving(recipe_ids):
+    # recipe_ids may be a list or a select, so ingredient edits resolve their menus without a round trip
+    return select([entries_table.c.menu_id]).where(entries_table.c.recipe_id.in_(recipe_ids))
+
+
+def recompute_recipe_costs(connection, recipe_ids=None):
+    statement = recipes_table.update().values(cost=recipe_cost())
+    if recipe_ids is not None:
+        statement = statement.where(recipes_table.c.recipe_id.in_(recipe_ids))
+    connection.execute(statement)
+
+
+def recompute_menu_totals(connection, menu_ids=None):
+    statement = menus_table.update().values(cost=menu_total(recipes_table.c.cost),
+                                            price=menu_total(recipes_table.c.price))
+    if menu_ids is not None:
+        statement = statement.where(menus_table.c.menu_id.in_(menu_ids))
+    connection.execute(statement)
+
+
+def apply_cost_deltas(connection, deltas):
+    # deltas maps ingredient_id -> change in unit cost; each recipe moves by quantity x delta
+    column = recipes_table.c
+    used = select([db.func.sum(db.func.coalesce(links_table.c.quantity, 0))]).where(
+        (links_table.c.recipe_id == column.recipe_id) & (links_table.c.ingredient_id == bindparam("b_ingredient_id"))) \
+        .as_scalar()
+    statement = recipes_table.update().where(column.recipe_id.in_(
+        select([links_table.c.recipe_id]).where(links_table.c.ingredient_id == bindparam("b_ingredient_id")))) \
+        .values(cost=db.func.coalesce(column.cost, 0) + bindparam("b_delta") * used)
+    connection.execute(statement, [dict(b_ingredient_id=i, b_delta=d) for i, d in sorted(deltas.items())])
+
+
+def reprice_restaurant(restaurant_id, session=None):
+    session = session or db.session
+    connection = session.connection()
+    recipe_ids = select([recipes_table.c.recipe_id]).where(recipes_table.c.restaurant_id == restaurant_id)
+    recompute_recipe_costs(connection, recipe_ids)
+    recompute_menu_totals(connection, select([menus_table.c.menu_id]).where(
+        menus_table.c.restaurant_id == restaurant_id))
+
+
+def recompute_costs(session=None):
+    session = session or db.session
+    connection = session.connection()
+    recompute_recipe_costs(connection)
+    recompute_menu_totals(connection)
+
+
+def _changed(obj, field):
+    history = get_history(obj, field)
+    return history.has_changes() and (history.deleted or [None])[0] != getattr(obj, field)
+
+
+def _unit_cost_delta(obj):
+    history = get_history(obj, "unit_cost")
+    if not history.deleted:
+        # the previous value was never loaded, so no delta can be formed
+        return None
+    return (obj.unit_cost or 0.0) - (history.deleted[0] or 0.0)
+
+
+@event.listens_for(Session, "after_flush")
+def update_costs(session, flush_context):
+    deltas, ingredients, recipes, prices, menus = {}, set(), set(), set(), set()
+
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, Ingredients) and _changed(obj, "unit_cost"):
+            delta = _unit_cost_delta(obj)
+            if delta is None:
+                ingredients.add(obj.ingredient_id)
+            else:
+                deltas[obj.ingredient_id] = delta
+        elif isinstance(obj, RecipeIngredient):
+            # a link moved to another recipe also changes the recipe it left
+            recipes.update(get_history(obj, "recipe_id").deleted)
+            recipes.add(obj.recipe_id)
+        elif isinstance(obj, Recipes) and _changed(obj, "price"):
+            prices.add(obj.recipe_id)
+        elif isinstance(obj, MenuCardRecipes):
+            menus.update(get_history(obj, "menu_id").deleted)
+            menus.add(obj.menu_id)
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, RecipeIngredient):
+            recipes.add(obj.recipe_id)
+        elif isinstance(obj, MenuCardRecipes):
+            menus.add(obj.menu_id)
+    recipes.discard(None)
+    menus.discard(None)
+
+    if not (deltas or ingredients or recipes or prices or menus):
+        return
+    connection = session.connection()
+    if deltas:
+        apply_cost_deltas(connection, deltas)
+        # recipes whose links also changed in this flush are recomputed in full below
+        menus.update(menu_id for menu_id, in session.execute(menus_serving(recipes_using(sorted(deltas)))))
+    if ingredients:
+        recipes.update(recipe_id for recipe_id, in session.execute(recipes_using(sorted(ingredients))))
+    if recipes:
+        recompute_recipe_costs(connection, sorted(recipes))
+    if recipes or prices:
+        menus.update(menu_id for menu_id, in session.execute(menus_serving(sorted(recipes | prices))))
+    if menus:
+        recompute_menu_totals(connection, sorted(menus))
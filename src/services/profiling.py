@@ -0,0 +1,122 @@
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LITERALS = re.compile(r"'[^']*'|\b\d+\b")
+
+
+def normalize(statement):
+    # collapse literals so "WHERE id = 1" and "WHERE id = 2" count as the same statement
+    return " ".join(LITERALS.sub("?", statement).split())
+
+
+class EndpointStats:
+
+    def __init__(self, keep=5):
+        self.keep = keep
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+        self.repeated = Counter()
+        self.slowest = []
+
+    def add(self, queries, duplicates):
+        self.requests += 1
+        self.queries += len(queries)
+        self.db_time += sum(duration for duration, _ in queries)
+        self.max_queries = max(self.max_queries, len(queries))
+        self.n_plus_one += bool(duplicates)
+        # one count per request the statement was repeated in, which is what the perf page reports
+        self.repeated.update(duplicates.keys())
+        for item in queries:
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "avg_queries": self.queries / float(self.requests or 1),
+            "max_queries": self.max_queries,
+            "avg_db_ms": self.db_time * 1000 / (self.requests or 1),
+            "n_plus_one_requests": self.n_plus_one,
+            "repeated": self.repeated.most_common(self.keep),
+            "slowest": [(duration * 1000, statement) for duration, statement in sorted(self.slowest, reverse=True)],
+        }
+
+
+class QueryProfiler:
+    # Opt-in per-request SQL instrumentation; does nothing unless SQL_PROFILER_ENABLED is set.
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_ms = 100
+        self.duplicate_threshold = 3
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("SQL_PROFILER_ENABLED", False)
+        if not self.enabled:
+            return
+        self.slow_ms = app.config.get("SQL_PROFILER_SLOW_MS", self.slow_ms)
+        self.duplicate_threshold = app.config.get("SQL_PROFILER_DUPLICATE_THRESHOLD", self.duplicate_threshold)
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        if has_request_context() and "sql_queries" in g:
+            g.sql_queries.append((time.perf_counter() - started, statement))
+
+    def _start_request(self):
+        g.sql_queries = []
+        g.sql_request_start = time.perf_counter()
+
+    def _finish_request(self, response):
+        queries = g.pop("sql_queries", None)
+        if queries is None:
+            return response
+        total = time.perf_counter() - g.pop("sql_request_start")
+        db_time = sum(duration for duration, _ in queries)
+        counts = Counter(normalize(statement) for _, statement in queries)
+        duplicates = dict((s, n) for s, n in counts.items() if n >= self.duplicate_threshold)
+
+        response.headers.add("Server-Timing", 'db;dur={:.2f};desc="{} queries"'.format(db_time * 1000, len(queries)))
+        response.headers.add("Server-Timing", "app;dur={:.2f}".format(total * 1000))
+
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(queries, duplicates)
+        for duration, statement in queries:
+            if duration * 1000 >= self.slow_ms:
+                current_app.logger.warning("slow query on %s (%.1f ms): %s", endpoint, duration * 1000, statement)
+        return response
+
+    def report(self):
+        with self._lock:
+            rows = [(endpoint, stats.as_dict()) for endpoint, stats in self.endpoints.items()]
+        return sorted(rows, key=lambda row: row[1]["avg_db_ms"] * row[1]["requests"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
@@ -0,0 +1,189 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, request
+
+from .cache import LocalRedis
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+LIMIT = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+
+def parse_limits(value):
+    # "10/minute; 100/hour" or "5 per 30 seconds" -> [(10, 60), (100, 3600)]
+    limits = []
+    for part in (value or "").split(";"):
+        if not part.strip():
+            continue
+        match = LIMIT.match(part.lower())
+        if match is None:
+            raise ValueError("invalid rate limit {!r}".format(part))
+        count, multiple, unit = match.groups()
+        limits.append((int(count), int(multiple or 1) * PERIODS[unit]))
+    return limits
+
+
+class MemoryStore:
+    # Counters shared by every thread of one worker process. Each process limits on its own, so with N
+    # workers the effective limit is up to N times higher; use a Redis store to share counters.
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = self.clock()
+        with self._lock:
+            values = []
+            for key in keys:
+                entry = self._data.get(key)
+                values.append(entry[0] if entry is not None and entry[1] > now else 0)
+            return values
+
+    def incr(self, key, ttl):
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            value = entry[0] + 1 if entry is not None and entry[1] > now else 1
+            self._data[key] = (value, entry[1] if entry is not None and entry[1] > now else now + ttl)
+            self._data.move_to_end(key)
+            # oldest counters go first; an evicted counter only makes its client look less busy
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return value
+
+    def decr(self, key):
+        now = self.clock()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data[key] = (entry[0] - 1, entry[1])
+
+
+class RedisStore:
+    # any client with the redis-py interface: redis.Redis, or cache.LocalRedis in development
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_many(self, keys):
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def incr(self, key, ttl):
+        value, _ = self.client.pipeline().incr(key).expire(key, int(math.ceil(ttl))).execute()
+        return value
+
+    def decr(self, key):
+        self.client.incr(key, -1)
+
+
+def create_store(url):
+    if url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith("local-redis://"):
+        return RedisStore(LocalRedis())
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATELIMIT_STORAGE_URL {!r} needs the redis package".format(url))
+        return RedisStore(redis.Redis.from_url(url))
+    raise ValueError("unsupported RATELIMIT_STORAGE_URL {!r}".format(url))
+
+
+def remote_address():
+    return request.remote_addr or "unknown"
+
+
+def form_value(name):
+    # e.g. the username a login attempt targets, however many addresses the attempts come from
+    return lambda: (request.form.get(name) or "").strip().lower()
+
+
+def rejected(retry_after):
+    response = Response("Too many attempts, try again in {} seconds.\n".format(retry_after), status=429,
+                        mimetype="text/plain")
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+class RateLimiter:
+    # Sliding window counters: a window's count is the current fixed window plus the previous one weighted by
+    # how much of it still overlaps, which smooths the burst a fixed window allows at its boundary while
+    # costing two counters per limit. An attempt is counted first and then judged on the incremented value, so
+    # concurrent attempts (other threads, other workers on a shared store) cannot all pass on the same stale
+    # count; a rejected one is taken back out. It is decided before the view runs, so it costs no database query
+    # or password hash.
+
+    def __init__(self):
+        self.enabled = True
+        self.prefix = "rl"
+        self.store = MemoryStore()
+        self.clock = time.time
+        self._parsed = {}
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RATELIMIT_ENABLED", True)
+        self.prefix = app.config.get("RATELIMIT_KEY_PREFIX", self.prefix)
+        self.store = create_store(app.config.get("RATELIMIT_STORAGE_URL", "memory://"))
+        self._parsed = {}
+
+    def limits(self, config_key):
+        value = current_app.config.get(config_key, "")
+        if value not in self._parsed:
+            self._parsed[value] = parse_limits(value)
+        return self._parsed[value]
+
+    def hit(self, name, key, limits, now=None):
+        # counts one attempt against every limit; returns 0, or the seconds to wait when any limit is exhausted
+        now = self.clock() if now is None else now
+        counters = []
+        for count, period in limits:
+            window = int(now // period)
+            base = "{}:{}:{}:{}".format(self.prefix, name, period, key)
+            counters.append((count, period, window, "{}:{}".format(base, window), "{}:{}".format(base, window - 1)))
+        # kept for two windows: the current one and as the next window's previous
+        values = [self.store.incr(c[3], 2 * c[1]) for c in counters]
+        previous_values = self.store.get_many([c[4] for c in counters])
+        wait = 0
+        for (count, period, window, _, _), current, previous in zip(counters, values, previous_values):
+            elapsed = now - window * period
+            # `current` includes this attempt
+            if previous * (1 - elapsed / period) + current > count:
+                wait = max(wait, self.retry_after(count, period, elapsed, current - 1, previous))
+        if wait:
+            for counter in counters:
+                self.store.decr(counter[3])
+        return wait
+
+    @staticmethod
+    def retry_after(count, period, elapsed, current, previous):
+        if current + 1 > count or not previous:
+            # the current window alone is full; the next one starts with this as its weighted previous
+            return max(1, int(math.ceil(period - elapsed)))
+        # the previous window's weight has to fall far enough for one more attempt to fit
+        weight = (count - 1 - current) / float(previous)
+        return max(1, int(math.ceil((1 - weight) * period - elapsed)))
+
+    def limit(self, config_key, key_func=remote_address, methods=("POST",)):
+        # decorator; the limits come from app.config[config_key], e.g. "10/minute;100/hour"
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled and request.method in methods:
+                    key = key_func()
+                    limits = self.limits(config_key)
+                    if key and limits:
+                        wait = self.hit(config_key.lower(), key, limits)
+                        if wait:
+                            current_app.logger.warning("rate limited %s for %s (%s)", request.path, key, config_key)
+                            return rejected(wait)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,226 @@
+import json
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..models.model import Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes
+from .cache import TTLCache, LocalRedis, open_store
+
+JSON = "application/json"
+# rows the API renders; other tables never invalidate anything
+TAGGED = (Restaurant, Ingredients, Recipes, RecipeIngredient, MenuCard, MenuCardRecipes)
+# a row change that also changes another row through set-based updates or embedding: the link rows feed the recipe
+# totals and make up the menu's recipe list
+DERIVED = {RecipeIngredient: ("Recipes", "recipe_id"), MenuCardRecipes: ("MenuCard", "menu_id")}
+# past this many rows of one model a commit bumps the model's key instead of one version per row
+MAX_ROW_TAGS = 100
+
+
+def row_tags(model_name, row_id):
+    # the row itself and "any row of the model"
+    return {"{}:{}".format(model_name, row_id), "{}:*".format(model_name)}
+
+
+def collapse(keys):
+    # "Recipes:1" .. "Recipes:5000" -> "Recipes", which every entry depending on a Recipes row also reads
+    counts = {}
+    for key in keys:
+        name, _, row_id = key.partition(":")
+        if row_id and row_id != "*":
+            counts[name] = counts.get(name, 0) + 1
+    wide = set(name for name, count in counts.items() if count > MAX_ROW_TAGS)
+    if not wide:
+        return keys
+    return set(key for key in keys if key.partition(":")[0] not in wide) | wide
+
+
+def version_keys(tags):
+    # "Recipes:5" and "Recipes:*" also depend on "Recipes", which whole-table writes bump
+    keys = set(tags)
+    keys.update(tag.partition(":")[0] for tag in tags)
+    return sorted(keys)
+
+
+class CacheStats:
+    OUTCOMES = ("local", "shared", "miss", "bypass")
+
+    def __init__(self):
+        self.counts = dict((outcome, 0) for outcome in self.OUTCOMES)
+        self.seconds = dict((outcome, 0.0) for outcome in self.OUTCOMES)
+
+    def add(self, outcome, elapsed):
+        self.counts[outcome] += 1
+        self.seconds[outcome] += elapsed
+
+    def as_dict(self):
+        cacheable = self.counts["local"] + self.counts["shared"] + self.counts["miss"]
+        stats = {"requests": sum(self.counts.values()),
+                 "hit_rate": (self.counts["local"] + self.counts["shared"]) / float(cacheable or 1)}
+        for outcome in self.OUTCOMES:
+            stats[outcome] = self.counts[outcome]
+            stats[outcome + "_ms"] = self.seconds[outcome] * 1000 / (self.counts[outcome] or 1)
+        return stats
+
+
+class ResponseCache:
+    # Two-level cache for GET resources, keyed by endpoint, path and the parser's arguments. Level one is a
+    # per-worker LRU; level two an optional store shared by workers (RESPONSE_CACHE_URL). Entries carry the
+    # version of every tag they depend on ("Recipes:5", "Recipes:*"); a commit bumps the versions of the rows it
+    # changed, so a stale entry is simply never matched again. Versions live in the shared store when there is
+    # one, so an invalidation reaches every worker; without one they are per process and other workers only catch
+    # up after the TTL.
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 300
+        self.prefix = "rc"
+        self.local = TTLCache(maxsize=2048, ttl=self.ttl)
+        self.shared = None
+        self.versions = LocalRedis()
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RESPONSE_CACHE_ENABLED", False)
+        self.ttl = app.config.get("RESPONSE_CACHE_TTL", self.ttl)
+        self.prefix = app.config.get("RESPONSE_CACHE_KEY_PREFIX", self.prefix)
+        self.local = TTLCache(maxsize=app.config.get("RESPONSE_CACHE_SIZE", self.local.maxsize), ttl=self.ttl)
+        self.shared = open_store(app.config.get("RESPONSE_CACHE_URL"), "RESPONSE_CACHE_URL",
+                                 app.config.get("RESPONSE_CACHE_SHARED_SIZE", 50000))
+        self.versions = self.shared if self.shared is not None else LocalRedis()
+        self.reset()
+
+    def current(self, keys):
+        values = self.versions.mget(["{}:v:{}".format(self.prefix, key) for key in keys])
+        return tuple(int(value or 0) for value in values)
+
+    def invalidate(self, keys):
+        for key in sorted(keys):
+            self.versions.incr("{}:v:{}".format(self.prefix, key))
+
+    def lookup(self, key, versions):
+        entry = self.local.get(key)
+        if entry is not None and entry[0] == versions:
+            return "local", entry[1]
+        if self.shared is not None:
+            raw = self.shared.get("{}:r:{}".format(self.prefix, key))
+            if raw is not None:
+                header, _, body = raw.partition(b"\n")
+                if tuple(int(v) for v in header.split(b",") if v) == versions:
+                    self.local.set(key, (versions, body))
+                    return "shared", body
+        return "miss", None
+
+    def store(self, key, versions, body):
+        self.local.set(key, (versions, body))
+        if self.shared is not None:
+            header = ",".join(str(v) for v in versions).encode()
+            self.shared.set("{}:r:{}".format(self.prefix, key), header + b"\n" + body, ex=self.ttl or None)
+
+    def cached(self, *tags, parser=None):
+        # decorator for Resource.get; tags are formatted with the view arguments, e.g. "MenuCard:{menu_id}".
+        # With a parser only its arguments make up the key, so unknown query parameters cannot mint new entries
+        def decorator(view):
+            @wraps(view)
+            def wrapper(resource, *args, **kwargs):
+                if not self.enabled or request.method != "GET":
+                    return view(resource, *args, **kwargs)
+                started = time.perf_counter()
+                keys = version_keys([tag.format(**kwargs) for tag in tags])
+                # read before the view runs: a commit that lands meanwhile leaves this entry already outdated
+                versions = self.current(keys)
+                if parser is None:
+                    query = urlencode(sorted(request.args.items(multi=True)))
+                else:
+                    query = urlencode([(a.name, v) for a in sorted(parser.args, key=lambda a: a.name)
+                                       for v in request.args.getlist(a.name)])
+                key = "{}|{}?{}".format(request.endpoint, request.path, query)
+                outcome, body = self.lookup(key, versions)
+                if body is None:
+                    result = view(resource, *args, **kwargs)
+                    if not isinstance(result, (dict, list)):
+                        # responses, (body, status) tuples and errors go through untouched
+                        self.count(request.endpoint, "bypass", time.perf_counter() - started)
+                        return result
+                    body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+                    self.store(key, versions, body)
+                self.count(request.endpoint, outcome, time.perf_counter() - started)
+                response = Response(body, mimetype=JSON)
+                response.headers["X-Cache"] = outcome
+                return response
+            return wrapper
+        return decorator
+
+    def count(self, endpoint, outcome, elapsed):
+        with self._lock:
+            self.endpoints.setdefault(endpoint, CacheStats()).add(outcome, elapsed)
+
+    def report(self):
+        with self._lock:
+            rows = [(endpoint, stats.as_dict()) for endpoint, stats in self.endpoints.items()]
+        return sorted(rows, key=lambda row: row[1]["requests"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+response_cache = ResponseCache()
+
+
+def touch(session, model, ids=None):
+    # for set-based writes, which never reach after_flush; ids=None means any row of the table may have changed
+    if not response_cache.enabled:
+        return
+    keys = session.info.setdefault("response_tags", set())
+    if ids is None:
+        keys.add(model.__name__)
+    for row_id in ids or ():
+        keys.update(row_tags(model.__name__, row_id))
+
+
+def changed_values(obj, field):
+    history = get_history(obj, field)
+    return set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+
+
+@event.listens_for(Session, "after_flush")
+def collect_response_tags(session, flush_context):
+    if not response_cache.enabled:
+        return
+    keys = set()
+    changed = list(session.new) + list(session.deleted) + [o for o in session.dirty if session.is_modified(o)]
+    for obj in changed:
+        if not isinstance(obj, TAGGED):
+            continue
+        model = type(obj)
+        for row_id in model.__mapper__.primary_key_from_instance(obj):
+            keys.update(row_tags(model.__name__, row_id))
+        if model in DERIVED:
+            name, column = DERIVED[model]
+            for row_id in changed_values(obj, column):
+                keys.update(row_tags(name, row_id))
+        elif model is Ingredients and obj in session.dirty:
+            # nutrient edits are rolled up into every recipe using the ingredient through set-based updates
+            keys.add("Recipes")
+    if keys:
+        session.info.setdefault("response_tags", set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_responses(session):
+    keys = session.info.pop("response_tags", None)
+    if keys:
+        # one shared-store increment per key, so a large import or bulk edit bumps table keys instead
+        response_cache.invalidate(collapse(keys))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_response_tags(session, previous_transaction):
+    session.info.pop("response_tags", None)
@@ -0,0 +1,59 @@
+import random
+import time
+
+from flask import has_request_context, request, session as cookie_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+
+STICKY_KEY = "db_primary_until"
+REPLICA_PREFIX = "replica_"
+
+
+class RoutingSession(SignallingSession):
+    # Sends read-only API requests to a replica bind and everything else to the primary.
+    # A session that has flushed stays on the primary, and after a commit the client is pinned to
+    # the primary for DB_STICKY_SECONDS so it reads its own writes despite replication lag.
+
+    def replica_keys(self):
+        binds = self.app.config.get("SQLALCHEMY_BINDS") or {}
+        return sorted(key for key in binds if key.startswith(REPLICA_PREFIX))
+
+    def use_replica(self):
+        if self._flushing or self.info.get("wrote") or not has_request_context():
+            return False
+        if request.method not in ("GET", "HEAD"):
+            return False
+        if not request.path.startswith(tuple(self.app.config.get("DB_REPLICA_ROUTES", ()))):
+            return False
+        return cookie_session.get(STICKY_KEY, 0) <= time.time()
+
+    def get_bind(self, mapper=None, clause=None):
+        if mapper is not None and getattr(mapper.persist_selectable, "info", {}).get("bind_key") is not None:
+            return super(RoutingSession, self).get_bind(mapper, clause)
+        keys = self.replica_keys()
+        if keys and self.use_replica():
+            key = self.info.setdefault("replica", random.choice(keys))
+            return get_state(self.app).db.get_engine(self.app, bind=key)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def dispose_engines(self, app):
+        # pooled connections inherited from a parent process (gunicorn preload_app) must not be shared
+        for connector in get_state(app).connectors.values():
+            connector.get_engine().dispose()
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def mark_primary(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def pin_to_primary(session):
+    if session.info.get("wrote") and has_request_context():
+        cookie_session[STICKY_KEY] = time.time() + session.app.config.get("DB_STICKY_SECONDS", 0)
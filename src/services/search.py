@@ -0,0 +1,196 @@
+import bisect
+import re
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from ..extensions import db
+from ..models.model import Recipes, Ingredients, SEARCH_FIELDS, has_search_vector
+
+# ts_rank's default weights for labels A and B
+WEIGHTS = {"A": 1.0, "B": 0.4}
+# pg_trgm's default pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def tokens(value):
+    return WORD.findall((value or "").lower())
+
+
+def trigrams(word):
+    # padded the way pg_trgm pads words, so both backends agree on what counts as a typo
+    padded = "  {} ".format(word)
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class InvertedIndex:
+    # token -> {row id: weight}, plus a trigram index over the vocabulary for typo tolerance;
+    # used where the database has no tsvector/pg_trgm support (SQLite)
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = SEARCH_FIELDS[model]
+        self.postings = {}
+        self.vocabulary = []
+        self.grams = {}
+        self.stale = True
+        # bumped by every invalidation, so one landing while a build is reading is not lost
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self.generation += 1
+        self.stale = True
+
+    @property
+    def key(self):
+        return self.model.__mapper__.primary_key[0]
+
+    def build(self, rows, generation=None):
+        postings, grams = defaultdict(dict), defaultdict(set)
+        for row in rows:
+            row_id = row[0]
+            for (field, label), value in zip(self.fields, row[1:]):
+                weight = WEIGHTS[label]
+                for token in tokens(value):
+                    if postings[token].get(row_id, 0.0) < weight:
+                        postings[token][row_id] = weight
+        for token in postings:
+            for gram in trigrams(token):
+                grams[gram].add(token)
+        self.postings = dict(postings)
+        self.vocabulary = sorted(postings)
+        self.grams = dict(grams)
+        self.stale = generation is not None and generation != self.generation
+
+    def ensure(self, session):
+        if self.stale:
+            with self._lock:
+                if self.stale:
+                    generation = self.generation
+                    columns = [self.key] + [getattr(self.model, field) for field, _ in self.fields]
+                    self.build(session.query(*columns).all(), generation)
+        return self
+
+    def expand(self, word):
+        # (vocabulary token, match quality): exact 1.0, prefix 0.9, else trigram similarity
+        matches = {}
+        start = bisect.bisect_left(self.vocabulary, word)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(word):
+                break
+            matches[token] = 1.0 if token == word else 0.9
+        wanted = trigrams(word)
+        shared = Counter(token for gram in wanted for token in self.grams.get(gram, ()))
+        for token, count in shared.items():
+            if token not in matches:
+                score = count / float(len(wanted) + len(trigrams(token)) - count)
+                if score >= SIMILARITY_THRESHOLD:
+                    matches[token] = score
+        return matches
+
+    def search(self, term):
+        # every query word has to match (as in a tsquery joined with &); returns {row id: score}
+        scores = None
+        for word in tokens(term):
+            best = {}
+            for token, quality in self.expand(word).items():
+                for row_id, weight in self.postings[token].items():
+                    if best.get(row_id, 0.0) < weight * quality:
+                        best[row_id] = weight * quality
+            if scores is None:
+                scores = best
+            else:
+                scores = dict((row_id, score + best[row_id]) for row_id, score in scores.items() if row_id in best)
+            if not scores:
+                return {}
+        return scores or {}
+
+
+indexes = {Recipes: InvertedIndex(Recipes), Ingredients: InvertedIndex(Ingredients)}
+
+
+def is_postgresql(session, model):
+    # PostgreSQL before 12 has no search_vector column and uses the in-process index like SQLite
+    return has_search_vector(session.get_bind(model.__mapper__).dialect)
+
+
+def tsquery(term):
+    # prefix-match every word; WORD never matches tsquery syntax characters, so the string is safe
+    return " & ".join(word + ":*" for word in tokens(term))
+
+
+def pg_match(model, term):
+    table = model.__table__
+    vector = db.literal_column("{}.search_vector".format(table.name))
+    query = db.func.to_tsquery("simple", tsquery(term))
+    name = table.c.name
+    # both sides are served by a GIN index: search_vector directly, name through gin_trgm_ops
+    return vector.op("@@")(query) | name.op("%")(term), \
+        db.func.ts_rank(vector, query) + db.func.similarity(name, term)
+
+
+def _id_filter(model, ids):
+    # ids come from our own index, so they are safe to inline (see allergens._id_filter)
+    if not ids:
+        return text("1 = 0")
+    return text("{}.{} IN ({})".format(model.__tablename__, indexes[model].key.name,
+                                       ",".join(str(int(i)) for i in ids)))
+
+
+def search_filter(query, model, term, session=None):
+    if not tokens(term):
+        return query
+    session = session or query.session
+    if is_postgresql(session, model):
+        return query.filter(pg_match(model, term)[0])
+    return query.filter(_id_filter(model, indexes[model].ensure(session).search(term)))
+
+
+def search(model, term, limit=20, query=None):
+    # ranked [(row, score)]; `query` narrows the candidates, e.g. to one restaurant
+    query = query if query is not None else model.query
+    if not tokens(term):
+        return []
+    key = indexes[model].key
+    if is_postgresql(query.session, model):
+        match, rank = pg_match(model, term)
+        return query.add_columns(rank).filter(match).order_by(rank.desc(), key).limit(limit).all()
+
+    scores = indexes[model].ensure(query.session).search(term)
+    ranked = sorted(scores, key=lambda row_id: (-scores[row_id], row_id))
+    rows = []
+    # the candidate query may drop some ids, so fetch in limit-sized slices until the page is full
+    for start in range(0, len(ranked), limit):
+        page = ranked[start:start + limit]
+        found = dict((getattr(row, key.key), row) for row in query.filter(_id_filter(model, page)))
+        rows.extend((found[row_id], scores[row_id]) for row_id in page if row_id in found)
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+@event.listens_for(Session, "after_flush")
+def track_search_changes(session, flush_context):
+    changed = set(type(o) for o in list(session.new) + list(session.deleted) if type(o) in indexes)
+    for obj in session.dirty:
+        model = type(obj)
+        if model in indexes and any(get_history(obj, field).has_changes() for field, _ in SEARCH_FIELDS[model]):
+            changed.add(model)
+    if changed:
+        session.info.setdefault("search_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_search_indexes(session):
+    for model in session.info.pop("search_changed", ()):
+        indexes[model].invalidate()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_search_changes(session, previous_transaction):
+    session.info.pop("search_changed", None)
@@ -0,0 +1,72 @@
+MASS, VOLUME, COUNT = "mass", "volume", "count"
+
+# grams per unit for mass units, millilitres per unit for volume units
+UNITS = {
+    "mg": (MASS, 0.001),
+    "g": (MASS, 1.0),
+    "kg": (MASS, 1000.0),
+    "oz": (MASS, 28.349523125),
+    "lb": (MASS, 453.59237),
+    "ml": (VOLUME, 1.0),
+    "cl": (VOLUME, 10.0),
+    "dl": (VOLUME, 100.0),
+    "l": (VOLUME, 1000.0),
+    "tsp": (VOLUME, 4.92892159375),
+    "tbsp": (VOLUME, 14.78676478125),
+    "fl oz": (VOLUME, 29.5735295625),
+    "cup": (VOLUME, 240.0),
+    "piece": (COUNT, 1.0),
+    "slice": (COUNT, 1.0),
+    "serving": (COUNT, 1.0),
+    "portion": (COUNT, 1.0),
+    "plate": (COUNT, 1.0),
+    "bowl": (COUNT, 1.0),
+}
+ALIASES = {
+    "gm": "g", "gms": "g", "gr": "g", "gram": "g", "grams": "g", "gramme": "g", "grammes": "g",
+    "milligram": "mg", "milligrams": "mg", "kgs": "kg", "kilo": "kg", "kilogram": "kg", "kilograms": "kg",
+    "ounce": "oz", "ounces": "oz", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "millilitre": "ml", "millilitres": "ml", "milliliter": "ml", "milliliters": "ml",
+    "litre": "l", "litres": "l", "liter": "l", "liters": "l", "ltr": "l",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tablespoon": "tbsp", "tablespoons": "tbsp", "cups": "cup",
+    "floz": "fl oz", "fluid ounce": "fl oz", "fluid ounces": "fl oz",
+    "pc": "piece", "pcs": "piece", "pieces": "piece", "no": "piece", "nos": "piece", "unit": "piece",
+    "units": "piece", "slices": "slice", "servings": "serving", "portions": "portion", "plates": "plate",
+    "bowls": "bowl",
+}
+# liquids without a stated weight per unit are weighed as water
+DEFAULT_DENSITY = 1.0
+
+
+def canonical(unit):
+    # "Grams", "gms." and "g" all become "g"; unknown units are kept, lower-cased
+    name = " ".join((unit or "").lower().replace(".", " ").split())
+    return ALIASES.get(name, name)
+
+
+def lookup(unit):
+    # (dimension, factor) or None for units the registry does not know
+    return UNITS.get(canonical(unit))
+
+
+def grams_per_unit(unit, unit_weight=None):
+    # Mass units convert exactly. Volume and count units use the stated weight of one unit when there is
+    # one (a cup of flour is not a cup of water); volumes fall back to water, counts to unknown (None).
+    found = lookup(unit)
+    if found is not None and found[0] == MASS:
+        return found[1]
+    if unit_weight:
+        return float(unit_weight)
+    if found is not None and found[0] == VOLUME:
+        return found[1] * DEFAULT_DENSITY
+    return None
+
+
+def to_grams(amount, unit, unit_weight=None):
+    factor = grams_per_unit(unit, unit_weight)
+    return None if factor is None or amount is None else amount * factor
+
+
+def is_count(unit):
+    found = lookup(unit)
+    return found is None or found[0] == COUNT
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+# Config reads these when `src` is first imported; the audit writer thread would otherwise issue statements in
+# the middle of a counted request
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="restaurant_tests_"), "test.db")
+os.environ.setdefault("AUDIT_ENABLED", "false")
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+
+
+@pytest.fixture(scope="session")
+def app():
+    # one app per process: the Api and Admin singletons can only be bound once
+    from benchmarks.common import make_app
+    return make_app(fresh=False)
+
+
+@pytest.fixture
+def db(app):
+    from src.extensions import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
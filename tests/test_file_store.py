@@ -0,0 +1,30 @@
+import threading
+
+from src.services.cache import FileStore
+
+
+def test_incr_counts_from_zero(tmp_path):
+    store = FileStore(str(tmp_path))
+    assert store.incr("hits") == 1
+    assert store.incr("hits", 4) == 5
+    assert store.get("hits") == b"5"
+
+
+def test_concurrent_incr_loses_no_increment(tmp_path):
+    store = FileStore(str(tmp_path))
+    threads = [threading.Thread(target=lambda: [store.incr("hits") for _ in range(25)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert store.get("hits") == b"100"
+
+
+def test_sweep_evicts_oldest_expiring_entries_only(tmp_path):
+    store = FileStore(str(tmp_path), max_entries=2, sweep_every=1000)
+    store.incr("version")
+    for i in range(5):
+        store.set("entry-{}".format(i), b"body", ex=60)
+    store.sweep()
+    assert store.get("version") == b"1"
+    assert [store.get("entry-{}".format(i)) is not None for i in range(5)].count(True) == 2
@@ -0,0 +1,35 @@
+import pytest
+
+from benchmarks.common import count_queries, seed_catalog
+
+PAGE_SIZES = (1, 10, 50)
+
+
+@pytest.fixture
+def catalog(db):
+    # one restaurant so every menu can fill the largest page (50 recipes); 200 recipes stay inside a single
+    # selectin chunk
+    seed_catalog(recipes=200, ingredients=50, per_recipe=3, restaurants=1, menus=60, per_menu=max(PAGE_SIZES))
+
+
+def statement_counts(client, url):
+    # the first request pays for lazily built per-process state, which is not what is measured here
+    assert client.get(url).status_code == 200
+    counts = []
+    for limit in PAGE_SIZES:
+        with count_queries() as statements:
+            response = client.get(url, query_string={"limit": limit})
+        assert response.status_code == 200, response.data
+        assert len(response.get_json()["items"]) == limit
+        counts.append(len(statements))
+    return counts
+
+
+def test_menu_list_statements_do_not_grow_with_page_size(client, catalog):
+    counts = statement_counts(client, "/api/menu/")
+    assert counts == [counts[0]] * len(PAGE_SIZES), counts
+
+
+def test_menu_recipes_statements_do_not_grow_with_page_size(client, catalog):
+    counts = statement_counts(client, "/api/menu/1/recipes")
+    assert counts == [1] * len(PAGE_SIZES), counts
@@ -0,0 +1,16 @@
+from benchmarks.common import seed_catalog
+
+
+def test_generation_is_bumped_after_commit(db):
+    from src.models.model import Ingredients
+    from src.services.nutrition_catalog import nutrition_catalog
+
+    seed_catalog(recipes=5, ingredients=5, per_recipe=2)
+    before = nutrition_catalog.generation(db.session)
+    db.session.commit()
+    Ingredients.query.first().calories = 123.0
+    db.session.flush()
+    # the writing transaction never touches catalog_version, so it holds no lock other writers queue behind
+    assert nutrition_catalog.generation(db.session) == before
+    db.session.commit()
+    assert nutrition_catalog.generation(db.session) == before + 1
@@ -0,0 +1,13 @@
+from src.models.model import Recipes
+from src.services.search import InvertedIndex
+
+
+def test_invalidation_during_build_keeps_index_stale():
+    index = InvertedIndex(Recipes)
+    generation = index.generation
+    # a commit lands after the rows were read but before the build finishes
+    index.invalidate()
+    index.build([(1, "Pad thai", "Thai", "Main")], generation)
+    assert index.stale
+    index.build([(1, "Pad thai", "Thai", "Main")], index.generation)
+    assert not index.stale
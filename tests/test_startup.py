@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = os.path.join(ROOT, "src", "services")
+ROLES = ("all", "api", "admin", "cli")
+
+# a cold interpreter per role: imports that only some roles make would otherwise leak in from earlier tests
+BOOT = "import json, sys; from src import create_app; create_app(); print(json.dumps(sorted(sys.modules)))"
+
+
+def listener_modules():
+    names = []
+    for filename in sorted(os.listdir(SERVICES)):
+        if filename.endswith(".py"):
+            with open(os.path.join(SERVICES, filename), encoding="utf-8") as handle:
+                if "listens_for(Session" in handle.read():
+                    names.append("src.services." + filename[:-3])
+    return names
+
+
+def test_roles_match_the_app():
+    from src import ROLES as app_roles
+    assert tuple(app_roles) == ROLES
+
+
+@pytest.mark.parametrize("role", ROLES)
+def test_role_boots_with_every_listener(role):
+    env = dict(os.environ, APP_ROLE=role, DATABASE_URL="sqlite://")
+    process = subprocess.run([sys.executable, "-c", BOOT], cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    assert process.returncode == 0, process.stderr
+    loaded = set(json.loads(process.stdout.strip().splitlines()[-1]))
+    missing = [name for name in listener_modules() if name not in loaded]
+    assert not missing, "register_listeners() does not load {}".format(", ".join(missing))
+
+
+def test_default_role_serves_admin_and_api(client, db):
+    # the wsgi entry point boots APP_ROLE=all, so both halves have to come up in one app
+    assert client.get("/admin/login/").status_code == 200
+    assert client.get("/api/menu/").status_code == 200